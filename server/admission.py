@@ -0,0 +1,88 @@
+import math
+import os
+import threading
+import time
+
+# endpoint class -> (requests running at once, requests allowed to wait for a slot), per process.
+# /work/single stays cheap and plentiful, whole files and scrapes share a couple of slots between them
+LIMIT_DEFAULTS = {
+    "single": (8, 16),
+    "batch": (2, 4),
+    "heavy": (2, 2),
+}
+
+def limits_from_env():
+    """{endpoint class: (concurrency, queue size)}, each overridable with e.g. HEAVY_CONCURRENCY / HEAVY_QUEUE"""
+    limits = {}
+    for name, (concurrency, queue_size) in LIMIT_DEFAULTS.items():
+        limits[name] = (
+            int(os.environ.get(f"{name.upper()}_CONCURRENCY", concurrency)),
+            int(os.environ.get(f"{name.upper()}_QUEUE", queue_size)),
+        )
+    return limits
+
+class Overloaded(Exception):
+    """No slot for a request. status is 429 when the queue was already full, 503 when it waited too long"""
+
+    def __init__(self, name, status, retry_after):
+        super().__init__(f"{name} requests are at capacity")
+        self.name = name
+        self.status = status
+        self.retry_after = retry_after
+
+class ConcurrencyLimiter:
+    """Lets `limit` requests of one endpoint class run at once and up to `queue_size` more wait
+    (at most `queue_timeout` seconds) for a slot. Anything past that is turned away straight away
+    with Overloaded instead of piling up behind the running ones.
+
+    Limits are per process, under gunicorn every worker has its own set.
+    """
+
+    MAX_RETRY_AFTER = 120
+
+    def __init__(self, name, limit, queue_size, queue_timeout=30.0):
+        self.name = name
+        self.limit = limit
+        self.queue_size = queue_size
+        self.queue_timeout = queue_timeout
+        self.running = 0
+        self.waiting = 0
+        self._cond = threading.Condition()
+        # smoothed request duration, what the Retry-After estimate is based on
+        self._avg_seconds = None
+
+    def acquire(self):
+        """Take a slot (waiting for one if needed), returns the start time to hand back to release()"""
+        with self._cond:
+            if self.running >= self.limit or self.waiting:
+                if self.waiting >= self.queue_size:
+                    raise Overloaded(self.name, 429, self.retry_after())
+                self.waiting += 1
+                deadline = time.monotonic() + self.queue_timeout
+                try:
+                    while self.running >= self.limit:
+                        remaining = deadline - time.monotonic()
+                        if remaining <= 0:
+                            raise Overloaded(self.name, 503, self.retry_after())
+                        self._cond.wait(remaining)
+                finally:
+                    self.waiting -= 1
+            self.running += 1
+        return time.perf_counter()
+
+    def release(self, started):
+        seconds = time.perf_counter() - started
+        with self._cond:
+            self.running -= 1
+            self._avg_seconds = seconds if self._avg_seconds is None else 0.8 * self._avg_seconds + 0.2 * seconds
+            self._cond.notify()
+
+    def retry_after(self):
+        # about how long until everything queued now has had its turn, whole seconds
+        avg_seconds = self._avg_seconds if self._avg_seconds is not None else 1.0
+        seconds = math.ceil(avg_seconds * (self.waiting + 1) / max(self.limit, 1))
+        return max(1, min(self.MAX_RETRY_AFTER, seconds))
+
+    def stats(self):
+        with self._cond:
+            return {"limit": self.limit, "running": self.running, "waiting": self.waiting, "queue_size": self.queue_size}
@@ -0,0 +1,186 @@
+import re
+from collections import Counter
+
+# compound scores live in [-1, 1], the histogram splits that into equal buckets
+HISTOGRAM_BINS = 10
+
+_LEADING_WORDS = {"the", "a", "an", "this", "that", "these", "those", "my", "our", "your", "its", "their"}
+_WHITESPACE = re.compile(r"\s+")
+
+# words _singular must leave alone: same in singular and plural, plural-only, or singular but ending
+# like a plural ("lens" isn't one "len")
+_INVARIANT = {
+    "series", "species", "news", "means", "lens", "glasses", "sunglasses", "jeans", "pants", "trousers",
+    "shorts", "leggings", "scissors", "pliers", "tongs", "goggles", "headquarters", "clothes", "electronics",
+    "physics", "graphics", "mathematics", "thanks", "savings", "earnings",
+}
+# -ies plurals of -ie nouns, the rule below would make them "movy"
+_IE_NOUNS = {
+    "movie", "cookie", "hoodie", "zombie", "rookie", "selfie", "smoothie", "calorie", "brownie", "pixie",
+    "lingerie", "goalie", "veggie", "freebie", "genie", "boogie", "auntie", "sweetie", "newbie", "birdie",
+}
+# common plurals the suffix rules get wrong
+_IRREGULAR = {
+    "children": "child", "men": "man", "women": "woman", "feet": "foot", "teeth": "tooth",
+    "mice": "mouse", "geese": "goose", "knives": "knife", "leaves": "leaf", "shelves": "shelf", "wives": "wife",
+    "lenses": "lens", "buses": "bus", "gases": "gas", "bonuses": "bonus", "viruses": "virus", "statuses": "status",
+}
+
+_lemma_lookup = None
+
+def _lemma_table():
+    # spaCy's English lemma lookup table when spacy-lookups-data is installed (pip install spacy-lookups-data),
+    # otherwise an empty dict and the rules below do all the work
+    global _lemma_lookup
+    if _lemma_lookup is None:
+        try:
+            from spacy.lookups import load_lookups
+            _lemma_lookup = load_lookups("en", ["lemma_lookup"]).get_table("lemma_lookup")
+        except (ImportError, ValueError):
+            _lemma_lookup = {}
+    return _lemma_lookup
+
+def _singular(word):
+    if word in _INVARIANT:
+        return word
+    if word in _IRREGULAR:
+        return _IRREGULAR[word]
+    if len(word) <= 3 or word.endswith(("ss", "us", "is")):
+        return word
+    if not word.endswith("s"):
+        return word
+    # the lookup also has verbs and adjectives in it, only plural-looking words go through it
+    lemma = _lemma_table().get(word)
+    if lemma:
+        return lemma
+    if word.endswith("ies") and len(word) > 4:
+        return word[:-1] if word[:-1] in _IE_NOUNS else word[:-3] + "y"
+    if word.endswith("aches") and not word.endswith(("eaches", "oaches")):
+        # headaches, caches, moustaches (beaches, coaches and peaches are the -ches rule)
+        return word[:-1]
+    if word.endswith(("ches", "shes", "xes", "zzes", "sses")):
+        return word[:-2]
+    return word[:-1]
+
+def normalize_aspect(aspect):
+    """Merge case/plural/determiner variants: "The Batteries" and "battery" both become "battery".
+
+    The slim pipeline doesn't run spaCy's lemmatizer (and results only carry the text), so this is
+    a small stand-in that only touches the head (last) word: spaCy's lemma lookup table when it's
+    installed, otherwise suffix rules with exception lists for the words they'd break.
+    """
+    words = _WHITESPACE.sub(" ", aspect.strip().lower()).split(" ")
+    while len(words) > 1 and words[0] in _LEADING_WORDS:
+        words = words[1:]
+    words[-1] = _singular(words[-1])
+    return " ".join(words)
+
+def _score_bin(score):
+    return min(int((score + 1) / 2 * HISTOGRAM_BINS), HISTOGRAM_BINS - 1)
+
+class _AspectStats:
+    __slots__ = ("mentions", "score_sum", "sentiments", "histogram", "opinions", "variants")
+
+    def __init__(self):
+        self.mentions = 0
+        self.score_sum = 0.0
+        self.sentiments = Counter()
+        self.histogram = [0] * HISTOGRAM_BINS
+        self.opinions = Counter()
+        self.variants = Counter()
+
+class AspectAggregator:
+    """Running per-aspect counts, mean score, score distribution and top opinions over a dataset.
+
+    Memory is bounded: once more than max_aspects aspects (or max_opinions opinions per aspect) are
+    tracked, the rarest ones are dropped, so counts for the long tail are approximate. Aggregators
+    can be merged, which is how the per-batch results from process_dataset workers get combined.
+    """
+
+    def __init__(self, max_aspects=5000, max_opinions=20):
+        self.max_aspects = max_aspects
+        self.max_opinions = max_opinions
+        self.reviews = 0
+        self.reviews_with_aspects = 0
+        self.aspects = {}
+
+    def add(self, results):
+        """Fold in one review's extract_aspects output"""
+        self.reviews += 1
+        if results:
+            self.reviews_with_aspects += 1
+        for item in results:
+            key = normalize_aspect(item["aspect"])
+            stats = self.aspects.get(key)
+            if stats is None:
+                stats = self.aspects[key] = _AspectStats()
+            score = float(item["score"])
+            stats.mentions += 1
+            stats.score_sum += score
+            stats.sentiments[item["sentiment"]] += 1
+            stats.histogram[_score_bin(score)] += 1
+            if item["opinion"] != "N/A":
+                stats.opinions[item["opinion"]] += 1
+            stats.variants[item["aspect"]] += 1
+            self._trim_counter(stats.opinions, self.max_opinions)
+            self._trim_counter(stats.variants, 5)
+        self._trim_aspects()
+
+    def merge(self, other):
+        self.reviews += other.reviews
+        self.reviews_with_aspects += other.reviews_with_aspects
+        for key, theirs in other.aspects.items():
+            ours = self.aspects.get(key)
+            if ours is None:
+                ours = self.aspects[key] = _AspectStats()
+            ours.mentions += theirs.mentions
+            ours.score_sum += theirs.score_sum
+            ours.sentiments.update(theirs.sentiments)
+            ours.histogram = [a + b for a, b in zip(ours.histogram, theirs.histogram)]
+            ours.opinions.update(theirs.opinions)
+            ours.variants.update(theirs.variants)
+            self._trim_counter(ours.opinions, self.max_opinions)
+            self._trim_counter(ours.variants, 5)
+        self._trim_aspects()
+        return self
+
+    @staticmethod
+    def _trim_counter(counter, limit):
+        # let it grow to twice the limit before pruning, so we aren't sorting on every update
+        if len(counter) > limit * 2:
+            for key, _ in counter.most_common()[limit:]:
+                del counter[key]
+
+    def _trim_aspects(self):
+        if len(self.aspects) > self.max_aspects * 2:
+            keep = sorted(self.aspects.items(), key=lambda kv: kv[1].mentions, reverse=True)[:self.max_aspects]
+            self.aspects = dict(keep)
+
+    def summary(self, top_n=20, min_mentions=3):
+        rows = []
+        for key, stats in self.aspects.items():
+            rows.append({
+                "aspect": key,
+                "mentions": stats.mentions,
+                "mean_score": round(stats.score_sum / stats.mentions, 4),
+                "positive": stats.sentiments.get("Positive", 0),
+                "negative": stats.sentiments.get("Negative", 0),
+                "neutral": stats.sentiments.get("Neutral", 0),
+                "score_histogram": list(stats.histogram),
+                "top_opinions": [{"opinion": o, "count": c} for o, c in stats.opinions.most_common(5)],
+                "variants": [v for v, _ in stats.variants.most_common()],
+            })
+        rows.sort(key=lambda row: row["mentions"], reverse=True)
+
+        frequent = [row for row in rows if row["mentions"] >= min_mentions]
+        most_praised = sorted(frequent, key=lambda row: (row["positive"], row["mean_score"]), reverse=True)
+        most_complained = sorted(frequent, key=lambda row: (row["negative"], -row["mean_score"]), reverse=True)
+        return {
+            "reviews": self.reviews,
+            "reviews_with_aspects": self.reviews_with_aspects,
+            "aspects_tracked": len(self.aspects),
+            "histogram_bins": HISTOGRAM_BINS,
+            "most_praised": [row["aspect"] for row in most_praised[:top_n] if row["positive"]],
+            "most_complained": [row["aspect"] for row in most_complained[:top_n] if row["negative"]],
+            "aspects": rows[:top_n * 10],
+        }
@@ -2,24 +2,345 @@
 # python3 -m spacy download en_core_web_sm
 
 import spacy
+from spacy.tokens import Doc
 from vaderSentiment.vaderSentiment import SentimentIntensityAnalyzer
 import pandas as pd
 import json
+import os
 import re
+import sys
+import threading
+import time
+import gc
+import contextlib
+import itertools
+import multiprocessing
+from collections import deque, OrderedDict
+from result_cache import ResultCache
+from columnar import ColumnarWriter, OUTPUT_FORMATS
+from aggregate import AspectAggregator
+from aspect_rules import AspectRuleEngine, load_rules, rules_fingerprint
+from incremental import PreviousResults, content_hash, key_values
+from sentiment import SENTIMENT_BACKENDS, make_backend
+from docstore import DocStore, StaleDocs, docs_path
+import metrics
 
-try:
-    nlp = spacy.load("en_core_web_sm")
-except OSError:
-    print("spaCy model 'en_core_web_sm' not found.")
-    print("Please run: python -m spacy download en_core_web_sm")
-    exit()
+MODEL_NAME = "en_core_web_sm"
+
+# extract_aspects only looks at POS tags, dependency labels, sentence boundaries and noun_chunks,
+# so "slim" drops the components it never reads (attribute_ruler stays, it maps tags to POS)
+PIPELINE_PROFILES = {
+    "slim": ["ner", "lemmatizer"],
+    "full": [],
+}
+PIPELINE_PROFILE = os.environ.get("SPACY_PIPELINE_PROFILE", "slim")
+
+# the model is loaded on first use instead of at import, see get_nlp()
+_nlp = None
+model_load_seconds = None
+
+def get_nlp():
+    """Load the spaCy model once (lazily) and return the shared instance"""
+    global _nlp, model_load_seconds
+    if _nlp is None:
+        if PIPELINE_PROFILE not in PIPELINE_PROFILES:
+            raise ValueError(f"Unknown pipeline profile '{PIPELINE_PROFILE}', expected one of {list(PIPELINE_PROFILES)}")
+        start_time = time.perf_counter()
+        try:
+            _nlp = spacy.load(MODEL_NAME, exclude=PIPELINE_PROFILES[PIPELINE_PROFILE])
+        except OSError:
+            print(f"spaCy model '{MODEL_NAME}' not found.")
+            print(f"Please run: python -m spacy download {MODEL_NAME}")
+            raise
+        model_load_seconds = time.perf_counter() - start_time
+        print(f"Loaded '{MODEL_NAME}' ({PIPELINE_PROFILE} profile: {', '.join(_nlp.pipe_names)}) in {model_load_seconds:.2f}s")
+    return _nlp
+
+def _load_shared():
+    nlp = get_nlp()
+    get_rule_engine()
+    get_sentiment_backend()
+    return nlp
+
+_gc_frozen = False
+
+def preload():
+    """Load the model at startup, before any forking, so workers share it copy-on-write"""
+    global _gc_frozen
+    nlp = _load_shared()
+    # move everything loaded so far out of the gc's reach, otherwise the collector touching
+    # refcounts/headers in the children un-shares the pages again. Only once: whatever is alive at
+    # a later call (request garbage included) would never be collected again
+    if not _gc_frozen:
+        gc.freeze()
+        _gc_frozen = True
+    return nlp
+
+def pipeline_info():
+    """Which model/components produced the results, recorded next to the outputs"""
+    nlp = get_nlp()
+    return {
+        "model": MODEL_NAME,
+        "model_version": nlp.meta.get("version"),
+        "spacy_version": spacy.__version__,
+        "profile": PIPELINE_PROFILE,
+        "components": list(nlp.pipe_names),
+        "long_review_chars": LONG_REVIEW_CHARS,
+        "sentiment_backend": SENTIMENT_BACKEND,
+        "load_seconds": round(model_load_seconds, 3) if model_load_seconds is not None else None,
+    }
+
+# aspect/opinion patterns live in a rule file compiled into a DependencyMatcher, see aspect_rules.py.
+# ASPECT_ENGINE=legacy switches back to the original token walk (same results, kept for comparison)
+ASPECT_RULES_PATH = os.environ.get('ASPECT_RULES_PATH', os.path.join(os.path.dirname(os.path.abspath(__file__)), 'aspect_rules.json'))
+ASPECT_ENGINE = os.environ.get('ASPECT_ENGINE', 'rules')
+_rule_engine = None
+
+def get_rule_engine():
+    """Compile the aspect rules against the model's vocab once and return the shared engine"""
+    global _rule_engine
+    if _rule_engine is None:
+        _rule_engine = AspectRuleEngine(get_nlp().vocab, load_rules(ASPECT_RULES_PATH))
+        print(f"Compiled {len(_rule_engine.rule_names)} aspect rules from {ASPECT_RULES_PATH}")
+    return _rule_engine
+
+# the default scores each sentence with SentimentIntensityAnalyzer. SENTIMENT_BACKEND=vectorized scores a whole
+# batch of sentences at once from spaCy's tokens, faster but only close to VADER, not the same (see sentiment.py)
+SENTIMENT_BACKEND = os.environ.get('SENTIMENT_BACKEND', 'vader')
+if SENTIMENT_BACKEND not in SENTIMENT_BACKENDS:
+    raise ValueError(f"Unknown SENTIMENT_BACKEND '{SENTIMENT_BACKEND}', expected one of {SENTIMENT_BACKENDS}")
+_sentiment_backend = None
+
+def get_sentiment_backend():
+    global _sentiment_backend
+    if _sentiment_backend is None:
+        _sentiment_backend = make_backend(SENTIMENT_BACKEND, analyzer)
+    return _sentiment_backend
+
+# bump this whenever extract_aspects or the scoring changes, so cached results from the old logic aren't served
+EXTRACTION_VERSION = 2
+
+# analyzed reviews are cached on disk across requests, set RESULT_CACHE_PATH to an empty string to turn it off
+RESULT_CACHE_PATH = os.environ.get('RESULT_CACHE_PATH', os.path.join('cache', 'results.db'))
+RESULT_CACHE_MAX_BYTES = int(os.environ.get('RESULT_CACHE_MAX_BYTES', 512 * 1024 * 1024))
+_result_cache = None
+_cache_version = None
+
+def get_result_cache():
+    global _result_cache
+    if _result_cache is None and RESULT_CACHE_PATH:
+        _result_cache = ResultCache(RESULT_CACHE_PATH, max_bytes=RESULT_CACHE_MAX_BYTES)
+    return _result_cache
+
+def cache_version():
+    """Everything that changes the output for a given text, part of every result cache key"""
+    global _cache_version
+    if _cache_version is None:
+        # read from the installed package so a fully cached request never has to load the model
+        model_version = spacy.util.get_package_version(MODEL_NAME) or get_nlp().meta.get("version")
+        rules = rules_fingerprint(ASPECT_RULES_PATH) if ASPECT_ENGINE == 'rules' else ASPECT_ENGINE
+        _cache_version = (f"{MODEL_NAME}-{model_version}-{PIPELINE_PROFILE}-x{EXTRACTION_VERSION}-{rules}-{SENTIMENT_BACKEND}"
+                          f"-w{LONG_REVIEW_CHARS}")
+    return _cache_version
 
 analyzer = SentimentIntensityAnalyzer()
 
-def extract_aspects(doc):
+class ProcessingCancelled(Exception):
+    """Raised from a progress callback to stop process_dataset between batches"""
+
+class MissingColumnError(ValueError):
+    """The input CSV has no column by that name (the review or key column)"""
+
+    def __init__(self, column):
+        super().__init__(f"Column '{column}' not found.")
+        self.column = column
+
+class SentenceScoreCache:
+    """Bounded LRU of compound scores, keyed on whitespace-normalized sentence text"""
+
+    # rough per-entry cost on top of the key string (dict slot, float, linked list node)
+    ENTRY_OVERHEAD_BYTES = 120
+
+    def __init__(self, max_entries=100_000, max_bytes=32 * 1024 * 1024):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self._scores = OrderedDict()
+        self._bytes = 0
+        # request threads, job threads and gthread workers all share one cache
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def compound(self, span, stats=None):
+        scores, counts = self.score_many([span])
+        add_score_counts(stats, counts)
+        return scores[0]
+
+    def score_many(self, spans, texts=None):
+        """Compound score per spaCy span, everything that isn't cached goes to the sentiment backend in one call.
+
+        Returns (scores, counts), counts being this call's own {"hits", "misses", "seconds"}. seconds is
+        the time spent inside the sentiment backend, reported as its own stage.
+        """
+        if texts is None:
+            texts = [span.text for span in spans]
+        scores = [None] * len(texts)
+        missing = {}
+        hits = 0
+        with self._lock:
+            for i, text in enumerate(texts):
+                # scoring splits on whitespace, so collapsing it doesn't change the score
+                key = " ".join(text.split())
+                score = self._scores.get(key)
+                if score is not None:
+                    self._scores.move_to_end(key)
+                    hits += 1
+                    scores[i] = score
+                elif key in missing:
+                    # repeated within the call, scored once
+                    hits += 1
+                    missing[key].append(i)
+                else:
+                    missing[key] = [i]
+            self.hits += hits
+            self.misses += len(missing)
+        counts = {"hits": hits, "misses": len(missing), "seconds": 0.0}
+        if not missing:
+            return scores, counts
+
+        # scored outside the lock, another thread missing the same sentence meanwhile just scores it too
+        start = time.perf_counter()
+        first_rows = [rows[0] for rows in missing.values()]
+        new_scores = get_sentiment_backend().score([spans[i] for i in first_rows], [texts[i] for i in first_rows])
+        counts["seconds"] = time.perf_counter() - start
+        for rows, score in zip(missing.values(), new_scores):
+            for i in rows:
+                scores[i] = score
+        with self._lock:
+            for key, score in zip(missing, new_scores):
+                if key not in self._scores:
+                    self._bytes += sys.getsizeof(key) + self.ENTRY_OVERHEAD_BYTES
+                self._scores[key] = score
+            while self._scores and (len(self._scores) > self.max_entries or self._bytes > self.max_bytes):
+                old_key, _ = self._scores.popitem(last=False)
+                self._bytes -= sys.getsizeof(old_key) + self.ENTRY_OVERHEAD_BYTES
+        return scores, counts
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+                "entries": len(self._scores),
+                "bytes": self._bytes,
+            }
+
+    def clear(self):
+        with self._lock:
+            self._scores.clear()
+            self._bytes = 0
+            self.hits = 0
+            self.misses = 0
+
+def add_score_counts(stats, counts):
+    """Add one score_many call's counts into a caller's stats dict (if it keeps one)"""
+    if stats is not None:
+        for name, value in counts.items():
+            stats[name] = stats.get(name, 0) + value
+
+# shared by everything in this process, so boilerplate sentences ("Love it!") are only scored once per run.
+# each process_dataset worker gets its own copy
+score_cache = SentenceScoreCache(
+    max_entries=int(os.environ.get('SCORE_CACHE_MAX_ENTRIES', 100_000)),
+    max_bytes=int(os.environ.get('SCORE_CACHE_MAX_BYTES', 32 * 1024 * 1024)),
+)
+
+# stats, when given, gets the sentence scoring's hits/misses/seconds added to it (see SentenceScoreCache.score_many)
+def extract_aspects(doc, stats=None):
+    return extract_aspects_many([doc], stats)[0]
+
+def extract_aspects_many(docs, stats=None):
+    """extract_aspects for a list of docs, the rule engine matches the whole batch in one go"""
+    docs = list(docs)
+    if ASPECT_ENGINE == 'legacy':
+        return [extract_aspects_legacy(doc, stats) for doc in docs]
+    all_matches = get_rule_engine().match_many(docs)
+
+    # every sentence with a hit in it, or the whole review when nothing matched, scored in one go
+    spans = []
+    for doc, matches in zip(docs, all_matches):
+        if matches:
+            sentences = dict.fromkeys((sent_start, sent_end) for _, _, sent_start, sent_end in matches)
+            spans.extend(doc[sent_start:sent_end] for sent_start, sent_end in sentences)
+        else:
+            spans.append(doc[:])
+    texts = [span.text for span in spans]
+    span_scores, counts = score_cache.score_many(spans, texts)
+    add_score_counts(stats, counts)
+    scores = zip(spans, texts, span_scores)
+
+    results = []
+    for doc, matches in zip(docs, all_matches):
+        if not matches:
+            _, _, compound = next(scores)
+            general = general_aspect(doc, compound)
+            results.append([general] if general else [])
+            continue
+        sentence_scores = {}
+        for _, _, sent_start, _ in matches:
+            if sent_start not in sentence_scores:
+                _, sentence, compound = next(scores)
+                sentence_scores[sent_start] = (sentence, compound)
+        results.append(_aspect_results(matches, sentence_scores))
+    return results
+
+def _aspect_results(matches, sentence_scores):
+    # hits are (aspect, opinion, context, sentiment, score) tuples, only turned into dicts on the way out
+    hits = []
+    for aspect, opinion, sent_start, _ in matches:
+        sentence, compound = sentence_scores[sent_start]
+        hits.append((aspect, opinion, sentence, get_sentiment_label(compound), compound))
+
+    # same sentence text twice in a review gives the same hit, keep the first
+    return [
+        {"aspect": aspect, "opinion": opinion, "context": context, "sentiment": sentiment, "score": score}
+        for aspect, opinion, context, sentiment, score in dict.fromkeys(hits)
+    ]
+
+def general_aspect(doc, compound=None, stats=None):
+    """Whole-review fallback when no pattern matched: the subject/object noun chunk (or "general") with the review's score"""
+    sentence_text = doc.text
+    if compound is None:
+        compound = score_cache.compound(doc[:], stats)
+    if compound == 0:
+        return None
+    main_aspect = "general"
+    for chunk in doc.noun_chunks:
+        if chunk.root.dep_ in ('nsubj', 'dobj'):
+            main_aspect = chunk.text.lower()
+            break
+    return {
+        "aspect": main_aspect,
+        "opinion": "N/A",
+        "context": sentence_text,
+        "sentiment": get_sentiment_label(compound),
+        "score": compound
+    }
+
+def extract_aspects_legacy(doc, stats=None):
+    """The original hand-written token walk, the rule engine must give the same results"""
     results = []
     processed_token_indices = set()
 
+    # every sentence is scored at most once per document, even when it holds several aspects
+    sentence_scores = {}
+    def sentence_score(sent):
+        if sent.start not in sentence_scores:
+            sentence_scores[sent.start] = score_cache.compound(sent, stats)
+        return sentence_scores[sent.start]
+
     # Iterate through all tokens to find primary patterns
     for token in doc:
         # Skip if this token has already been part of a found aspect/opinion
@@ -31,16 +352,17 @@ def extract_aspects(doc):
             aspect = token.head
             opinion = token
             
-            sentence = token.sent.text
-            vs = analyzer.polarity_scores(sentence)
-            sentiment = get_sentiment_label(vs['compound'])
+            sent = token.sent
+            sentence = sent.text
+            compound = sentence_score(sent)
+            sentiment = get_sentiment_label(compound)
             
             results.append({
                 "aspect": aspect.text.lower(), 
                 "opinion": opinion.text.lower(), 
                 "context": sentence,
                 "sentiment": sentiment, 
-                "score": vs['compound']
+                "score": compound
             })
             processed_token_indices.add(aspect.i)
             processed_token_indices.add(opinion.i)
@@ -51,16 +373,17 @@ def extract_aspects(doc):
             for child in token.head.children:
                 if child.dep_ == 'acomp':
                     opinion = child
-                    sentence = token.sent.text
-                    vs = analyzer.polarity_scores(sentence)
-                    sentiment = get_sentiment_label(vs['compound'])
+                    sent = token.sent
+                    sentence = sent.text
+                    compound = sentence_score(sent)
+                    sentiment = get_sentiment_label(compound)
                     
                     results.append({
                         "aspect": aspect.text.lower(), 
                         "opinion": opinion.text.lower(), 
                         "context": sentence,
                         "sentiment": sentiment, 
-                        "score": vs['compound']
+                        "score": compound
                     })
                     processed_token_indices.add(aspect.i)
                     processed_token_indices.add(opinion.i)
@@ -74,29 +397,14 @@ def extract_aspects(doc):
                                 "opinion": conj_opinion.text.lower(),
                                 "context": sentence,
                                 "sentiment": sentiment,
-                                "score": vs['compound']
+                                "score": compound
                             })
                             processed_token_indices.add(conj_opinion.i)
 
     if not results:
-        sentence_text = doc.text
-        vs = analyzer.polarity_scores(sentence_text)
-        
-        if vs['compound'] != 0:
-            sentiment = get_sentiment_label(vs['compound'])
-            main_aspect = "general"
-            for chunk in doc.noun_chunks:
-                if chunk.root.dep_ in ('nsubj', 'dobj'):
-                    main_aspect = chunk.text.lower()
-                    break 
-            
-            results.append({
-                "aspect": main_aspect, 
-                "opinion": "N/A",
-                "context": sentence_text,
-                "sentiment": sentiment, 
-                "score": vs['compound']
-            })
+        general = general_aspect(doc, stats=stats)
+        if general:
+            results.append(general)
 
     # Final step to remove any exact duplicates
     final_results = [dict(t) for t in {tuple(d.items()) for d in results}]
@@ -114,42 +422,621 @@ def clean_text(text):
     text = re.sub(r'([.!?])([A-Za-z])', r'\1 \2', text)
     return text
 
-def process_dataset(input_csv_path, output_csv_path, review_column_name='review', batch_size=500):
-    print(f"Starting dataset processing from '{input_csv_path}'...")
+# nlp.pipe batches are sized by characters instead of rows: at most PIPE_CHAR_BUDGET characters (and batch_size
+# texts) per batch, with the texts sorted by length so one-liners and essays don't end up in the same batch.
+# A review longer than LONG_REVIEW_CHARS is parsed in sentence windows of about that size and the window docs
+# are joined back into one doc, so the parser never sees huge texts (or hits nlp.max_length) and memory stays flat
+PIPE_CHAR_BUDGET = int(os.environ.get('PIPE_CHAR_BUDGET', 100_000))
+LONG_REVIEW_CHARS = int(os.environ.get('LONG_REVIEW_CHARS', 5_000))
+_SENTENCE_END = re.compile(r'(?<=[.!?])\s+')
+
+def sentence_windows(text, max_chars=LONG_REVIEW_CHARS):
+    """Cut text at sentence ends into pieces of at most max_chars, joined back together they give text again"""
+    windows = []
+    start = previous_end = 0
+    for end in [match.end() for match in _SENTENCE_END.finditer(text)] + [len(text)]:
+        if end - start > max_chars and previous_end > start:
+            windows.append(text[start:previous_end])
+            start = previous_end
+        previous_end = end
+    windows.append(text[start:])
+
+    # a "sentence" still over the limit (no punctuation in it) is cut at whitespace, or anywhere as a last resort
+    pieces = []
+    for window in windows:
+        while len(window) > max_chars:
+            cut = max(window.rfind(' ', 0, max_chars), window.rfind('\n', 0, max_chars)) + 1 or max_chars
+            pieces.append(window[:cut])
+            window = window[cut:]
+        pieces.append(window)
+    return [piece for piece in pieces if piece]
+
+def _char_batches(order, pieces, batch_size):
+    batch, chars = [], 0
+    for i in order:
+        size = len(pieces[i][1])
+        if batch and (chars + size > PIPE_CHAR_BUDGET or len(batch) >= batch_size):
+            yield batch
+            batch, chars = [], 0
+        batch.append(i)
+        chars += size
+    if batch:
+        yield batch
+
+def parse_many(texts, batch_size=500, stats=None):
+    """Parse texts with length-aware batching and long-review windows, returns one doc per text in the same order.
+    stats (a dict) gets the number of reviews that were split added to stats["long_reviews"]"""
+    nlp = get_nlp()
+    # (text position, piece of its text)
+    pieces = []
+    for i, text in enumerate(texts):
+        if len(text) > LONG_REVIEW_CHARS:
+            pieces.extend((i, window) for window in sentence_windows(text))
+            if stats is not None:
+                stats["long_reviews"] = stats.get("long_reviews", 0) + 1
+        else:
+            pieces.append((i, text))
+
+    parsed = [None] * len(pieces)
+    order = sorted(range(len(pieces)), key=lambda i: len(pieces[i][1]))
+    for batch in _char_batches(order, pieces, batch_size):
+        for i, doc in zip(batch, nlp.pipe([pieces[i][1] for i in batch], batch_size=len(batch))):
+            parsed[i] = doc
+
+    parts = [[] for _ in texts]
+    for (i, _), doc in zip(pieces, parsed):
+        parts[i].append(doc)
+    # the windows keep their whitespace, so the joined doc has exactly the original text
+    return [docs[0] if len(docs) == 1 else Doc.from_docs(docs, ensure_whitespace=False) for docs in parts]
+
+# parses + extracts one batch of reviews, returns the json strings for the output column.
+# kept at module level so the process pool can pickle it
+# with aggregate=True the batch also comes back summarized as an AspectAggregator, so the
+# per-aspect counting happens in the workers and the main process only merges
+# previous (a PreviousResults) copies unchanged rows from an earlier output, row_keys are their key column values
+# with a doc_store every row is parsed (cached results are still used) and the docs are saved as shard number `shard`
+def _analyze_batch(reviews, batch_size=500, aggregate=False, previous=None, row_keys=None, doc_store=None, shard=None):
+    # this may run in a pool worker, so stage times go back to the parent in batch_stats
+    timer = metrics.StageTimer()
+    with timer.stage("clean_text"):
+        cleaned_reviews = [clean_text(review) for review in reviews]
+    results = [None] * len(cleaned_reviews)
+
+    reused = {}
+    if previous is not None:
+        with timer.stage("previous_lookup"):
+            hashes = [content_hash(text) for text in cleaned_reviews]
+            reused = previous.lookup(row_keys or [None] * len(hashes), hashes)
+        for i, value in reused.items():
+            results[i] = value
+    pending = [i for i in range(len(cleaned_reviews)) if i not in reused]
+
+    cache = get_result_cache()
+    keys = None
+    cached = {}
+    if cache is not None and pending:
+        with timer.stage("result_cache"):
+            version = cache_version()
+            keys = {i: ResultCache.make_key(cleaned_reviews[i], version) for i in pending}
+            cached = cache.get_many(set(keys.values()))
+
+    # whatever isn't cached gets parsed, repeats inside the batch only once
+    to_parse = {}
+    cache_hits = 0
+    for i in pending:
+        text = cleaned_reviews[i]
+        if keys is not None and keys[i] in cached:
+            results[i] = cached[keys[i]]
+            cache_hits += 1
+        else:
+            to_parse.setdefault(text, []).append(i)
+
+    parsed = {}
+    parse_stats = {}
+    score_stats = {}
+    if doc_store is not None:
+        with timer.stage("spacy_parse"):
+            texts = list(dict.fromkeys(cleaned_reviews))
+            parsed = dict(zip(texts, parse_many(texts, batch_size, parse_stats)))
+        with timer.stage("doc_store_write"):
+            doc_store.write_shard(shard, [parsed[text] for text in cleaned_reviews])
+
+    if to_parse:
+        if parsed:
+            docs = [parsed[text] for text in to_parse]
+        else:
+            with timer.stage("spacy_parse"):
+                docs = parse_many(list(to_parse), batch_size, parse_stats)
+        with timer.stage("extract_aspects"):
+            new_entries = {}
+            for rows, aspects in zip(to_parse.values(), extract_aspects_many(docs, score_stats)):
+                value = json.dumps(aspects)
+                for i in rows:
+                    results[i] = value
+                if keys is not None:
+                    new_entries[keys[rows[0]]] = value
+        if cache is not None:
+            with timer.stage("result_cache"):
+                cache.put_many(new_entries)
+
+    batch_summary = _batch_summary(results, timer) if aggregate else None
+    _split_scoring_time(timer, score_stats)
+    batch_stats = {
+        "score_cache_hits": score_stats.get("hits", 0),
+        "score_cache_misses": score_stats.get("misses", 0),
+        "result_cache_hits": cache_hits,
+        "result_cache_misses": len(pending) - cache_hits,
+        "reused_rows": len(reused),
+        "long_reviews": parse_stats.get("long_reviews", 0),
+        "stages": timer.seconds,
+    }
+    return results, batch_stats, batch_summary
+
+# re-extract mode: the batch's docs come from a saved shard instead of the parser. The result cache and
+# previous outputs are left alone, the whole point is re-running changed extraction/scoring on every row
+def _reextract_batch(reviews, batch_size, aggregate, doc_store, shard):
+    score_stats = {}
+    timer = metrics.StageTimer()
+    with timer.stage("clean_text"):
+        cleaned_reviews = [clean_text(review) for review in reviews]
+    with timer.stage("doc_store_read"):
+        docs = doc_store.read_shard(shard, get_nlp().vocab)
+    if len(docs) != len(cleaned_reviews) or any(doc.text != text for doc, text in zip(docs, cleaned_reviews)):
+        raise StaleDocs(f"Shard {shard} in '{doc_store.directory}' doesn't match the input rows")
+
+    with timer.stage("extract_aspects"):
+        unique = {}
+        for doc, text in zip(docs, cleaned_reviews):
+            unique.setdefault(text, doc)
+        values = dict(zip(unique, (json.dumps(aspects) for aspects in extract_aspects_many(unique.values(), score_stats))))
+        results = [values[text] for text in cleaned_reviews]
+
+    batch_summary = _batch_summary(results, timer) if aggregate else None
+    _split_scoring_time(timer, score_stats)
+    batch_stats = {
+        "score_cache_hits": score_stats.get("hits", 0),
+        "score_cache_misses": score_stats.get("misses", 0),
+        "stages": timer.seconds,
+    }
+    return results, batch_stats, batch_summary
+
+def _batch_summary(results, timer):
+    with timer.stage("aggregate"):
+        batch_summary = AspectAggregator()
+        for result in results:
+            batch_summary.add(json.loads(result))
+    return batch_summary
+
+def _split_scoring_time(timer, score_stats):
+    # sentiment scoring runs inside extract_aspects, count it once as its own stage
+    scoring_seconds = score_stats.get("seconds", 0.0)
+    if "extract_aspects" in timer.seconds:
+        timer.seconds["extract_aspects"] -= scoring_seconds
+        timer.seconds["sentiment"] = scoring_seconds
+
+def _merge_stats(totals, batch_stats):
+    for key, value in batch_stats.items():
+        if key == "stages":
+            stages = totals.setdefault("stages", {})
+            for stage, seconds in value.items():
+                stages[stage] = stages.get(stage, 0.0) + seconds
+        else:
+            totals[key] = totals.get(key, 0) + value
+
+def _record_batch_metrics(batch_stats, rows):
+    """Push one batch's counters and worker stage times into the process metrics (and the current request/job)"""
+    metrics.record_stages(batch_stats.get("stages", {}))
+    metrics.count("rows_total", rows)
+    metrics.count("batches_total")
+    for name in ("result_cache_hits", "result_cache_misses", "score_cache_hits", "score_cache_misses", "reused_rows", "long_reviews"):
+        metrics.count(f"{name}_total", batch_stats.get(name, 0))
+
+def _timed_chunks(chunk_iterator):
+    # pandas parses the CSV lazily, one chunk per next()
+    while True:
+        with metrics.span("csv_parse"):
+            chunk = next(chunk_iterator, None)
+        if chunk is None:
+            return
+        yield chunk
+
+def _batch_call(chunk, shard, review_column_name, batch_size, aggregate, previous, key_column, doc_store, reextract):
+    """The function and arguments that analyze one chunk"""
+    if review_column_name not in chunk.columns:
+        raise MissingColumnError(review_column_name)
+    if key_column is not None and key_column not in chunk.columns:
+        raise MissingColumnError(key_column)
+    reviews = chunk[review_column_name].fillna('').astype(str).tolist()
+    if reextract:
+        return _reextract_batch, (reviews, batch_size, aggregate, doc_store, shard)
+    row_keys = key_values(chunk[key_column]) if key_column is not None else None
+    return _analyze_batch, (reviews, batch_size, aggregate, previous, row_keys, doc_store, shard)
+
+# doc_store saves every batch's docs as a shard (numbered from first_shard), or with reextract=True reads them back
+def _iter_analyzed_batches(chunk_iterator, review_column_name, batch_size, n_workers, aggregate=False, previous=None,
+                           key_column=None, doc_store=None, reextract=False, first_shard=0):
+    """Yield (chunk, (results, batch_stats, batch_summary)) pairs in input order, with at most a few batches in flight"""
+    settings = (review_column_name, batch_size, aggregate, previous, key_column, doc_store, reextract)
+    if n_workers <= 1:
+        for shard, chunk in enumerate(chunk_iterator, first_shard):
+            function, args = _batch_call(chunk, shard, *settings)
+            yield chunk, function(*args)
+        return
+
+    pool = _worker_pool
+    if pool is None and threading.current_thread() is not threading.main_thread():
+        # forking while other threads hold locks (stdout, metrics) can deadlock the children, a server
+        # has to fork its pool up front with start_worker_pool()
+        print(f"No worker pool was started, analyzing in this process instead of {n_workers} workers.")
+        yield from _iter_analyzed_batches(chunk_iterator, review_column_name, batch_size, 1, aggregate, previous,
+                                          key_column, doc_store, reextract, first_shard)
+        return
+    max_in_flight = n_workers * 2
+
+    with contextlib.ExitStack() as stack:
+        if pool is None:
+            # a script on its main thread, a pool just for this run is fine
+            pool = stack.enter_context(_fork_pool(n_workers))
+        pending = deque()
+        for shard, chunk in enumerate(chunk_iterator, first_shard):
+            function, args = _batch_call(chunk, shard, *settings)
+            pending.append((chunk, pool.apply_async(function, args)))
+
+            # hand back finished batches straight away (keeps time-to-first-row low for streaming),
+            # and only read more of the file once the oldest batch is back, so memory stays bounded
+            while pending and (len(pending) >= max_in_flight or pending[0][1].ready()):
+                done_chunk, result = pending.popleft()
+                yield done_chunk, result.get()
+
+        while pending:
+            done_chunk, result = pending.popleft()
+            yield done_chunk, result.get()
+
+def _fork_pool(n_workers):
+    # fork shares the already loaded model with the workers, spawn would load it again in each one
+    _load_shared()
+    methods = multiprocessing.get_all_start_methods()
+    ctx = multiprocessing.get_context('fork' if 'fork' in methods else None)
+    return ctx.Pool(n_workers)
+
+# the server's process_dataset workers, forked once at startup and shared by every request and job
+_worker_pool = None
+
+def start_worker_pool(n_workers):
+    """Fork the pool process_dataset fans batches out to. Call it at startup, while the process has no
+    other threads yet (gunicorn's post_worker_init, or before app.run). A run that's cancelled or fails
+    leaves its last few batches finishing in the pool, their results are dropped"""
+    global _worker_pool
+    if _worker_pool is None and n_workers > 1:
+        _worker_pool = _fork_pool(n_workers)
+        print(f"Started {n_workers} analysis worker processes")
+    return _worker_pool
+
+def analyze_csv_stream(csv_source, review_column_name='review', batch_size=500, n_workers=1):
+    """Yield each processed chunk as soon as its batch is done. csv_source can be a path or any file object"""
+    chunk_iterator = _timed_chunks(pd.read_csv(csv_source, chunksize=batch_size, on_bad_lines='skip'))
+    for chunk, (analysis_results, batch_stats, _) in _iter_analyzed_batches(chunk_iterator, review_column_name, batch_size, n_workers):
+        _record_batch_metrics(batch_stats, len(chunk))
+        chunk['aspect_sentiments'] = analysis_results
+        yield chunk
+
+# progress_callback(batches_done, rows_done) is called after every written batch,
+# it can raise ProcessingCancelled to stop the run.
+# output_format 'parquet' / 'arrow' writes typed columns plus an exploded aspects table (see columnar.py).
+# with aggregate=True a per-aspect summary of the whole dataset is written to <output>.summary.json
+# csv output from a csv file is checkpointed after every batch (<output>.ckpt.json), resume=True picks a
+# crashed or interrupted run up from its last checkpoint instead of starting over.
+# previous_output_path makes the run incremental: rows unchanged since that output (matched on key_column,
+# or on the review text when there's no key column) are copied over instead of analyzed again
+# save_docs=True keeps the parsed docs next to the output (<output>.docs, see docstore.py). A later run over the same
+# input with reextract_from=<that output> reads them back and only redoes extraction and scoring, no parsing
+def process_dataset(input_csv_path, output_csv_path, review_column_name='review', batch_size=500, n_workers=1,
+                    progress_callback=None, output_format='csv', aggregate=True, resume=False,
+                    previous_output_path=None, key_column=None, save_docs=False, reextract_from=None):
+    # input_csv_path can also be an open file / buffer (e.g. cached scrape results)
+    source_name = input_csv_path if isinstance(input_csv_path, (str, os.PathLike)) else "in-memory CSV"
+    print(f"Starting dataset processing from '{source_name}' with {n_workers} worker(s)...")
+    if output_format not in OUTPUT_FORMATS:
+        print(f"Error: Unknown output format '{output_format}', expected one of {OUTPUT_FORMATS}.")
+        return None
+    start_time = time.perf_counter()
+    total_rows = 0
+    batches_done = 0
+    resumed_rows = 0
+    counters = {}
+    columnar_writer = None
+    output_file = None
+    checkpoint_settings = None
+    aggregator = AspectAggregator() if aggregate else None
     try:
-        chunk_iterator = pd.read_csv(input_csv_path, chunksize=batch_size, on_bad_lines='skip')
-        
-        is_first_batch = True
-        
-        for i, chunk in enumerate(chunk_iterator):
-            print(f"Processing batch {i+1}...")
-            
-            if review_column_name not in chunk.columns:
-                print(f"Error: Column '{review_column_name}' not found.")
-                return
+        doc_store = None
+        docs_source = None
+        reextract = reextract_from is not None
+        if reextract or save_docs:
+            if not isinstance(input_csv_path, (str, os.PathLike)):
+                raise StaleDocs("Parsed docs can only be saved and read back for an input file")
+            docs_source = _docs_source(input_csv_path, review_column_name, batch_size)
+        if reextract:
+            doc_store = DocStore(docs_path(reextract_from))
+            manifest = doc_store.check(_docs_pipeline(), docs_source)
+            print(f"Re-extracting from {manifest['rows']} parsed docs in '{doc_store.directory}', nothing gets parsed.")
+            if previous_output_path is not None:
+                print("Re-extracting analyzes every row again, ignoring the previous output.")
+                previous_output_path = None
+        elif save_docs:
+            doc_store = DocStore(docs_path(output_csv_path))
 
-            reviews = chunk[review_column_name].fillna('').astype(str)
-            
-            cleaned_reviews = [clean_text(review) for review in reviews]
-            
-            docs = nlp.pipe(cleaned_reviews)
-            
-            analysis_results = [json.dumps(extract_aspects(doc)) for doc in docs]
+        previous = None
+        if previous_output_path is not None:
+            previous = load_previous_results(previous_output_path, review_column_name, key_column)
+
+        checkpoint = None
+        if output_format == 'csv' and isinstance(input_csv_path, (str, os.PathLike)):
+            checkpoint_settings = _checkpoint_settings(input_csv_path, review_column_name, batch_size, previous, key_column,
+                                                       doc_store, reextract)
+            if resume:
+                checkpoint = _resumable_checkpoint(output_csv_path, checkpoint_settings)
+        elif resume:
+            print("Resuming only works for csv output from a csv file, starting over.")
+
+        chunk_iterator = _timed_chunks(pd.read_csv(input_csv_path, chunksize=batch_size, on_bad_lines='skip'))
+        if checkpoint is not None:
+            # chunking is deterministic, so skipping the committed batches lands on the first unwritten row
+            skipped_rows = sum(len(chunk) for chunk in itertools.islice(chunk_iterator, checkpoint["batches_done"]))
+            if skipped_rows != checkpoint["rows_done"]:
+                print(f"Checkpoint says {checkpoint['rows_done']} rows were written but the input has {skipped_rows}, starting over.")
+                checkpoint = None
+                chunk_iterator = _timed_chunks(pd.read_csv(input_csv_path, chunksize=batch_size, on_bad_lines='skip'))
+
+        if output_format != 'csv':
+            columnar_writer = ColumnarWriter(output_csv_path, output_format)
+        elif checkpoint is not None:
+            # anything past the checkpoint is from a batch that never got committed
+            with open(output_csv_path, 'r+b') as f:
+                f.truncate(checkpoint["output_bytes"])
+            output_file = open(output_csv_path, 'a', encoding='utf-8', newline='')
+            batches_done = checkpoint["batches_done"]
+            total_rows = resumed_rows = checkpoint["rows_done"]
+            counters = checkpoint["counters"]
+            if aggregator is not None:
+                _aggregate_output(aggregator, output_csv_path)
+            print(f"Resuming after batch {batches_done} ({total_rows} rows already written).")
+        else:
+            # the file is only created once the first batch is through, a missing column leaves nothing behind
+            _remove_checkpoint(output_csv_path)
+
+        is_first_batch = checkpoint is None
+        if doc_store is not None and not reextract:
+            doc_store.start(_docs_pipeline(), docs_source, keep_shards=batches_done)
+
+        batches = _iter_analyzed_batches(chunk_iterator, review_column_name, batch_size, n_workers, aggregate, previous,
+                                         key_column, doc_store, reextract, first_shard=batches_done)
+        for chunk, (analysis_results, batch_stats, batch_summary) in batches:
+            batches_done += 1
+            _merge_stats(counters, batch_stats)
+            _record_batch_metrics(batch_stats, len(chunk))
+            if aggregator is not None:
+                aggregator.merge(batch_summary)
+            total_rows += len(chunk)
             
             chunk['aspect_sentiments'] = analysis_results
             
-            if is_first_batch:
-                chunk.to_csv(output_csv_path, index=False, mode='w')
-                is_first_batch = False
-            else:
-                chunk.to_csv(output_csv_path, index=False, mode='a', header=False)
+            with metrics.span("output_write"):
+                if columnar_writer is not None:
+                    cleaned_reviews = [clean_text(review) for review in chunk[review_column_name].fillna('').astype(str)]
+                    columnar_writer.write(chunk, analysis_results, cleaned_reviews)
+                else:
+                    if output_file is None:
+                        output_file = open(output_csv_path, 'w', encoding='utf-8', newline='')
+                    chunk.to_csv(output_file, index=False, header=is_first_batch)
+                    is_first_batch = False
+                    output_file.flush()
+                    if checkpoint_settings is not None:
+                        # the batch is on disk before the checkpoint points past it
+                        os.fsync(output_file.fileno())
+                        write_checkpoint(output_csv_path, {
+                            "settings": checkpoint_settings,
+                            "status": "running",
+                            "batches_done": batches_done,
+                            "rows_done": total_rows,
+                            "output_bytes": os.fstat(output_file.fileno()).st_size,
+                            "counters": counters,
+                        })
+
+            elapsed = time.perf_counter() - start_time
+            print(f"Processed batch {batches_done} ({total_rows} rows, {(total_rows - resumed_rows) / elapsed:.1f} rows/sec)")
+            if progress_callback is not None:
+                progress_callback(batches_done, total_rows)
 
-        print(f"Processing complete. Results saved to '{output_csv_path}'.")
+        if columnar_writer is not None:
+            columnar_writer.close()
+        if output_file is not None:
+            output_file.close()
+        elif output_format == 'csv':
+            # an input without any rows still gets its (empty) output
+            open(output_csv_path, 'w').close()
 
+        elapsed = time.perf_counter() - start_time
+        rows_per_sec = (total_rows - resumed_rows) / elapsed if elapsed > 0 else 0.0
+        if total_rows:
+            counters["result_cache_hit_rate"] = round(counters.get("result_cache_hits", 0) / total_rows, 4)
+        # summed over batches (and over workers when there are several)
+        counters["stage_seconds"] = {stage: round(seconds, 4) for stage, seconds in counters.pop("stages", {}).items()}
+        print(f"Processing complete. {total_rows} rows in {elapsed:.2f}s ({rows_per_sec:.1f} rows/sec). Results saved to '{output_csv_path}'.")
+        run_stats = {
+            "rows": total_rows,
+            "batches": batches_done,
+            "seconds": round(elapsed, 3),
+            "rows_per_sec": round(rows_per_sec, 1),
+            "workers": n_workers,
+            "output_format": output_format,
+            "cache_version": cache_version(),
+            "pipeline": pipeline_info(),
+            **counters,
+        }
+        if resumed_rows:
+            run_stats["resumed_rows"] = resumed_rows
+        if previous is not None:
+            run_stats["previous_output"] = previous.output_path
+        if reextract:
+            run_stats["reextracted_from"] = doc_store.directory
+        elif doc_store is not None:
+            doc_store.finish(_docs_pipeline(), docs_source, batches_done, total_rows)
+            run_stats["docs_path"] = doc_store.directory
+        if aggregator is not None:
+            run_stats["summary_path"] = write_summary(output_csv_path, aggregator.summary())
+        write_metadata(output_csv_path, run_stats)
+        _remove_checkpoint(output_csv_path)
+        return run_stats
+
+    except ProcessingCancelled:
+        print(f"Processing cancelled after {batches_done} batches ({total_rows} rows).")
+        _mark_checkpoint(output_csv_path, "cancelled")
+        raise
+    except MissingColumnError as e:
+        print(f"Error: {e}")
+        metrics.record_error("process_dataset")
+    except StaleDocs as e:
+        print(f"Error: {e}")
+        metrics.record_error("process_dataset")
     except FileNotFoundError:
         print(f"Error: The file '{input_csv_path}' was not found.")
+        metrics.record_error("process_dataset")
     except Exception as e:
         print(f"An unexpected error occurred: {e}")
+        metrics.record_error("process_dataset")
+        if _mark_checkpoint(output_csv_path, "failed", str(e)):
+            print(f"Output is committed up to batch {batches_done}, run again with resume=True to continue from there.")
+    finally:
+        if columnar_writer is not None:
+            columnar_writer.close()
+        if output_file is not None:
+            output_file.close()
+
+def load_previous_results(previous_output_path, review_column_name, key_column=None):
+    """Index an earlier output for an incremental run, None if its results can't be reused"""
+    if not os.path.exists(previous_output_path):
+        print(f"Previous output '{previous_output_path}' not found, analyzing every row.")
+        return None
+    meta_file = metadata_path(previous_output_path)
+    previous_version = None
+    if os.path.exists(meta_file):
+        with open(meta_file, encoding='utf-8') as f:
+            previous_version = json.load(f).get("cache_version")
+    if previous_version != cache_version():
+        print(f"'{previous_output_path}' was made by a different pipeline version ({previous_version}), analyzing every row.")
+        return None
+
+    previous = PreviousResults(previous_output_path, review_column_name, key_column)
+    with metrics.span("previous_index"):
+        rows = previous.build(lambda review: content_hash(clean_text(review)))
+    print(f"Incremental run: {rows} rows of '{previous_output_path}' can be reused.")
+    return previous
+
+def _aggregate_output(aggregator, output_path):
+    # a resumed run rebuilds the summary of the rows written before the restart from the output itself
+    for frame in pd.read_csv(output_path, usecols=['aspect_sentiments'], chunksize=10_000):
+        for result in frame['aspect_sentiments']:
+            aggregator.add(json.loads(result))
+
+def checkpoint_path(output_path):
+    return output_path + ".ckpt.json"
+
+def write_checkpoint(output_path, checkpoint):
+    # written next to the output and renamed over the old one, a crash mid-write keeps the previous checkpoint
+    path = checkpoint_path(output_path)
+    tmp_path = path + ".tmp"
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(checkpoint, f)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, path)
+
+def read_checkpoint(output_path):
+    try:
+        with open(checkpoint_path(output_path), encoding='utf-8') as f:
+            return json.load(f)
+    except (FileNotFoundError, ValueError):
+        return None
+
+def _remove_checkpoint(output_path):
+    if os.path.exists(checkpoint_path(output_path)):
+        os.remove(checkpoint_path(output_path))
+
+def _mark_checkpoint(output_path, status, error=None):
+    checkpoint = read_checkpoint(output_path)
+    if checkpoint is None:
+        return False
+    checkpoint["status"] = status
+    checkpoint["error"] = error
+    write_checkpoint(output_path, checkpoint)
+    return True
+
+def _checkpoint_settings(input_path, review_column_name, batch_size, previous, key_column, doc_store=None, reextract=False):
+    """A checkpoint only applies to a rerun over the same input, chunking and pipeline"""
+    stat = os.stat(input_path)
+    return {
+        "input_path": os.path.abspath(input_path),
+        "input_size": stat.st_size,
+        "input_mtime_ns": stat.st_mtime_ns,
+        "review_column": review_column_name,
+        "key_column": key_column,
+        "batch_size": batch_size,
+        "cache_version": cache_version(),
+        "previous_output": previous.output_path if previous is not None else None,
+        "save_docs": doc_store.directory if doc_store is not None and not reextract else None,
+        "reextract_from": doc_store.directory if reextract else None,
+    }
+
+def _docs_pipeline():
+    # saved docs are only valid for the model/components that parsed them, the scores are worked out again on reuse
+    info = pipeline_info()
+    info.pop("load_seconds")
+    info.pop("sentiment_backend")
+    return info
+
+def _docs_source(input_path, review_column_name, batch_size):
+    # shard n holds batch n, so the chunking has to match too. Every doc is also checked against its row's text
+    return {
+        "input_size": os.path.getsize(input_path),
+        "review_column": review_column_name,
+        "batch_size": batch_size,
+    }
+
+def _resumable_checkpoint(output_path, settings):
+    checkpoint = read_checkpoint(output_path)
+    if checkpoint is None:
+        return None
+    if checkpoint.get("settings") != settings:
+        print(f"Checkpoint for '{output_path}' is from a different input or pipeline, starting over.")
+        return None
+    if not os.path.exists(output_path) or os.path.getsize(output_path) < checkpoint["output_bytes"]:
+        print(f"'{output_path}' is shorter than its checkpoint says, starting over.")
+        return None
+    return checkpoint
+
+def metadata_path(output_path):
+    return output_path + ".meta.json"
+
+# sidecar file next to an output so you can tell which pipeline produced it
+def write_metadata(output_path, run_stats):
+    with open(metadata_path(output_path), 'w', encoding='utf-8') as f:
+        json.dump(run_stats, f, indent=2)
+
+def summary_path(output_path):
+    return output_path + ".summary.json"
+
+def write_summary(output_path, summary):
+    path = summary_path(output_path)
+    with open(path, 'w', encoding='utf-8') as f:
+        json.dump(summary, f, indent=2)
+    return path
+
+# analyzes a list of strings in one batched pass, returns one result list per input, in order
+def process_many(review_texts, batch_size=500):
+    results, batch_stats, _ = _analyze_batch(review_texts, batch_size)
+    _record_batch_metrics(batch_stats, len(review_texts))
+    return [json.loads(result) for result in results]
 
 # analyzes only the single input string
 def process_single(review_text: str):
@@ -157,9 +1044,31 @@ def process_single(review_text: str):
         print("Input must be a non-empty string.")
         return []
     
-    cleaned_text = clean_text(review_text)
-    doc = nlp(cleaned_text)
+    with metrics.span("clean_text"):
+        cleaned_text = clean_text(review_text)
+
+    cache = get_result_cache()
+    if cache is not None:
+        with metrics.span("result_cache"):
+            key = ResultCache.make_key(cleaned_text, cache_version())
+            cached = cache.get_many([key])
+        if key in cached:
+            metrics.count("result_cache_hits_total")
+            return json.loads(cached[key])
+        metrics.count("result_cache_misses_total")
+
+    with metrics.span("spacy_parse"):
+        doc = parse_many([cleaned_text])[0]
     
-    results = extract_aspects(doc)
+    score_stats = {}
+    start = time.perf_counter()
+    results = extract_aspects(doc, score_stats)
+    scoring_seconds = score_stats.get("seconds", 0.0)
+    metrics.record_stages({"extract_aspects": time.perf_counter() - start - scoring_seconds, "sentiment": scoring_seconds})
+    metrics.count("rows_total")
+
+    if cache is not None:
+        with metrics.span("result_cache"):
+            cache.put_many({key: json.dumps(results)})
     
     return results
\ No newline at end of file
@@ -1,10 +1,21 @@
 import os
-from flask import Flask, request, jsonify, send_file
+import json
+import re
+import zipfile
+from flask import Flask, request, jsonify, send_file, stream_with_context, g
 from flask_cors import CORS
 from werkzeug.utils import secure_filename
 from datetime import datetime
 from analyze import *
-from scraper import scrape_url
+from scraper import scrape_url, get_driver_pool
+from crawler import crawl_reviews
+from scrape_cache import ScrapeCache, scrape_with_cache
+from jobs import JobStore, JobManager, DONE
+from columnar import OUTPUT_FORMATS, FILE_EXTENSIONS, aspects_path
+from docstore import docs_path
+from admission import ConcurrencyLimiter, Overloaded, limits_from_env
+import analyze
+import metrics
 
 app = Flask(__name__)
 CORS(app, resources={r"/work/*": {"origins": "*"}})
@@ -17,6 +28,222 @@ app.config['OUTPUT_FOLDER'] = OUTPUT_FOLDER
 os.makedirs(UPLOAD_FOLDER, exist_ok=True)
 os.makedirs(OUTPUT_FOLDER, exist_ok=True)
 
+# how many processes process_dataset fans batches out to, and how many rows go in each batch.
+# the worker processes are forked once at startup (see start_worker_pool), a server started some
+# other way than app.py or gunicorn.conf.py analyzes in the request's own process
+app.config['ANALYSIS_WORKERS'] = int(os.environ.get('ANALYSIS_WORKERS', 1))
+app.config['ANALYSIS_BATCH_SIZE'] = int(os.environ.get('ANALYSIS_BATCH_SIZE', 500))
+
+# the model loads lazily on the first request, set PRELOAD_MODEL=1 to pay that cost at startup instead
+if os.environ.get('PRELOAD_MODEL') == '1':
+    preload()
+
+# limits for /work/batch
+app.config['BATCH_MAX_ITEMS'] = int(os.environ.get('BATCH_MAX_ITEMS', 1000))
+app.config['BATCH_MAX_REVIEW_CHARS'] = int(os.environ.get('BATCH_MAX_REVIEW_CHARS', 20000))
+app.config['BATCH_MAX_BYTES'] = int(os.environ.get('BATCH_MAX_BYTES', 10 * 1024 * 1024))
+
+# background jobs for big uploads/scrapes, the db is what lets them survive a restart
+app.config['JOBS_DB'] = os.environ.get('JOBS_DB', os.path.join('jobs', 'jobs.db'))
+app.config['JOB_WORKERS'] = int(os.environ.get('JOB_WORKERS', 2))
+# PROFILING_ENABLED=1 lets a job be submitted with profile=1, it then runs under the sampling
+# profiler and its flame graph data can be fetched from /work/jobs/<id>/profile
+app.config['PROFILING_ENABLED'] = os.environ.get('PROFILING_ENABLED') == '1'
+
+# backpressure: each endpoint class only runs so many requests at once (per process) and lets a few more
+# wait, so a couple of slow CSV uploads can't take every thread /work/single needs. Past that the answer
+# is 429 (queue full) or 503 (waited QUEUE_TIMEOUT seconds) with a Retry-After, see admission.py
+app.config['ENDPOINT_LIMITS'] = limits_from_env()
+app.config['QUEUE_TIMEOUT'] = float(os.environ.get('QUEUE_TIMEOUT', 30))
+ENDPOINT_CLASSES = {
+    "work_single": "single",
+    "work_batch": "batch",
+    "work_csv": "heavy",
+    "work_csv_stream": "heavy",
+    "work_link": "heavy",
+    "work_summary": "heavy",
+}
+limiters = {name: ConcurrencyLimiter(name, limit, queue_size, app.config['QUEUE_TIMEOUT'])
+            for name, (limit, queue_size) in app.config['ENDPOINT_LIMITS'].items()}
+# background jobs queue up in the jobs db instead, submissions past this many unfinished jobs get a 429
+app.config['JOB_QUEUE_MAX'] = int(os.environ.get('JOB_QUEUE_MAX', 50))
+app.config['JOB_RETRY_AFTER'] = int(os.environ.get('JOB_RETRY_AFTER', 30))
+
+# every request gets a trace: its stage timings and counters end up in /metrics and in one
+# structured log line when it finishes
+@app.before_request
+def start_request_trace():
+    g.trace = metrics.Trace("request", request.endpoint or "unknown", method=request.method, path=request.path)
+    g.trace_token = metrics.start_trace(g.trace)
+
+@app.before_request
+def admit_request():
+    limiter = limiters.get(ENDPOINT_CLASSES.get(request.endpoint))
+    if limiter is None:
+        return None
+    try:
+        g.admission = (limiter, limiter.acquire())
+    except Overloaded as e:
+        metrics.count("rejected_requests_total", endpoint_class=e.name, status=e.status)
+        return overloaded_response(f"Server is busy with {e.name} requests, try again in {e.retry_after}s.", e.status, e.retry_after)
+
+def overloaded_response(message, status, retry_after):
+    response = jsonify({"error": message, "retry_after": retry_after})
+    response.status_code = status
+    response.headers['Retry-After'] = str(retry_after)
+    return response
+
+# submitting a job only saves the upload, the limit is on how many are waiting to run
+def job_queue_full():
+    if len(job_manager.store.unfinished_ids()) < app.config['JOB_QUEUE_MAX']:
+        return None
+    metrics.count("rejected_requests_total", endpoint_class="jobs", status=429)
+    return overloaded_response("Too many jobs are queued, try again later.", 429, app.config['JOB_RETRY_AFTER'])
+
+@app.after_request
+def finish_request_trace(response):
+    trace = g.pop('trace', None)
+    if trace is not None:
+        record = trace.as_dict()
+        metrics.registry.inc("requests_total", endpoint=trace.name, method=request.method, status=response.status_code)
+        metrics.registry.observe("request_seconds", record["seconds"], endpoint=trace.name)
+        if response.status_code >= 500:
+            metrics.record_error(f"request_{trace.name}")
+        metrics.log_event("request", **record, status=response.status_code)
+    return response
+
+# for a streamed response this only runs once the body is done, the slot is held until then
+@app.teardown_request
+def release_admission(error=None):
+    admission = g.pop('admission', None)
+    if admission is not None:
+        limiter, started = admission
+        limiter.release(started)
+
+@app.teardown_request
+def end_request_trace(error=None):
+    token = g.pop('trace_token', None)
+    if token is not None:
+        metrics.end_trace(token)
+
+# parquet/arrow outputs are two files (rows + exploded aspects), they go back to the client as one zip
+def bundle_columnar_output(output_path, zip_path):
+    with zipfile.ZipFile(zip_path, 'w', zipfile.ZIP_STORED) as bundle:
+        for path in (output_path, aspects_path(output_path)):
+            bundle.write(path, arcname=os.path.basename(path))
+    return zip_path
+
+# a profiled job runs in-process, the sampler can't see into the worker processes
+def analysis_workers(job):
+    return 1 if job['params'].get('profile') else app.config['ANALYSIS_WORKERS']
+
+# a job re-queued after a restart carries on from its last checkpoint (only csv output is checkpointed)
+def run_csv_job(job, progress):
+    params = job['params']
+    output_format = params.get('output_format', 'csv')
+    data_path = params.get('data_path', job['output_path'])
+    stats = process_dataset(params['input_path'], data_path, review_column_name=params['review_column'],
+                            batch_size=app.config['ANALYSIS_BATCH_SIZE'], n_workers=analysis_workers(job),
+                            progress_callback=progress, output_format=output_format, resume=output_format == 'csv',
+                            previous_output_path=params.get('previous_output'), key_column=params.get('key_column'),
+                            save_docs=params.get('save_docs', False), reextract_from=params.get('reextract_from'))
+    if stats is not None and output_format != 'csv':
+        bundle_columnar_output(data_path, job['output_path'])
+    return stats
+
+# scraped review sets are kept per listing so repeat submissions skip the browser,
+# SCRAPE_CACHE_TTL is how old (in seconds) a cached set can be before it's scraped again
+app.config['SCRAPE_CACHE_DB'] = os.environ.get('SCRAPE_CACHE_DB', os.path.join('cache', 'scrapes.db'))
+app.config['SCRAPE_CACHE_TTL'] = float(os.environ.get('SCRAPE_CACHE_TTL', 6 * 60 * 60))
+scrape_cache = ScrapeCache(app.config['SCRAPE_CACHE_DB'])
+
+def get_listing_reviews(url, refresh=False):
+    return scrape_with_cache(url, app.config['UPLOAD_FOLDER'], scrape_cache, app.config['SCRAPE_CACHE_TTL'],
+                             refresh=refresh, scrape=scrape_url)
+
+def run_link_job(job, progress):
+    reviews_csv, scrape_info = get_listing_reviews(job['params']['url'], refresh=job['params'].get('refresh', False))
+    if reviews_csv is None:
+        raise RuntimeError("Failed to scrape reviews from the provided URL. The page might be protected or have no reviews.")
+    # the reviews come back as an in-memory CSV, which can't be checkpointed, so a re-queued link job starts over
+    stats = process_dataset(reviews_csv, job['output_path'], review_column_name='Review',
+                            batch_size=app.config['ANALYSIS_BATCH_SIZE'], n_workers=analysis_workers(job),
+                            progress_callback=progress)
+    if stats is not None:
+        stats['scrape'] = scrape_info
+    return stats
+
+# every review page of several listings, fetched over plain HTTP (no browser)
+def run_crawl_job(job, progress):
+    params = job['params']
+    timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+    crawled_csv_path = os.path.abspath(os.path.join(app.config['UPLOAD_FOLDER'], f"crawled_reviews_{timestamp}.csv"))
+    crawl_summary = crawl_reviews(params['urls'], crawled_csv_path, max_pages=params['max_pages'],
+                                  concurrency=app.config['CRAWL_CONCURRENCY'],
+                                  per_host_interval=app.config['CRAWL_HOST_INTERVAL'])
+    if crawl_summary['reviews'] == 0:
+        raise RuntimeError("No reviews were found on the provided listings.")
+    stats = process_dataset(crawled_csv_path, job['output_path'], review_column_name='Review',
+                            batch_size=app.config['ANALYSIS_BATCH_SIZE'], n_workers=analysis_workers(job),
+                            progress_callback=progress)
+    if stats is not None:
+        stats['crawl'] = crawl_summary
+    return stats
+
+app.config['CRAWL_CONCURRENCY'] = int(os.environ.get('CRAWL_CONCURRENCY', 4))
+app.config['CRAWL_HOST_INTERVAL'] = float(os.environ.get('CRAWL_HOST_INTERVAL', 1.0))
+app.config['CRAWL_MAX_PAGES'] = int(os.environ.get('CRAWL_MAX_PAGES', 50))
+
+job_manager = JobManager(JobStore(app.config['JOBS_DB']),
+                         {'csv': run_csv_job, 'link': run_link_job, 'crawl': run_crawl_job},
+                         max_workers=app.config['JOB_WORKERS'], profiling=app.config['PROFILING_ENABLED'])
+
+# checks the upload and saves it into uploads/, returns (paths, None) or (None, error response)
+def save_csv_upload(output_format='csv'):
+    if 'input_csv' not in request.files:
+        return None, ("No file part in the request. Please select a CSV file.", 400)
+    
+    uploaded_file = request.files['input_csv']
+    
+    if uploaded_file.filename == '':
+        return None, ("No file selected. Please select a CSV file.", 400)
+
+    if not uploaded_file.filename.endswith('.csv'):
+        return None, ("Invalid file type. Please upload a .csv file.", 400)
+
+    original_filename = secure_filename(uploaded_file.filename)
+    name, ext = os.path.splitext(original_filename)
+    timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+    filename = f"{name}_{timestamp}{ext}"
+    input_path = os.path.join(app.config['UPLOAD_FOLDER'], filename)
+    with metrics.span("upload_save"):
+        uploaded_file.save(input_path)
+    
+    output_filename = f"processed_{name}_{timestamp}{FILE_EXTENSIONS[output_format]}"
+    output_path = os.path.join(app.config['OUTPUT_FOLDER'], output_filename)
+    return (input_path, output_path, output_filename), None
+
+# profile=1 on a job submission, returns (flag, None) or (None, error response)
+def profile_requested():
+    if request.form.get('profile', '0').lower() not in ('1', 'true', 'yes'):
+        return False, None
+    if not app.config['PROFILING_ENABLED']:
+        return None, (jsonify({"error": "Profiling is not enabled on this server (PROFILING_ENABLED=1)."}), 400)
+    return True, None
+
+def job_status(job):
+    return {
+        "job_id": job['id'],
+        "kind": job['kind'],
+        "status": job['status'],
+        "progress": {"batches_done": job['batches_done'], "rows_done": job['rows_done']},
+        "error": job['error'],
+        "stats": job['stats'],
+        "created_at": job['created_at'],
+        "started_at": job['started_at'],
+        "finished_at": job['finished_at'],
+    }
+
 # For the single review
 @app.route("/work/single", methods=['POST'])
 def work_single():
@@ -26,7 +253,9 @@ def work_single():
             return jsonify({"error": "Review text cannot be empty."}), 400
             
         result = process_single(review_text)
-        return jsonify(result)
+        response = jsonify(result)
+        response.headers['X-Pipeline-Profile'] = PIPELINE_PROFILE
+        return response
         
     except KeyError:
         return jsonify({"error": "Missing 'review' field in form data."}), 400
@@ -34,39 +263,192 @@ def work_single():
         print(f"An error occurred in /work/single: {e}")
         return jsonify({"error": "An internal server error occurred."}), 500
 
+class InvalidLine:
+    """An NDJSON line that isn't valid JSON, it becomes that item's error instead of failing the whole batch"""
+
+    def __init__(self, error):
+        self.error = error
+
+def parse_ndjson_lines(body):
+    items = []
+    for line in body.splitlines():
+        if not line.strip():
+            continue
+        try:
+            items.append(json.loads(line))
+        except ValueError as e:
+            items.append(InvalidLine(f"Line is not valid JSON: {e}"))
+    return items
+
+# turns one /work/batch item into (id, review text, error)
+def parse_batch_item(index, item):
+    if isinstance(item, InvalidLine):
+        return index, None, item.error
+    if isinstance(item, str):
+        item_id, review_text = index, item
+    elif isinstance(item, dict):
+        item_id, review_text = item.get('id', index), item.get('review')
+    else:
+        return index, None, "Item must be a string or an object with a 'review' field."
+
+    if not isinstance(review_text, str) or not review_text.strip():
+        return item_id, None, "Review text must be a non-empty string."
+    if len(review_text) > app.config['BATCH_MAX_REVIEW_CHARS']:
+        return item_id, None, f"Review text is longer than {app.config['BATCH_MAX_REVIEW_CHARS']} characters."
+    return item_id, review_text, None
+
+def read_body_limited(limit):
+    """The request body, or None once it goes past limit bytes. Chunked bodies have no Content-Length
+    to check up front, so this reads at most one byte over the limit instead of buffering all of it"""
+    chunks = []
+    size = 0
+    while size <= limit:
+        chunk = request.stream.read(min(64 * 1024, limit + 1 - size))
+        if not chunk:
+            break
+        chunks.append(chunk)
+        size += len(chunk)
+    return b"".join(chunks) if size <= limit else None
+
+# many reviews in one call: a JSON array (or NDJSON lines) of strings or {"id": ..., "review": ...} objects
+@app.route("/work/batch", methods=['POST'])
+def work_batch():
+    body = None
+    if request.content_length is None or request.content_length <= app.config['BATCH_MAX_BYTES']:
+        body = read_body_limited(app.config['BATCH_MAX_BYTES'])
+    if body is None:
+        return jsonify({"error": f"Request body is larger than {app.config['BATCH_MAX_BYTES']} bytes."}), 413
+
+    is_ndjson = request.mimetype in ('application/x-ndjson', 'application/ndjson')
+    try:
+        if is_ndjson:
+            items = parse_ndjson_lines(body)
+        else:
+            items = json.loads(body)
+    except Exception:
+        return jsonify({"error": "Request body must be a JSON array or NDJSON."}), 400
+
+    if not isinstance(items, list):
+        return jsonify({"error": "Request body must be a JSON array or NDJSON."}), 400
+    if len(items) > app.config['BATCH_MAX_ITEMS']:
+        return jsonify({"error": f"Too many items, the limit is {app.config['BATCH_MAX_ITEMS']} per call."}), 413
+
+    parsed = [parse_batch_item(i, item) for i, item in enumerate(items)]
+    valid = [i for i, (_, review_text, error) in enumerate(parsed) if error is None]
+    analyzed = {}
+    try:
+        for i, result in zip(valid, process_many([parsed[i][1] for i in valid])):
+            analyzed[i] = result
+    except Exception as e:
+        # one bad review shouldn't sink the rest, fall back to doing them one at a time
+        print(f"Batch analysis failed ({e}), retrying items individually")
+        for i in valid:
+            try:
+                analyzed[i] = process_single(parsed[i][1])
+            except Exception as item_error:
+                parsed[i] = (parsed[i][0], None, f"Analysis failed: {item_error}")
+
+    output = []
+    for i, (item_id, _, error) in enumerate(parsed):
+        if error is None:
+            output.append({"id": item_id, "results": analyzed[i]})
+        else:
+            output.append({"id": item_id, "error": error})
+
+    if is_ndjson:
+        body = "".join(json.dumps(entry) + "\n" for entry in output)
+        return app.response_class(body, mimetype='application/x-ndjson')
+    return jsonify({"items": output, "count": len(output), "errors": sum(1 for entry in output if "error" in entry)})
+
 # for the csv upload
 @app.route("/work/csv", methods=['POST'])
 def work_csv():
-    if 'input_csv' not in request.files:
-        return "No file part in the request. Please select a CSV file.", 400
-    
-    uploaded_file = request.files['input_csv']
-    
-    if uploaded_file.filename == '':
-        return "No file selected. Please select a CSV file.", 400
+    # csv (default), parquet or arrow
+    output_format = request.form.get('output_format', 'csv')
+    if output_format not in OUTPUT_FORMATS:
+        return f"Invalid output format. Please use one of: {', '.join(OUTPUT_FORMATS)}.", 400
 
-    if uploaded_file and uploaded_file.filename.endswith('.csv'):
-        original_filename = secure_filename(uploaded_file.filename)
-        name, ext = os.path.splitext(original_filename)
-        timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-        filename = f"{name}_{timestamp}{ext}"
-        input_path = os.path.join(app.config['UPLOAD_FOLDER'], filename)
-        uploaded_file.save(input_path)
+    paths, error = save_csv_upload(output_format)
+    if error:
+        return error
+    input_path, output_path, output_filename = paths
+    review_column = request.form.get('review_column', 'review')
+
+    try:
+        run_stats = process_dataset(input_path, output_path, review_column_name=review_column,
+                                    batch_size=app.config['ANALYSIS_BATCH_SIZE'],
+                                    n_workers=app.config['ANALYSIS_WORKERS'],
+                                    output_format=output_format)
+        if run_stats is None:
+            return f"Processing failed, check that the file has a '{review_column}' column and is a valid CSV.", 400
+        if output_format != 'csv':
+            zip_path = bundle_columnar_output(output_path, os.path.splitext(output_path)[0] + '.zip')
+            return send_file(zip_path, as_attachment=True, download_name=os.path.basename(zip_path))
+        return send_file(output_path, as_attachment=True, download_name=output_filename)
         
-        output_filename = f"processed_{name}_{timestamp}{ext}"
-        output_path = os.path.join(app.config['OUTPUT_FOLDER'], output_filename)
-        review_column = request.form.get('review_column', 'review')
+    except Exception as e:
+        print(f"An error occurred during CSV processing: {e}")
+        return f"An error occurred during processing: {e}", 500
     
+# streaming version of /work/csv: the request body is the raw CSV (not a form upload) and processed
+# rows are sent back batch by batch while the rest is still being analyzed. nothing touches the disk
+# unless ?save=1 is passed. ?format=ndjson returns one JSON object per row instead of CSV
+@app.route("/work/csv/stream", methods=['POST'])
+def work_csv_stream():
+    review_column = request.args.get('review_column', 'review')
+    output_format = request.args.get('format', 'csv')
+    if output_format not in ('csv', 'ndjson'):
+        return jsonify({"error": "format must be 'csv' or 'ndjson'."}), 400
+
+    chunks = analyze_csv_stream(request.stream, review_column_name=review_column,
+                                batch_size=app.config['ANALYSIS_BATCH_SIZE'],
+                                n_workers=app.config['ANALYSIS_WORKERS'])
+    # pull the first batch before answering so a bad file still gets a proper error status
+    try:
+        first_chunk = next(chunks, None)
+    except MissingColumnError as e:
+        return jsonify({"error": str(e)}), 400
+    except Exception as e:
+        print(f"An error occurred while reading the streamed CSV: {e}")
+        return jsonify({"error": f"Could not read the CSV: {e}"}), 400
+
+    save_path = None
+    if request.args.get('save') == '1':
+        timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+        save_path = os.path.join(app.config['OUTPUT_FOLDER'], f"processed_stream_{timestamp}.{output_format}")
+
+    def format_chunk(chunk, is_first):
+        if output_format == 'ndjson':
+            chunk['aspect_sentiments'] = [json.loads(value) for value in chunk['aspect_sentiments']]
+            text = chunk.to_json(orient='records', lines=True)
+            return text if text.endswith("\n") else text + "\n"
+        return chunk.to_csv(index=False, header=is_first)
+
+    def generate():
+        save_file = open(save_path, 'w', encoding='utf-8', newline='') if save_path else None
         try:
-            process_dataset(input_path, output_path, review_column_name=review_column)
-            return send_file(output_path, as_attachment=True, download_name=output_filename)
-            
-        except Exception as e:
-            print(f"An error occurred during CSV processing: {e}")
-            return f"An error occurred during processing: {e}", 500
-    else:
-        return "Invalid file type. Please upload a .csv file.", 400
-    
+            if first_chunk is None:
+                return
+            text = format_chunk(first_chunk, True)
+            if save_file:
+                save_file.write(text)
+            yield text
+            for chunk in chunks:
+                text = format_chunk(chunk, False)
+                if save_file:
+                    save_file.write(text)
+                yield text
+        finally:
+            if save_file:
+                save_file.close()
+                print(f"Streamed results saved to '{save_path}'")
+
+    mimetype = 'application/x-ndjson' if output_format == 'ndjson' else 'text/csv'
+    response = app.response_class(stream_with_context(generate()), mimetype=mimetype)
+    # stop proxies from buffering the whole response, which would defeat the point
+    response.headers['X-Accel-Buffering'] = 'no'
+    return response
+
 @app.route("/work/link", methods=['POST'])
 def work_link():
     try:
@@ -76,12 +458,15 @@ def work_link():
     except KeyError:
         return jsonify({"error": "Missing 'url' field in form data."}), 400
 
+    # refresh=1 scrapes again even if the cached reviews are still fresh
+    refresh = request.form.get('refresh', '0').lower() in ('1', 'true', 'yes')
+
     try:
-        # Step 1: Call the scraper function. It will save the raw scraped data
-        # into the 'uploads' folder to keep things organized.
-        scraped_csv_path = scrape_url(url, app.config['UPLOAD_FOLDER'])
+        # Step 1: Get the reviews, from the scrape cache if this listing was scraped recently.
+        # A real scrape still saves the raw data into the 'uploads' folder.
+        reviews_csv, scrape_info = get_listing_reviews(url, refresh=refresh)
 
-        if scraped_csv_path is None:
+        if reviews_csv is None:
             return jsonify({"error": "Failed to scrape reviews from the provided URL. The page might be protected or have no reviews."}), 500
             
         # Step 2: Process the scraped CSV file using your existing function.
@@ -90,15 +475,241 @@ def work_link():
         processed_output_path = os.path.join(app.config['OUTPUT_FOLDER'], output_filename)
         
         # The scraper creates a column named "Review".
-        process_dataset(scraped_csv_path, processed_output_path, review_column_name='Review')
+        run_stats = process_dataset(reviews_csv, processed_output_path, review_column_name='Review',
+                                    batch_size=app.config['ANALYSIS_BATCH_SIZE'],
+                                    n_workers=app.config['ANALYSIS_WORKERS'])
+        if run_stats is None:
+            return jsonify({"error": "Analyzing the scraped reviews failed."}), 500
         
         # Step 3: Send the final, processed file back to the user.
-        return send_file(processed_output_path, as_attachment=True, download_name=output_filename)
+        response = send_file(processed_output_path, as_attachment=True, download_name=output_filename)
+        response.headers['X-Scrape-Cache'] = scrape_info['cache']
+        return response
 
     except Exception as e:
         print(f"An error occurred during the link processing workflow: {e}")
         return jsonify({"error": "An internal server error occurred during processing."}), 500
 
+# how busy the shared browser pool is (drivers in use, waits, page latency, recycling)
+@app.route("/work/scraper/metrics", methods=['GET'])
+def scraper_metrics():
+    return jsonify(get_driver_pool().metrics())
+
+# async versions of /work/csv and /work/link, they return a job id straight away
+@app.route("/work/jobs/csv", methods=['POST'])
+def submit_csv_job():
+    busy = job_queue_full()
+    if busy:
+        return busy
+    output_format = request.form.get('output_format', 'csv')
+    if output_format not in OUTPUT_FORMATS:
+        return jsonify({"error": f"Invalid output format. Please use one of: {', '.join(OUTPUT_FORMATS)}."}), 400
+    profile, error = profile_requested()
+    if error:
+        return error
+    # incremental run: only rows that are new or changed since an earlier finished job get analyzed
+    previous_output = None
+    previous_job_id = request.form.get('previous_job_id', '').strip()
+    if previous_job_id:
+        previous_job = job_manager.store.get(previous_job_id)
+        if previous_job is None or previous_job['kind'] != 'csv' or previous_job['status'] != DONE:
+            return jsonify({"error": "'previous_job_id' must be a finished CSV job."}), 400
+        previous_output = previous_job['params'].get('data_path', previous_job['output_path'])
+
+    paths, error = save_csv_upload(output_format)
+    if error:
+        return jsonify({"error": error[0]}), error[1]
+    input_path, output_path, output_filename = paths
+    params = {
+        "input_path": os.path.abspath(input_path),
+        "review_column": request.form.get('review_column', 'review'),
+        "output_format": output_format,
+        "profile": profile,
+    }
+    if previous_output:
+        params['previous_output'] = previous_output
+        params['key_column'] = request.form.get('key_column', '').strip() or None
+    # save_docs=1 keeps the parsed docs so the job can be re-extracted later without parsing again
+    if request.form.get('save_docs', '0').lower() in ('1', 'true', 'yes'):
+        params['save_docs'] = True
+    if output_format != 'csv':
+        params['data_path'] = os.path.abspath(output_path)
+        output_path = os.path.splitext(output_path)[0] + '.zip'
+        output_filename = os.path.basename(output_path)
+    job_id = job_manager.submit('csv', params, os.path.abspath(output_path), output_filename)
+    return jsonify({"job_id": job_id, "status_url": f"/work/jobs/{job_id}"}), 202
+
+# runs a finished save_docs=1 CSV job again over its own upload, reading the parsed docs back instead of
+# parsing, for when the extraction rules or scoring changed. Answers with the new job
+@app.route("/work/jobs/<job_id>/reextract", methods=['POST'])
+def reextract_job(job_id):
+    job = job_manager.store.get(job_id)
+    if job is None:
+        return jsonify({"error": "Job not found."}), 404
+    params = job['params']
+    if job['kind'] != 'csv' or job['status'] != DONE:
+        return jsonify({"error": "Only a finished CSV job can be re-extracted."}), 409
+    # a re-extracted job points at the same docs as the job it came from
+    docs_output = params.get('reextract_from') or (params.get('data_path', job['output_path']) if params.get('save_docs') else None)
+    if docs_output is None or not os.path.isdir(docs_path(docs_output)):
+        return jsonify({"error": "No parsed docs were saved for this job (submit it with save_docs=1)."}), 409
+    profile, error = profile_requested()
+    if error:
+        return error
+    busy = job_queue_full()
+    if busy:
+        return busy
+
+    output_format = params.get('output_format', 'csv')
+    name = os.path.splitext(os.path.basename(params.get('data_path', job['output_path'])))[0]
+    name = re.sub(r'_reextract_\d{8}_\d{6}$', '', name)
+    timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+    output_filename = f"{name}_reextract_{timestamp}{FILE_EXTENSIONS[output_format]}"
+    output_path = os.path.abspath(os.path.join(app.config['OUTPUT_FOLDER'], output_filename))
+    new_params = {
+        "input_path": params['input_path'],
+        "review_column": params['review_column'],
+        "output_format": output_format,
+        "profile": profile,
+        "reextract_from": docs_output,
+    }
+    if output_format != 'csv':
+        new_params['data_path'] = output_path
+        output_path = os.path.splitext(output_path)[0] + '.zip'
+        output_filename = os.path.basename(output_path)
+    new_job_id = job_manager.submit('csv', new_params, output_path, output_filename)
+    return jsonify({"job_id": new_job_id, "status_url": f"/work/jobs/{new_job_id}"}), 202
+
+@app.route("/work/jobs/link", methods=['POST'])
+def submit_link_job():
+    busy = job_queue_full()
+    if busy:
+        return busy
+    url = request.form.get('url', '')
+    if not url.strip():
+        return jsonify({"error": "Missing or empty 'url' field in form data."}), 400
+    profile, error = profile_requested()
+    if error:
+        return error
+    timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+    output_filename = f"processed_link_{timestamp}.csv"
+    output_path = os.path.join(app.config['OUTPUT_FOLDER'], output_filename)
+    refresh = request.form.get('refresh', '0').lower() in ('1', 'true', 'yes')
+    job_id = job_manager.submit('link', {"url": url, "refresh": refresh, "profile": profile},
+                                os.path.abspath(output_path), output_filename)
+    return jsonify({"job_id": job_id, "status_url": f"/work/jobs/{job_id}"}), 202
+
+# several listings at once, 'urls' holds one URL per line
+@app.route("/work/jobs/crawl", methods=['POST'])
+def submit_crawl_job():
+    busy = job_queue_full()
+    if busy:
+        return busy
+    urls = [line.strip() for line in request.form.get('urls', '').splitlines() if line.strip()]
+    if not urls:
+        return jsonify({"error": "Missing or empty 'urls' field in form data (one URL per line)."}), 400
+    try:
+        max_pages = int(request.form.get('max_pages', app.config['CRAWL_MAX_PAGES']))
+    except ValueError:
+        return jsonify({"error": "'max_pages' must be a number."}), 400
+    profile, error = profile_requested()
+    if error:
+        return error
+    timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+    output_filename = f"processed_crawl_{timestamp}.csv"
+    output_path = os.path.join(app.config['OUTPUT_FOLDER'], output_filename)
+    params = {"urls": urls, "max_pages": max_pages, "profile": profile}
+    job_id = job_manager.submit('crawl', params, os.path.abspath(output_path), output_filename)
+    return jsonify({"job_id": job_id, "status_url": f"/work/jobs/{job_id}"}), 202
+
+@app.route("/work/jobs/<job_id>", methods=['GET'])
+def get_job(job_id):
+    job = job_manager.store.get(job_id)
+    if job is None:
+        return jsonify({"error": "Job not found."}), 404
+    return jsonify(job_status(job))
+
+@app.route("/work/jobs/<job_id>/cancel", methods=['POST'])
+def cancel_job(job_id):
+    if job_manager.store.get(job_id) is None:
+        return jsonify({"error": "Job not found."}), 404
+    job_manager.cancel(job_id)
+    return jsonify(job_status(job_manager.store.get(job_id)))
+
+@app.route("/work/jobs/<job_id>/result", methods=['GET'])
+def get_job_result(job_id):
+    job = job_manager.store.get(job_id)
+    if job is None:
+        return jsonify({"error": "Job not found."}), 404
+    if job['status'] != DONE:
+        return jsonify({"error": f"Job is {job['status']}, no result yet.", **job_status(job)}), 409
+    return send_file(job['output_path'], as_attachment=True, download_name=job['download_name'])
+
+@app.route("/work/jobs/<job_id>/summary", methods=['GET'])
+def get_job_summary(job_id):
+    job = job_manager.store.get(job_id)
+    if job is None:
+        return jsonify({"error": "Job not found."}), 404
+    if job['status'] != DONE:
+        return jsonify({"error": f"Job is {job['status']}, no summary yet.", **job_status(job)}), 409
+    summary_file = (job['stats'] or {}).get('summary_path')
+    if not summary_file or not os.path.exists(summary_file):
+        return jsonify({"error": "No summary was produced for this job."}), 404
+    with open(summary_file, encoding='utf-8') as f:
+        return jsonify(json.load(f))
+
+# collapsed stacks from a profiled job, feed them to flamegraph.pl or speedscope
+@app.route("/work/jobs/<job_id>/profile", methods=['GET'])
+def get_job_profile(job_id):
+    job = job_manager.store.get(job_id)
+    if job is None:
+        return jsonify({"error": "Job not found."}), 404
+    profile_file = (job['stats'] or {}).get('profile_path')
+    if not profile_file or not os.path.exists(profile_file):
+        return jsonify({"error": "No profile was recorded for this job (submit it with profile=1)."}), 404
+    return send_file(profile_file, mimetype='text/plain', as_attachment=True,
+                     download_name=f"job_{job_id}.profile.folded")
+
+# same upload as /work/csv but answers with the per-aspect summary of the whole file instead of the rows
+@app.route("/work/summary", methods=['POST'])
+def work_summary():
+    paths, error = save_csv_upload()
+    if error:
+        return jsonify({"error": error[0]}), error[1]
+    input_path, output_path, _ = paths
+    review_column = request.form.get('review_column', 'review')
+
+    try:
+        run_stats = process_dataset(input_path, output_path, review_column_name=review_column,
+                                    batch_size=app.config['ANALYSIS_BATCH_SIZE'],
+                                    n_workers=app.config['ANALYSIS_WORKERS'])
+        if run_stats is None:
+            return jsonify({"error": "Processing failed, check the review column and file format."}), 400
+        with open(run_stats['summary_path'], encoding='utf-8') as f:
+            return jsonify(json.load(f))
+    except Exception as e:
+        print(f"An error occurred during summary processing: {e}")
+        return jsonify({"error": "An internal server error occurred."}), 500
+
+# Prometheus scrape endpoint: stage timings, request/job counts and durations, cache hits, errors
+@app.route("/metrics", methods=['GET'])
+def prometheus_metrics():
+    metrics.registry.set_gauge("score_cache_entries", score_cache.stats()["entries"])
+    for name, limiter in limiters.items():
+        stats = limiter.stats()
+        metrics.registry.set_gauge("inflight_requests", stats["running"], endpoint_class=name)
+        metrics.registry.set_gauge("queued_requests", stats["waiting"], endpoint_class=name)
+    # read off the module, the star import only saw the value from before the model was loaded
+    if analyze.model_load_seconds is not None:
+        metrics.registry.set_gauge("model_load_seconds", round(analyze.model_load_seconds, 3))
+    return app.response_class(metrics.registry.render(), mimetype='text/plain; version=0.0.4')
+
 
+# development server only, for production run it under gunicorn with gunicorn.conf.py
 if __name__ == '__main__':
+    # with the debug reloader the app runs in a child process, only that one should pick jobs back up
+    # (and fork the analysis workers, before any request or job thread exists)
+    if os.environ.get('WERKZEUG_RUN_MAIN') == 'true':
+        start_worker_pool(app.config['ANALYSIS_WORKERS'])
+        job_manager.resume_pending()
     app.run(debug=True, port=8080)
@@ -0,0 +1,247 @@
+import hashlib
+import json
+
+import numpy as np
+from spacy.attrs import IDS as ATTR_IDS
+from spacy.matcher import DependencyMatcher
+from spacy.parts_of_speech import IDS as POS_IDS
+
+ANCHORS = ("aspect", "opinion")
+
+# token attributes / REL_OPs the engine evaluates itself on the doc's arrays, a rule using
+# anything else (">>", ".", regex values, ...) is handed to spaCy's DependencyMatcher instead
+FAST_ATTRS = ("DEP", "POS", "TAG", "LOWER", "LEMMA", "ORTH", "TEXT")
+FAST_OPS = (">", "<")
+
+def load_rules(rules_path):
+    """Read the rule list from a JSON file like aspect_rules.json.
+
+    Each rule is a DependencyMatcher pattern with two required nodes, "aspect" and "opinion", plus:
+      anchor            which of the two the rule hangs off ("aspect" or "opinion")
+      conjuncts         optional dep labels; conjuncts of the opinion with one of these labels become extra opinions
+      aspect_compounds  optional, true turns "life" into "battery life" by pulling in the compound nouns before it
+      enabled           optional, false keeps a rule in the file without running it
+    """
+    with open(rules_path, encoding="utf-8") as f:
+        config = json.load(f)
+    rules = [rule for rule in config["rules"] if rule.get("enabled", True)]
+    for rule in rules:
+        node_ids = {node["RIGHT_ID"] for node in rule["pattern"]}
+        missing = [name for name in ANCHORS if name not in node_ids]
+        if missing:
+            raise ValueError(f"Rule '{rule['name']}' in {rules_path} has no {' / '.join(missing)} node")
+        if rule.get("anchor") not in ANCHORS:
+            raise ValueError(f"Rule '{rule['name']}' in {rules_path} needs an anchor of 'aspect' or 'opinion'")
+    return rules
+
+def rules_fingerprint(rules_path):
+    """Short hash of the rule file, so editing the rules invalidates cached results"""
+    with open(rules_path, "rb") as f:
+        return hashlib.blake2b(f.read(), digest_size=6).hexdigest()
+
+class AspectRuleEngine:
+    """Aspect/opinion extraction from declarative dependency rules, compiled once per vocab.
+
+    Rules are written as DependencyMatcher patterns. The common shape (head/child relations testing
+    DEP/POS/TAG/text attributes) is compiled to array operations that run over a whole batch of docs
+    at once, so the per-review cost stays flat as rules are added; any other pattern goes through
+    spaCy's DependencyMatcher one doc at a time. Hits are then replayed in token order the way the
+    original hand-written loop did it: a token already used by an earlier hit can't anchor a new one,
+    and when several rules match at the same anchor the first rule in the file wins.
+    """
+
+    def __init__(self, vocab, rules):
+        self.rule_names = [rule["name"] for rule in rules]
+        self.matcher = DependencyMatcher(vocab)
+        self._columns = ["HEAD", "SENT_START", "LOWER"]
+        self._fast_rules = []
+        self._matcher_rules = 0
+        # match_id -> (priority, anchor/aspect/opinion positions in the pattern, conjunct deps, compounds)
+        self._rules = {}
+        for priority, rule in enumerate(rules):
+            node_ids = [node["RIGHT_ID"] for node in rule["pattern"]]
+            match_id = vocab.strings.add(rule["name"])
+            nodes = self._compile_pattern(vocab, rule["pattern"])
+            if nodes is None:
+                self.matcher.add(rule["name"], [rule["pattern"]])
+                self._matcher_rules += 1
+            else:
+                self._fast_rules.append((match_id, nodes))
+            self._rules[match_id] = (
+                priority,
+                node_ids.index(rule["anchor"]),
+                node_ids.index("aspect"),
+                node_ids.index("opinion"),
+                frozenset(rule.get("conjuncts", ())),
+                bool(rule.get("aspect_compounds", False)),
+            )
+        self._column_ids = [ATTR_IDS[name] for name in self._columns]
+
+    def _compile_pattern(self, vocab, pattern):
+        """[(left node position, rel_op, [(column, allowed ids, negate), ...]), ...] or None if it needs the DependencyMatcher"""
+        positions = {}
+        nodes = []
+        for node in pattern:
+            left, op = None, None
+            if "LEFT_ID" in node:
+                op = node.get("REL_OP")
+                if op not in FAST_OPS or node["LEFT_ID"] not in positions:
+                    return None
+                left = positions[node["LEFT_ID"]]
+            tests = []
+            for name, value in node.get("RIGHT_ATTRS", {}).items():
+                name = "ORTH" if name.upper() == "TEXT" else name.upper()
+                if name not in FAST_ATTRS:
+                    return None
+                if isinstance(value, str):
+                    values, negate = [value], False
+                elif isinstance(value, dict) and len(value) == 1 and ("IN" in value or "NOT_IN" in value):
+                    negate = "NOT_IN" in value
+                    values = value["NOT_IN" if negate else "IN"]
+                else:
+                    return None
+                if name == "POS":
+                    if any(v not in POS_IDS for v in values):
+                        return None
+                    ids = [POS_IDS[v] for v in values]
+                else:
+                    ids = [vocab.strings[v] for v in values]
+                if name not in self._columns:
+                    self._columns.append(name)
+                tests.append((self._columns.index(name), [np.uint64(i) for i in ids], negate))
+            positions[node["RIGHT_ID"]] = len(nodes)
+            nodes.append((left, op, tests))
+        return nodes
+
+    def _fast_matches(self, array, heads):
+        """(match_id, token id matrix) per compiled rule, one row per match, same matches the DependencyMatcher finds"""
+        total = len(heads)
+        has_head = heads != np.arange(total)
+        matches = []
+        for match_id, nodes in self._fast_rules:
+            ids = None
+            for left, op, tests in nodes:
+                accepted = np.ones(total, dtype=bool)
+                for column, allowed, negate in tests:
+                    values = array[:, column]
+                    # a handful of == is much cheaper than np.isin for the short value lists rules use
+                    passed = np.zeros(total, dtype=bool)
+                    for value in allowed:
+                        passed |= values == value
+                    accepted &= ~passed if negate else passed
+
+                if left is None:
+                    ids = np.flatnonzero(accepted)[:, None]
+                elif op == "<":
+                    # right node is the head of the left one
+                    up = heads[ids[:, left]]
+                    keep = has_head[ids[:, left]] & accepted[up]
+                    ids = np.column_stack([ids[keep], up[keep]])
+                else:
+                    # right node is a child of the left one: join the partial matches with the
+                    # accepted tokens on their head, one output row per (match, child) pair
+                    right = np.flatnonzero(accepted & has_head)
+                    right = right[np.argsort(heads[right], kind="stable")]
+                    right_heads = heads[right]
+                    lo = np.searchsorted(right_heads, ids[:, left], "left")
+                    counts = np.searchsorted(right_heads, ids[:, left], "right") - lo
+                    rows = np.repeat(np.arange(len(ids)), counts)
+                    first = np.repeat(lo - (np.cumsum(counts) - counts), counts)
+                    ids = np.column_stack([ids[rows], right[first + np.arange(len(rows))]])
+                if not len(ids):
+                    break
+            if len(ids):
+                matches.append((match_id, ids))
+        return matches
+
+    def match(self, doc):
+        return self.match_many([doc])[0]
+
+    def match_many(self, docs):
+        """Per doc, a list of (aspect_text, opinion_text, sent_start, sent_end) tuples in the order they were found.
+
+        The sentence is the one holding the rule's anchor token, doc[sent_start:sent_end] is the same span as token.sent.
+        """
+        docs = list(docs)
+        results = [[] for _ in docs]
+        lengths = np.array([len(doc) for doc in docs], dtype=np.int64)
+        total = int(lengths.sum())
+        if not total:
+            return results
+
+        # the whole batch as one table of token attributes, tokens numbered across docs
+        array = np.concatenate([doc.to_array(self._column_ids).reshape(len(doc), -1) for doc in docs if len(doc)])
+        offsets = np.cumsum(lengths) - lengths
+        # HEAD is a relative offset stored as uint64, the cast wraps the negative ones back around
+        heads = np.arange(total) + array[:, 0].astype(np.int64)
+
+        matches = self._fast_matches(array, heads)
+        for d, doc in enumerate(docs):
+            if self._matcher_rules and len(doc):
+                for match_id, token_ids in self.matcher(doc):
+                    matches.append((match_id, np.array([token_ids], dtype=np.int64) + offsets[d]))
+        if not matches:
+            return results
+
+        columns = {name: [] for name in ("anchor", "priority", "opinion", "aspect", "rule")}
+        for match_id, ids in matches:
+            priority, anchor, aspect, opinion, _, _ = self._rules[match_id]
+            columns["anchor"].append(ids[:, anchor])
+            columns["aspect"].append(ids[:, aspect])
+            columns["opinion"].append(ids[:, opinion])
+            columns["priority"].append(np.full(len(ids), priority))
+            columns["rule"].append(np.full(len(ids), match_id, dtype=np.uint64))
+        columns = {name: np.concatenate(parts) for name, parts in columns.items()}
+        # token order, then rule order, then the opinion/aspect order the children were walked in
+        order = np.lexsort((columns["aspect"], columns["opinion"], columns["priority"], columns["anchor"]))
+        columns = {name: values[order] for name, values in columns.items()}
+
+        # every doc starts a sentence, whatever SENT_START says about its first token
+        sent_starts = (array[:, 1] == 1)
+        sent_starts[offsets[lengths > 0]] = True
+        sent_starts = np.append(np.flatnonzero(sent_starts), total)
+        position = np.searchsorted(sent_starts, columns["anchor"], "right")
+        # "right" skips empty docs, they share their offset with the doc after them
+        doc_index = np.searchsorted(offsets, columns["anchor"], "right") - 1
+
+        strings = docs[0].vocab.strings
+        lower = array[:, 2]
+        rows = zip(
+            columns["anchor"].tolist(), columns["priority"].tolist(), columns["opinion"].tolist(),
+            columns["aspect"].tolist(), columns["rule"].tolist(), doc_index.tolist(),
+            sent_starts[position - 1].tolist(), sent_starts[position].tolist(),
+            lower[columns["opinion"]].tolist(), lower[columns["aspect"]].tolist(),
+        )
+        processed_token_indices = set()
+        current_anchor = -1
+        skip = False
+        for anchor_i, priority, opinion_i, aspect_i, match_id, d, sent_start, sent_end, opinion_lower, aspect_lower in rows:
+            if anchor_i != current_anchor:
+                # first row of an anchor carries its winning rule
+                current_anchor = anchor_i
+                skip = anchor_i in processed_token_indices
+                winner = priority
+            if skip or priority != winner:
+                continue
+            doc, offset = docs[d], int(offsets[d])
+            conjunct_deps, compounds = self._rules[match_id][4:]
+            aspect_text = self._aspect_text(doc, aspect_i - offset) if compounds else strings[aspect_lower]
+            hit = (aspect_text, strings[opinion_lower], sent_start - offset, sent_end - offset)
+            results[d].append(hit)
+            processed_token_indices.add(aspect_i)
+            processed_token_indices.add(opinion_i)
+            if conjunct_deps:
+                for conj in doc[opinion_i - offset].conjuncts:
+                    if conj.dep_ in conjunct_deps:
+                        results[d].append((aspect_text, conj.lower_, hit[2], hit[3]))
+                        processed_token_indices.add(conj.i + offset)
+        return results
+
+    @staticmethod
+    def _aspect_text(doc, aspect_i):
+        start = aspect_i
+        for child in reversed(list(doc[aspect_i].lefts)):
+            if child.dep_ != "compound" or child.i != start - 1:
+                break
+            start = child.i
+        return doc[start:aspect_i + 1].text.lower()
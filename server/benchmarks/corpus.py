@@ -0,0 +1,139 @@
+"""Synthetic review corpora and listing pages for the benchmarks, generated from a fixed seed so every run sees the same input"""
+
+import csv
+import os
+import random
+import zlib
+
+SIZES = {"1k": 1_000, "100k": 100_000, "1m": 1_000_000}
+KINDS = ("short", "multi", "long", "noisy")
+
+ASPECTS = [
+    "battery", "screen", "price", "quality", "shipping", "fabric", "color", "size", "seller", "packaging",
+    "sound", "camera", "strap", "zipper", "stitching", "material", "handle", "lid", "charger", "fit",
+]
+POSITIVE = ["great", "good", "amazing", "perfect", "soft", "sturdy", "beautiful", "fast", "cheap", "excellent"]
+NEGATIVE = ["bad", "terrible", "slow", "flimsy", "poor", "awful", "expensive", "broken", "weak", "disappointing"]
+NEUTRAL = ["okay", "average", "fine", "normal", "standard"]
+
+TEMPLATES = [
+    "The {aspect} is {opinion}.",
+    "{Opinion} {aspect}.",
+    "The {aspect} was {opinion} and {opinion2}.",
+    "I love the {opinion} {aspect}!",
+    "Really {opinion} {aspect}, would buy again.",
+    "The {aspect} seems {opinion} but the {aspect2} is {opinion2}.",
+    "Not happy, the {aspect} is {opinion}.",
+    "My {aspect} arrived {opinion}.",
+]
+FILLER = [
+    "I bought this as a gift for my sister.",
+    "Would recommend to a friend.",
+    "It took about a week to arrive.",
+    "Ordered two of these last month.",
+    "This is my third purchase from this shop.",
+    "Will update after a few weeks of use.",
+    "Thanks!",
+    "Five stars.",
+]
+NOISE = ["!!!", "...", " :)", " :(", " \U0001F60D", " \U0001F44D", " &amp;", " lol", " http://example.com/item?id=42", " 10/10"]
+
+def _sentence(rng):
+    opinions = rng.choice((POSITIVE, POSITIVE, NEGATIVE, NEUTRAL))
+    opinion, opinion2 = rng.choice(opinions), rng.choice(opinions)
+    return rng.choice(TEMPLATES).format(
+        aspect=rng.choice(ASPECTS), aspect2=rng.choice(ASPECTS),
+        opinion=opinion, opinion2=opinion2, Opinion=opinion.capitalize(),
+    )
+
+def _sentences(rng, count):
+    return [_sentence(rng) if rng.random() < 0.7 else rng.choice(FILLER) for _ in range(count)]
+
+def _noisy(rng):
+    text = " ".join(_sentences(rng, rng.randint(1, 5)))
+    roll = rng.random()
+    if roll < 0.05:
+        return rng.choice(["", "   ", "!!!", "\U0001F44D"])
+    if roll < 0.4:
+        # no space after the full stop, which clean_text has to fix up
+        text = text.replace(". ", ".")
+    if rng.random() < 0.3:
+        text = text.upper()
+    if rng.random() < 0.3:
+        text = text.replace("o", "ooo", 1)
+    return text + "".join(rng.choice(NOISE) for _ in range(rng.randint(0, 3)))
+
+def review(rng, kind):
+    if kind == "short":
+        return _sentence(rng)
+    if kind == "multi":
+        return " ".join(_sentences(rng, rng.randint(2, 5)))
+    if kind == "long":
+        paragraphs = [" ".join(_sentences(rng, rng.randint(4, 8))) for _ in range(rng.randint(2, 5))]
+        return "\n\n".join(paragraphs)
+    if kind == "noisy":
+        return _noisy(rng)
+    raise ValueError(f"Unknown corpus kind '{kind}', expected one of {KINDS}")
+
+def corpus_path(kind, size, data_dir):
+    """CSV of `size` reviews of one kind (columns id, review, rating), written on first use and reused after that"""
+    if size not in SIZES:
+        raise ValueError(f"Unknown corpus size '{size}', expected one of {list(SIZES)}")
+    path = os.path.join(data_dir, f"{kind}-{size}.csv")
+    if os.path.exists(path):
+        return path
+
+    os.makedirs(data_dir, exist_ok=True)
+    rng = random.Random(zlib.crc32(f"{kind}-{size}".encode()))
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "w", newline="", encoding="utf-8") as f:
+        writer = csv.writer(f)
+        writer.writerow(["id", "review", "rating"])
+        for i in range(SIZES[size]):
+            writer.writerow([i, review(rng, kind), rng.randint(1, 5)])
+    os.replace(tmp_path, path)
+    return path
+
+NAMES = ["Alice Johnson", "Bob Smith", "Carla Diaz", "Dmitri Ivanov", "Emma Stone", "Farah Khan", "Zoe"]
+
+def listing_page(seed, reviews=40, layout="cards"):
+    """A listing page in one of the shapes the scraper handles.
+
+    cards:   review cards with data-test-id attributes (the first selector in scraper.REVIEW_SELECTORS)
+    generic: review-ish class names, rating aria-labels and names scattered around (method 2)
+    text:    no review markup at all, just sentences with review keywords in them (method 3)
+    """
+    rng = random.Random(seed)
+    out = [
+        "<!DOCTYPE html><html><head><title>Handmade listing</title>",
+        "<script>window.__state = {\"title\": \"love this great product\"};</script></head><body>",
+        "<!-- recommended items, great quality, love them -->",
+        "<div class='listing-header'><h1>Handmade linen shirt</h1><p>Ships from a small shop in Lisbon.</p></div>",
+        "<nav><a href='/'>Home</a><a href='/shop'>Shop</a></nav>",
+    ]
+    for i in range(reviews):
+        text = " ".join(_sentences(rng, rng.randint(1, 4)))
+        name, stars = rng.choice(NAMES), rng.randint(1, 5)
+        if layout == "cards":
+            out.append(
+                f"<div data-test-id='review-card'><p class='wt-text-caption wt-text-truncate'>{name}</p>"
+                f"<input type='hidden' name='rating' value='{stars}'><p id='review-preview-toggle-{i}'>{text}</p></div>"
+            )
+        elif layout == "generic":
+            shape = i % 4
+            if shape == 0:
+                out.append(f"<div class='review-item'><p>{text}</p><span>{name}</span><span aria-label='{stars} out of 5 stars'></span></div>")
+            elif shape == 1:
+                out.append(f"<section class='feedback'><p>{text}</p><div><span class='star-rating' aria-label='Rated {stars} stars'></span><p>{name}</p></div></section>")
+            elif shape == 2:
+                out.append(f"<p class='review-text'>{text}</p><span>{name}</span>")
+            else:
+                out.append(f"<div class='comment'><div><p>{text} <b>Recommended</b></p></div><span>{name}</span></div>")
+        elif layout == "text":
+            out.append(f"<div><p>{text} I would recommend it, great quality.</p></div><div class='spacer'>{'-' * rng.randint(0, 80)}</div>")
+        else:
+            raise ValueError(f"Unknown page layout '{layout}'")
+    out.append("<footer><p>Copyright. All reviews are from verified buyers.</p></footer></body></html>")
+    return "\n".join(out)
+
+PAGE_LAYOUTS = ("cards", "generic", "text")
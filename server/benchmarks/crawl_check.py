@@ -0,0 +1,125 @@
+"""Offline check of crawler.crawl_reviews against paginated listings served from a local http.server.
+
+Run from the server folder:
+
+    python benchmarks/crawl_check.py
+
+Three listings are generated into a temporary folder (review cards as in benchmarks/corpus.py):
+
+    linked    4 pages chained with rel="next", the last one has no next link. Every page repeats a few
+              reviews of the one before, those must only be written once. The listing is given twice,
+              it must still be fetched once
+    looping   3 pages, the last one's "Next" points back at page 1, which must not be fetched again
+    param     no pagination markup, crawled with page_param="page". The server ignores the query string,
+              so page 2 is page 1 again and the crawl has to stop there instead of running to max_pages
+
+Exits non-zero on the first failed check.
+"""
+
+import csv
+import os
+import sys
+import tempfile
+import threading
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, BENCH_DIR)
+sys.path.insert(0, os.path.dirname(BENCH_DIR))
+
+from corpus import listing_page
+from loadtest import serve_fixtures
+from crawler import crawl_reviews, fetch_page
+from scraper import make_soup, extract_reviews_with_multiple_methods
+
+REPEATED_PER_PAGE = 5
+
+def _cards(html):
+    return [line for line in html.split("\n") if line.startswith("<div data-test-id='review-card'>")]
+
+def _page(seed, repeated_cards, next_href, next_rel=True):
+    # a generated listing with a few cards of the previous page added back and a pagination link before the footer
+    lines = listing_page(seed, reviews=12).split("\n")
+    nav = ""
+    if next_href:
+        rel = " rel='next'" if next_rel else ""
+        nav = f"<nav class='pagination'><a href='{next_href}'{rel}>Next</a></nav>"
+    return "\n".join(lines[:-1] + repeated_cards + [nav, lines[-1]])
+
+def write_listings(directory):
+    """Write the listings, returns {name: (first page file, {page file: html})}"""
+    listings = {}
+
+    pages, previous = {}, []
+    for number in range(1, 5):
+        html = _page(100 + number, previous[:REPEATED_PER_PAGE], f"linked-{number + 1}.html" if number < 4 else None)
+        pages[f"linked-{number}.html"] = html
+        previous = _cards(html)
+    listings["linked"] = ("linked-1.html", pages)
+
+    pages = {}
+    for number in range(1, 4):
+        pages[f"looping-{number}.html"] = _page(200 + number, [], f"looping-{number % 3 + 1}.html", next_rel=False)
+    listings["looping"] = ("looping-1.html", pages)
+
+    listings["param"] = ("param.html", {"param.html": _page(300, [], None)})
+
+    for _, pages in listings.values():
+        for name, html in pages.items():
+            with open(os.path.join(directory, name), "w", encoding="utf-8") as f:
+                f.write(html)
+    return listings
+
+def expected_reviews(pages):
+    # what the scraper finds on each page, the crawl should write each distinct one exactly once
+    reviews = set()
+    for html in pages.values():
+        reviews.update(review["Review"] for review in
+                       extract_reviews_with_multiple_methods(make_soup(html), method2_limit=None, method3_limit=None))
+    return reviews
+
+def check(condition, message):
+    if not condition:
+        raise AssertionError(message)
+    print(f"ok   {message}")
+
+def main():
+    with tempfile.TemporaryDirectory() as directory:
+        listings = write_listings(directory)
+        server = serve_fixtures(directory)
+        base_url = f"http://127.0.0.1:{server.server_address[1]}"
+
+        fetched = []
+        fetched_lock = threading.Lock()
+        def fetch(url):
+            with fetched_lock:
+                fetched.append(url)
+            return fetch_page(url, timeout=10)
+
+        try:
+            for name, page_param, expected_pages in (("linked", None, 4), ("looping", None, 3), ("param", "page", 2)):
+                first_page, pages = listings[name]
+                url = f"{base_url}/{first_page}"
+                urls = [url, url] if name == "linked" else [url]
+                output_path = os.path.join(directory, f"{name}.csv")
+                fetched.clear()
+                summary = crawl_reviews(urls, output_path, max_pages=10, concurrency=2, per_host_interval=0,
+                                        page_param=page_param, fetch=fetch)
+
+                with open(output_path, newline="", encoding="utf-8") as f:
+                    rows = list(csv.DictReader(f))
+                written = [row["Review"] for row in rows]
+                expected = expected_reviews(pages)
+
+                check(summary["errors"] == 0, f"{name}: no fetch errors")
+                check(summary["pages"] == expected_pages, f"{name}: {summary['pages']} pages crawled, expected {expected_pages}")
+                check(len(fetched) == len(set(fetched)) == expected_pages,
+                      f"{name}: pagination stopped after {len(fetched)} fetches, none of them repeated")
+                check(len(written) == len(set(written)), f"{name}: no duplicate reviews in the output ({len(written)} rows)")
+                check(set(written) == expected and summary["reviews"] == len(expected),
+                      f"{name}: every distinct review written once ({len(expected)})")
+        finally:
+            server.shutdown()
+    print("crawl check passed")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,175 @@
+"""Load test for a running server: concurrent clients on /work/single, /work/csv and /work/link at the same time.
+
+Start the server first (e.g. gunicorn -c gunicorn.conf.py app:app from the server folder), then:
+
+    python benchmarks/loadtest.py                                   # 30s against http://127.0.0.1:8080
+    python benchmarks/loadtest.py --duration 60 --single-clients 16 --csv-clients 4 --csv-rows 2000
+    python benchmarks/loadtest.py --link-clients 0                  # no scraping
+
+The point is what the single-review latency does while CSV uploads and scrapes are running next to it,
+and that an overloaded server answers 429/503 (counted as "shed") instead of letting requests hang.
+A client that gets one waits for the Retry-After (capped by --max-backoff) before trying again.
+
+/work/link goes to a local copy of the listing pages in benchmarks/fixtures unless --link-url is given.
+The first request scrapes it with the browser, after that it's normally served from the scrape cache.
+"""
+
+import argparse
+import csv
+import functools
+import io
+import json
+import os
+import random
+import sys
+import threading
+import time
+from http.server import SimpleHTTPRequestHandler, ThreadingHTTPServer
+
+import requests
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, BENCH_DIR)
+
+from corpus import KINDS, review
+from run import _percentile
+
+ENDPOINTS = ("single", "csv", "link")
+
+class Results:
+    """Latencies and status counts per endpoint, shared by the client threads"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.latencies = {endpoint: [] for endpoint in ENDPOINTS}
+        self.statuses = {endpoint: {} for endpoint in ENDPOINTS}
+
+    def add(self, endpoint, status, seconds):
+        with self._lock:
+            self.statuses[endpoint][status] = self.statuses[endpoint].get(status, 0) + 1
+            if status == 200:
+                self.latencies[endpoint].append(seconds)
+
+    def summary(self, seconds):
+        rows = {}
+        for endpoint in ENDPOINTS:
+            statuses = self.statuses[endpoint]
+            total = sum(statuses.values())
+            if not total:
+                continue
+            latencies = self.latencies[endpoint]
+            rows[endpoint] = {
+                "requests": total,
+                "ok": statuses.get(200, 0),
+                "shed": statuses.get(429, 0) + statuses.get(503, 0),
+                "errors": total - statuses.get(200, 0) - statuses.get(429, 0) - statuses.get(503, 0),
+                "ok_per_sec": round(statuses.get(200, 0) / seconds, 2),
+                "p50_ms": round(_percentile(latencies, 50) * 1000, 1) if latencies else None,
+                "p95_ms": round(_percentile(latencies, 95) * 1000, 1) if latencies else None,
+                "p99_ms": round(_percentile(latencies, 99) * 1000, 1) if latencies else None,
+                "statuses": {str(status): count for status, count in sorted(statuses.items(), key=lambda item: str(item[0]))},
+            }
+        return rows
+
+def make_csv(rng, rows, kind):
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(["id", "review", "rating"])
+    for i in range(rows):
+        writer.writerow([i, review(rng, kind), rng.randint(1, 5)])
+    return buffer.getvalue().encode("utf-8")
+
+def serve_fixtures(directory=None):
+    """Serve benchmarks/fixtures (or directory) on a free local port, returns the server"""
+    handler = functools.partial(QuietHandler, directory=directory or os.path.join(BENCH_DIR, "fixtures"))
+    server = ThreadingHTTPServer(("127.0.0.1", 0), handler)
+    threading.Thread(target=server.serve_forever, name="fixtures", daemon=True).start()
+    return server
+
+class QuietHandler(SimpleHTTPRequestHandler):
+    def log_message(self, *args):
+        pass
+
+def client(endpoint, base_url, options, results, deadline, seed):
+    rng = random.Random(seed)
+    session = requests.Session()
+    csv_body = make_csv(rng, options.csv_rows, options.csv_kind) if endpoint == "csv" else None
+    while time.monotonic() < deadline:
+        start = time.perf_counter()
+        try:
+            if endpoint == "single":
+                response = session.post(f"{base_url}/work/single", data={"review": review(rng, options.single_kind)}, timeout=options.timeout)
+            elif endpoint == "csv":
+                response = session.post(f"{base_url}/work/csv", files={"input_csv": ("loadtest.csv", csv_body, "text/csv")}, timeout=options.timeout)
+            else:
+                response = session.post(f"{base_url}/work/link", data={"url": options.link_url}, timeout=options.timeout)
+            status = response.status_code
+            retry_after = response.headers.get("Retry-After")
+        except requests.RequestException as e:
+            status = type(e).__name__
+            retry_after = None
+        results.add(endpoint, status, time.perf_counter() - start)
+        if status in (429, 503):
+            time.sleep(min(float(retry_after or 1), options.max_backoff))
+
+def print_table(rows):
+    header = f"{'endpoint':<8} {'requests':>9} {'ok':>7} {'shed':>6} {'errors':>7} {'ok/sec':>8} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9}"
+    print(header)
+    print("-" * len(header))
+    for endpoint, row in rows.items():
+        print(f"{endpoint:<8} {row['requests']:>9} {row['ok']:>7} {row['shed']:>6} {row['errors']:>7} {row['ok_per_sec']:>8} "
+              f"{row['p50_ms'] if row['p50_ms'] is not None else '-':>9} {row['p95_ms'] if row['p95_ms'] is not None else '-':>9} "
+              f"{row['p99_ms'] if row['p99_ms'] is not None else '-':>9}")
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Drive /work/single, /work/csv and /work/link of a running server at the same time")
+    parser.add_argument("--url", default="http://127.0.0.1:8080", help="base URL of the server")
+    parser.add_argument("--duration", type=float, default=30, help="seconds to keep the clients going")
+    parser.add_argument("--single-clients", type=int, default=8)
+    parser.add_argument("--csv-clients", type=int, default=2)
+    parser.add_argument("--link-clients", type=int, default=1)
+    parser.add_argument("--csv-rows", type=int, default=500, help="rows in each uploaded CSV")
+    parser.add_argument("--csv-kind", default="multi", choices=KINDS)
+    parser.add_argument("--single-kind", default="multi", choices=KINDS)
+    parser.add_argument("--link-url", help="listing page for /work/link, defaults to a local copy of the fixtures")
+    parser.add_argument("--timeout", type=float, default=300, help="per-request timeout in seconds")
+    parser.add_argument("--max-backoff", type=float, default=1.0, help="longest a client honours Retry-After for")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", help="also write the results as JSON here")
+    options = parser.parse_args(argv)
+
+    fixture_server = None
+    if options.link_clients and not options.link_url:
+        fixture_server = serve_fixtures()
+        options.link_url = f"http://127.0.0.1:{fixture_server.server_address[1]}/cards-listing.html"
+
+    base_url = options.url.rstrip("/")
+    results = Results()
+    deadline = time.monotonic() + options.duration
+    threads = []
+    clients = {"single": options.single_clients, "csv": options.csv_clients, "link": options.link_clients}
+    for endpoint, count in clients.items():
+        for i in range(count):
+            seed = options.seed * 1000 + len(threads)
+            thread = threading.Thread(target=client, args=(endpoint, base_url, options, results, deadline, seed), name=f"{endpoint}-{i}")
+            thread.start()
+            threads.append(thread)
+
+    print(f"Running {options.single_clients} single, {options.csv_clients} csv and {options.link_clients} link clients "
+          f"against {base_url} for {options.duration:g}s...")
+    start = time.monotonic()
+    for thread in threads:
+        thread.join()
+    seconds = time.monotonic() - start
+    if fixture_server is not None:
+        fixture_server.shutdown()
+
+    rows = results.summary(seconds)
+    print()
+    print_table(rows)
+    if options.output:
+        with open(options.output, "w") as f:
+            json.dump({"options": vars(options), "seconds": round(seconds, 2), "results": rows}, f, indent=2)
+
+if __name__ == "__main__":
+    main()
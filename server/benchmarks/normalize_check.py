@@ -0,0 +1,55 @@
+"""Check of aggregate.normalize_aspect on plurals and the words the suffix rules used to break.
+
+Run from the server folder:
+
+    python benchmarks/normalize_check.py
+
+The rules are checked on their own, and again through spaCy's lemma lookup table when
+spacy-lookups-data is installed. Exits non-zero on the first failed check.
+"""
+
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import aggregate
+from aggregate import normalize_aspect
+
+CASES = {
+    # left alone
+    "lens": "lens", "series": "series", "species": "species", "news": "news", "glasses": "glasses",
+    "jeans": "jeans", "clothes": "clothes", "glass": "glass", "bus": "bus", "analysis": "analysis",
+    "price": "price", "fit": "fit",
+    # plurals
+    "lenses": "lens", "batteries": "battery", "movies": "movie", "cookies": "cookie", "buttons": "button",
+    "pans": "pan", "boxes": "box", "watches": "watch", "brushes": "brush", "classes": "class",
+    "sizes": "size", "headaches": "headache", "beaches": "beach", "coaches": "coach", "knives": "knife",
+    "shoes": "shoe", "colors": "color",
+    # whole aspects, only the head word changes
+    "The Camera Lenses": "camera lens", "my reading glasses": "reading glasses", "TV series": "tv series",
+    "these  Batteries": "battery", "delivery times": "delivery time",
+}
+
+def run(label):
+    failed = [(aspect, normalize_aspect(aspect), expected) for aspect, expected in CASES.items()
+              if normalize_aspect(aspect) != expected]
+    for aspect, got, expected in failed:
+        print(f"FAIL {label}: {aspect!r} -> {got!r}, expected {expected!r}")
+    if failed:
+        raise SystemExit(1)
+    print(f"ok   {label}: {len(CASES)} aspects")
+
+def main():
+    table = aggregate._lemma_table()
+    aggregate._lemma_lookup = {}
+    run("rules")
+    if table:
+        aggregate._lemma_lookup = table
+        run("lemma lookup")
+    else:
+        print("skip lemma lookup: spacy-lookups-data isn't installed")
+    print("normalize check passed")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,358 @@
+"""Benchmarks for the analysis and scraping hot paths, fully offline (no browser, no network).
+
+Run from the server folder:
+
+    python benchmarks/run.py                                  # every case on the 1k corpora
+    python benchmarks/run.py --sizes 1k,100k --cases dataset --workers 4
+    python benchmarks/run.py --save-baseline                  # record benchmarks/baseline.json
+    python benchmarks/run.py --baseline benchmarks/baseline.json --threshold 0.15
+
+Cases:
+    clean_text   clean_text over a whole corpus
+    extraction   parse + extract_aspects one review at a time (what /work/single does), gives per-doc latency
+    dataset      process_dataset end to end over a whole corpus (batched, what /work/csv does)
+    sentiment    SENTIMENT_BACKEND scoring every sentence of a corpus in batches, checked against VADER
+                 (fails if more than 1% of sentences are off by over 0.05 compound)
+    scraper      extract_reviews_with_multiple_methods on the saved pages in benchmarks/fixtures plus generated large pages
+
+Each case runs in a fresh child process so its peak RSS is its own. Output checksums are hashes of
+what the code produced; against a baseline a changed checksum fails the run (the output changed),
+as does throughput dropping or peak RSS growing by more than --threshold.
+"""
+
+import argparse
+import contextlib
+import glob
+import hashlib
+import json
+import os
+import platform
+import resource
+import sys
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+import multiprocessing
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+SERVER_DIR = os.path.dirname(BENCH_DIR)
+sys.path.insert(0, SERVER_DIR)
+
+# never read or fill the on-disk result cache while timing, every run has to do the real work
+os.environ["RESULT_CACHE_PATH"] = ""
+
+from corpus import KINDS, SIZES, PAGE_LAYOUTS, corpus_path, listing_page
+
+CASES = ("clean_text", "extraction", "dataset", "sentiment", "scraper")
+
+# the vectorized backend's promise, see sentiment.py
+SENTIMENT_TOLERANCE = 0.05
+SENTIMENT_MAX_OFF_SHARE = 0.01
+
+def _percentile(values, q):
+    if not values:
+        return None
+    values = sorted(values)
+    return values[min(int(round(q / 100 * (len(values) - 1))), len(values) - 1)]
+
+def _peak_rss_mb():
+    # ru_maxrss is in KB on linux, bytes on macOS; include the process_dataset workers
+    scale = 1 if sys.platform == "darwin" else 1024
+    own = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    children = resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss
+    return round(max(own, children) * scale / (1024 * 1024), 1)
+
+def _read_reviews(path):
+    import pandas as pd
+    return pd.read_csv(path, usecols=["review"], keep_default_na=False)["review"].astype(str).tolist()
+
+def _result(docs, seconds, latencies, digest, **extra):
+    return {
+        "docs": docs,
+        "seconds": round(seconds, 3),
+        "docs_per_sec": round(docs / seconds, 1) if seconds else None,
+        "p50_ms": round(_percentile(latencies, 50) * 1000, 4) if latencies else None,
+        "p99_ms": round(_percentile(latencies, 99) * 1000, 4) if latencies else None,
+        "peak_rss_mb": _peak_rss_mb(),
+        "checksum": digest.hexdigest()[:16],
+        **extra,
+    }
+
+def bench_clean_text(path, options):
+    from analyze import clean_text
+    reviews = _read_reviews(path)
+    digest = hashlib.sha256()
+    latencies = []
+    start = time.perf_counter()
+    for text in reviews:
+        t0 = time.perf_counter()
+        cleaned = clean_text(text)
+        latencies.append(time.perf_counter() - t0)
+        digest.update(cleaned.encode("utf-8"))
+        digest.update(b"\0")
+    return _result(len(reviews), time.perf_counter() - start, latencies, digest)
+
+def bench_extraction(path, options):
+    import analyze
+    nlp = analyze.get_nlp()
+    analyze.get_rule_engine()
+    reviews = _read_reviews(path)[:options.latency_sample]
+    digest = hashlib.sha256()
+    latencies = []
+    start = time.perf_counter()
+    for text in reviews:
+        t0 = time.perf_counter()
+        results = analyze.extract_aspects(nlp(analyze.clean_text(text)))
+        latencies.append(time.perf_counter() - t0)
+        # the legacy walker returns its results in set order, sort so both engines hash the same
+        digest.update(json.dumps(sorted(results, key=lambda r: json.dumps(r, sort_keys=True)), sort_keys=True).encode("utf-8"))
+    return _result(len(reviews), time.perf_counter() - start, latencies, digest)
+
+def bench_dataset(path, options):
+    import analyze
+    analyze.preload()
+    batch_times = []
+    per_doc = []
+    last = [time.perf_counter(), 0]
+    def progress(batches_done, rows_done):
+        now = time.perf_counter()
+        batch_times.append(now - last[0])
+        # per-doc latency here is the batch time spread over its rows
+        per_doc.append(batch_times[-1] / max(rows_done - last[1], 1))
+        last[:] = [now, rows_done]
+
+    with tempfile.TemporaryDirectory() as tmp:
+        output_path = os.path.join(tmp, "out.csv")
+        start = time.perf_counter()
+        last[0] = start
+        stats = analyze.process_dataset(path, output_path, review_column_name="review", batch_size=options.batch_size,
+                                        n_workers=options.workers, progress_callback=progress)
+        seconds = time.perf_counter() - start
+        if stats is None:
+            raise RuntimeError(f"process_dataset failed on {path}")
+        digest = _hash_dataset_output(output_path)
+
+    return _result(stats["rows"], seconds, per_doc, digest, batches=stats["batches"], workers=options.workers,
+                   batch_p99_s=round(_percentile(batch_times, 99), 4) if batch_times else None)
+
+def _hash_dataset_output(output_path):
+    import pandas as pd
+    digest = hashlib.sha256()
+    for chunk in pd.read_csv(output_path, usecols=["id", "aspect_sentiments"], chunksize=50_000):
+        for row_id, value in zip(chunk["id"], chunk["aspect_sentiments"]):
+            results = sorted(json.loads(value), key=lambda r: json.dumps(r, sort_keys=True))
+            digest.update(f"{row_id}\t{json.dumps(results, sort_keys=True)}\n".encode("utf-8"))
+    return digest
+
+def bench_sentiment(path, options):
+    import analyze
+    nlp = analyze.get_nlp()
+    backend = analyze.get_sentiment_backend()
+    # parsing isn't what's measured here, only the scoring of the sentences it gives
+    sentences = [sent for doc in nlp.pipe(analyze.clean_text(text) for text in _read_reviews(path)) for sent in doc.sents]
+    texts = [sent.text for sent in sentences]
+
+    digest = hashlib.sha256()
+    latencies = []
+    scores = []
+    start = time.perf_counter()
+    for i in range(0, len(sentences), options.batch_size):
+        t0 = time.perf_counter()
+        batch = backend.score(sentences[i:i + options.batch_size], texts[i:i + options.batch_size])
+        latencies.append((time.perf_counter() - t0) / max(len(batch), 1))
+        scores.extend(batch)
+    seconds = time.perf_counter() - start
+    for score in scores:
+        digest.update(f"{score}\n".encode("utf-8"))
+
+    diffs = [abs(score - analyze.analyzer.polarity_scores(text)["compound"]) for score, text in zip(scores, texts)]
+    off = sum(diff > SENTIMENT_TOLERANCE for diff in diffs)
+    if diffs and off / len(diffs) > SENTIMENT_MAX_OFF_SHARE:
+        raise RuntimeError(f"{analyze.SENTIMENT_BACKEND} backend is off by more than {SENTIMENT_TOLERANCE} on {off} of {len(diffs)} sentences")
+    return _result(len(sentences), seconds, latencies, digest, backend=analyze.SENTIMENT_BACKEND,
+                   max_abs_diff=round(max(diffs, default=0.0), 4),
+                   mean_abs_diff=round(sum(diffs) / len(diffs), 6) if diffs else None, off_tolerance=off)
+
+def fixture_pages():
+    """(name, html) for the saved pages plus a generated 500-review page per layout"""
+    pages = []
+    for path in sorted(glob.glob(os.path.join(BENCH_DIR, "fixtures", "*.html"))):
+        with open(path, encoding="utf-8") as f:
+            pages.append((os.path.basename(path), f.read()))
+    for i, layout in enumerate(PAGE_LAYOUTS):
+        pages.append((f"generated-{layout}-500", listing_page(1000 + i, reviews=500, layout=layout)))
+    return pages
+
+def bench_scraper(_, options):
+    from scraper import make_soup, extract_reviews_with_multiple_methods
+    pages = fixture_pages()
+    digest = hashlib.sha256()
+    latencies = []
+    reviews_found = 0
+    start = time.perf_counter()
+    for _ in range(options.scraper_rounds):
+        for name, html in pages:
+            t0 = time.perf_counter()
+            reviews = extract_reviews_with_multiple_methods(make_soup(html))
+            latencies.append(time.perf_counter() - t0)
+            reviews_found += len(reviews)
+            digest.update(f"{name}\t{json.dumps(reviews, sort_keys=True)}\n".encode("utf-8"))
+    seconds = time.perf_counter() - start
+    return _result(len(latencies), seconds, latencies, digest, reviews=reviews_found,
+                   reviews_per_sec=round(reviews_found / seconds, 1) if seconds else None)
+
+BENCHMARKS = {
+    "clean_text": bench_clean_text,
+    "extraction": bench_extraction,
+    "dataset": bench_dataset,
+    "sentiment": bench_sentiment,
+    "scraper": bench_scraper,
+}
+
+def _run_case(case, path, options):
+    # the code under test prints progress, keep that out of the report
+    with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+        return BENCHMARKS[case](path, options)
+
+def run_case(case, path, options):
+    """Run one case in a fresh process, keeping the best of --repeat runs (checksums have to agree)"""
+    best = None
+    for _ in range(options.repeat):
+        with ProcessPoolExecutor(max_workers=1, mp_context=multiprocessing.get_context("fork")) as executor:
+            result = executor.submit(_run_case, case, path, options).result()
+        if best is not None and result["checksum"] != best["checksum"]:
+            raise RuntimeError(f"{case} gave different output on repeated runs ({best['checksum']} vs {result['checksum']})")
+        if best is None or (result["docs_per_sec"] or 0) > (best["docs_per_sec"] or 0):
+            best = result
+    return best
+
+def environment():
+    import spacy
+    env = {
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpus": os.cpu_count(),
+        "spacy": spacy.__version__,
+        "model_version": spacy.util.get_package_version("en_core_web_sm"),
+        "pipeline_profile": os.environ.get("SPACY_PIPELINE_PROFILE", "slim"),
+        "aspect_engine": os.environ.get("ASPECT_ENGINE", "rules"),
+        "sentiment_backend": os.environ.get("SENTIMENT_BACKEND", "vader"),
+        "html_parser": os.environ.get("HTML_PARSER", "html.parser"),
+    }
+    return env
+
+def compare(results, baseline, threshold):
+    """Lines describing each case against the baseline, and whether anything regressed"""
+    lines = []
+    failed = False
+    same_pipeline = all(baseline["environment"].get(key) == results["environment"].get(key)
+                        for key in ("spacy", "model_version", "pipeline_profile"))
+    if not same_pipeline:
+        lines.append("note: the baseline was recorded with a different spaCy/model/profile, checksum changes are only reported")
+
+    for name, current in results["results"].items():
+        previous = baseline["results"].get(name)
+        if previous is None:
+            lines.append(f"{name}: not in baseline")
+            continue
+        problems = []
+        if current["checksum"] != previous["checksum"]:
+            problems.append(f"output changed ({previous['checksum']} -> {current['checksum']})")
+            failed = failed or same_pipeline
+        if previous.get("docs_per_sec") and current.get("docs_per_sec"):
+            change = current["docs_per_sec"] / previous["docs_per_sec"] - 1
+            if change < -threshold:
+                problems.append(f"throughput down {-change:.0%}")
+                failed = True
+        if previous.get("peak_rss_mb") and current.get("peak_rss_mb"):
+            change = current["peak_rss_mb"] / previous["peak_rss_mb"] - 1
+            if change > threshold:
+                problems.append(f"peak RSS up {change:.0%}")
+                failed = True
+        if problems:
+            lines.append(f"{name}: FAIL " + ", ".join(problems))
+        else:
+            speed = ""
+            if previous.get("docs_per_sec") and current.get("docs_per_sec"):
+                speed = f" ({current['docs_per_sec'] / previous['docs_per_sec'] - 1:+.0%} docs/sec)"
+            lines.append(f"{name}: ok{speed}")
+    return lines, failed
+
+def print_table(results):
+    header = f"{'case':<28} {'docs':>9} {'docs/sec':>11} {'p50 ms':>9} {'p99 ms':>9} {'rss MB':>8}  checksum"
+    print(header)
+    print("-" * len(header))
+    for name, r in results.items():
+        p50 = "-" if r["p50_ms"] is None else f"{r['p50_ms']:.3f}"
+        p99 = "-" if r["p99_ms"] is None else f"{r['p99_ms']:.3f}"
+        print(f"{name:<28} {r['docs']:>9} {r['docs_per_sec'] or 0:>11.1f} {p50:>9} {p99:>9} {r['peak_rss_mb']:>8.1f}  {r['checksum']}")
+
+def _split(value, allowed, label):
+    items = [item.strip() for item in value.split(",") if item.strip()]
+    unknown = [item for item in items if item not in allowed]
+    if unknown:
+        raise SystemExit(f"Unknown {label}: {', '.join(unknown)} (expected some of {', '.join(allowed)})")
+    return items
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Offline benchmarks for the analysis and scraping hot paths")
+    parser.add_argument("--cases", default=",".join(CASES))
+    parser.add_argument("--kinds", default=",".join(KINDS))
+    parser.add_argument("--sizes", default="1k")
+    parser.add_argument("--workers", type=int, default=1, help="n_workers for the dataset case")
+    parser.add_argument("--batch-size", type=int, default=500)
+    parser.add_argument("--latency-sample", type=int, default=2000, help="reviews timed one by one in the extraction case")
+    parser.add_argument("--scraper-rounds", type=int, default=3)
+    parser.add_argument("--repeat", type=int, default=1, help="runs per case, the fastest is kept")
+    parser.add_argument("--data-dir", default=os.path.join(BENCH_DIR, "data"))
+    parser.add_argument("--baseline", default=os.path.join(BENCH_DIR, "baseline.json"))
+    parser.add_argument("--threshold", type=float, default=0.15, help="allowed throughput drop / RSS growth, 0.15 = 15%%")
+    parser.add_argument("--save-baseline", action="store_true", help="write the results to --baseline instead of comparing")
+    parser.add_argument("--output", help="also write the results as JSON here")
+    options = parser.parse_args(argv)
+
+    cases = _split(options.cases, CASES, "cases")
+    kinds = _split(options.kinds, KINDS, "corpus kinds")
+    sizes = _split(options.sizes, list(SIZES), "sizes")
+
+    results = {"options": {"workers": options.workers, "batch_size": options.batch_size}, "results": {}}
+    for case in cases:
+        if case == "scraper":
+            print(f"Running {case}...")
+            results["results"][case] = run_case(case, None, options)
+            continue
+        for size in sizes:
+            for kind in kinds:
+                path = corpus_path(kind, size, options.data_dir)
+                name = f"{case}/{kind}-{size}"
+                print(f"Running {name}...")
+                results["results"][name] = run_case(case, path, options)
+
+    # only now, importing spaCy up front would count towards every case's RSS
+    results["environment"] = environment()
+    print()
+    print_table(results["results"])
+
+    if options.output:
+        with open(options.output, "w") as f:
+            json.dump(results, f, indent=2)
+
+    if options.save_baseline:
+        with open(options.baseline, "w") as f:
+            json.dump(results, f, indent=2)
+        print(f"\nBaseline saved to {options.baseline}")
+        return 0
+
+    if not os.path.exists(options.baseline):
+        print(f"\nNo baseline at {options.baseline}, run with --save-baseline to record one")
+        return 0
+    with open(options.baseline) as f:
+        baseline = json.load(f)
+    lines, failed = compare(results, baseline, options.threshold)
+    print(f"\nAgainst {options.baseline} (threshold {options.threshold:.0%}):")
+    for line in lines:
+        print("  " + line)
+    return 1 if failed else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,120 @@
+# pip install pyarrow  (only needed for the parquet / arrow output formats)
+
+import json
+import os
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:
+    pa = None
+    pq = None
+
+OUTPUT_FORMATS = ("csv", "parquet", "arrow")
+
+FILE_EXTENSIONS = {"csv": ".csv", "parquet": ".parquet", "arrow": ".arrow"}
+
+def aspects_path(output_path):
+    """The exploded aspect table sits next to the main output: reviews.parquet -> reviews.aspects.parquet"""
+    base, ext = os.path.splitext(output_path)
+    return f"{base}.aspects{ext}"
+
+def _aspect_struct():
+    return pa.struct([
+        ("aspect", pa.string()),
+        ("opinion", pa.string()),
+        ("context", pa.string()),
+        ("sentiment", pa.string()),
+        ("score", pa.float64()),
+    ])
+
+def _aspects_schema():
+    return pa.schema([
+        ("review_id", pa.int64()),
+        ("aspect", pa.string()),
+        ("opinion", pa.string()),
+        ("sentiment", pa.string()),
+        ("score", pa.float64()),
+        # where the context sentence starts in the cleaned review text, -1 if it can't be found
+        ("context_offset", pa.int32()),
+    ])
+
+class ColumnarWriter:
+    """Writes processed chunks as parquet row groups (or arrow record batches), one per batch.
+
+    The main file keeps the original columns and stores aspect_sentiments as a typed list<struct>
+    instead of a JSON string. A second file holds one row per aspect so it can be filtered and
+    aggregated without decoding anything.
+    """
+
+    def __init__(self, output_path, output_format="parquet"):
+        if pa is None:
+            raise RuntimeError("pyarrow is required for parquet/arrow output. Please run: pip install pyarrow")
+        if output_format not in ("parquet", "arrow"):
+            raise ValueError(f"Unsupported columnar format '{output_format}'")
+        self.output_path = output_path
+        self.aspects_path = aspects_path(output_path)
+        self.output_format = output_format
+        self.rows_written = 0
+        self._schema = None
+        self._writer = None
+        self._aspects_writer = None
+
+    def _open(self, path, schema):
+        if self.output_format == "parquet":
+            return pq.ParquetWriter(path, schema, compression="zstd")
+        return pa.ipc.new_file(path, schema)
+
+    def _write(self, writer, table):
+        if self.output_format == "parquet":
+            # the whole batch becomes a single row group
+            writer.write_table(table, row_group_size=max(table.num_rows, 1))
+        else:
+            writer.write_table(table)
+
+    def write(self, chunk, analysis_results, cleaned_reviews):
+        """chunk: original rows, analysis_results: JSON strings per row, cleaned_reviews: the texts that were analyzed"""
+        results = [json.loads(result) for result in analysis_results]
+
+        # nullable dtypes keep a column's arrow type stable when a later batch has gaps in it
+        base = chunk.drop(columns=["aspect_sentiments"], errors="ignore").convert_dtypes()
+        if self._schema is None:
+            table = pa.Table.from_pandas(base, preserve_index=False)
+            # a column that's empty in the first batch has no real type yet, store it as text
+            for i, field in enumerate(table.schema):
+                if table.column(i).null_count == table.num_rows and not pa.types.is_string(field.type):
+                    table = table.set_column(i, pa.field(field.name, pa.string()), table.column(i).cast(pa.string()))
+            table = table.append_column("aspect_sentiments", pa.array(results, type=pa.list_(_aspect_struct())))
+            self._schema = table.schema
+            self._writer = self._open(self.output_path, self._schema)
+            self._aspects_writer = self._open(self.aspects_path, _aspects_schema())
+        else:
+            try:
+                table = pa.Table.from_pandas(base, schema=self._schema.remove(self._schema.get_field_index("aspect_sentiments")),
+                                             preserve_index=False)
+            except (pa.ArrowInvalid, pa.ArrowTypeError) as e:
+                raise ValueError(f"Batch starting at row {self.rows_written} doesn't match the column types of the first batch: {e}")
+            table = table.append_column("aspect_sentiments", pa.array(results, type=pa.list_(_aspect_struct())))
+
+        self._write(self._writer, table)
+        self._write(self._aspects_writer, self._explode(results, cleaned_reviews))
+        self.rows_written += len(results)
+
+    def _explode(self, results, cleaned_reviews):
+        columns = {name: [] for name in _aspects_schema().names}
+        for i, (row_results, text) in enumerate(zip(results, cleaned_reviews)):
+            for item in row_results:
+                columns["review_id"].append(self.rows_written + i)
+                columns["aspect"].append(item["aspect"])
+                columns["opinion"].append(item["opinion"])
+                columns["sentiment"].append(item["sentiment"])
+                columns["score"].append(item["score"])
+                columns["context_offset"].append(text.find(item["context"]))
+        return pa.Table.from_pydict(columns, schema=_aspects_schema())
+
+    def close(self):
+        for writer in (self._writer, self._aspects_writer):
+            if writer is not None:
+                writer.close()
+        self._writer = None
+        self._aspects_writer = None
@@ -0,0 +1,176 @@
+import contextvars
+import csv
+import threading
+import time
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from urllib.parse import urljoin, urlparse, urlencode, parse_qsl, urlunparse
+
+import metrics
+from scraper import make_soup, extract_reviews_with_multiple_methods
+
+USER_AGENT = "Mozilla/5.0 (Macintosh; Intel Mac OS X 10_15_7) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36"
+
+CRAWL_FIELDS = ["Listing URL", "Page", "Reviewer Name", "Rating (out of 5)", "Review"]
+
+def fetch_page(url, timeout=30):
+    """Plain HTTP fetch, for review pages that don't need a browser to render"""
+    request = urllib.request.Request(url, headers={"User-Agent": USER_AGENT, "Accept": "text/html"})
+    with urllib.request.urlopen(request, timeout=timeout) as response:
+        charset = response.headers.get_content_charset() or "utf-8"
+        return response.read().decode(charset, errors="replace")
+
+def find_next_page_url(soup, current_url, page_param=None, page_number=1):
+    """URL of the next page of reviews, or None.
+
+    Looks for rel="next" links and "Next" pagination links first. If the site doesn't mark
+    them up and page_param is given, the page number in that query parameter is bumped instead.
+    """
+    link = soup.select_one("a[rel~='next'][href], link[rel~='next'][href]")
+    if link is None:
+        for anchor in soup.select("a[href]"):
+            label = (anchor.get("aria-label") or anchor.get_text(strip=True)).lower()
+            if label in ("next", "next page", "›", "»") or label.startswith("next page"):
+                link = anchor
+                break
+    if link is not None:
+        return urljoin(current_url, link["href"])
+
+    if page_param:
+        parts = urlparse(current_url)
+        query = dict(parse_qsl(parts.query))
+        query[page_param] = str(page_number + 1)
+        return urlunparse(parts._replace(query=urlencode(query)))
+    return None
+
+class HostLimiter:
+    """Per-host politeness: at most max_concurrent requests in flight and min_interval seconds between starts"""
+
+    def __init__(self, min_interval=1.0, max_concurrent=1):
+        self.min_interval = min_interval
+        self.max_concurrent = max_concurrent
+        self._lock = threading.Lock()
+        self._hosts = {}
+
+    def _host_state(self, host):
+        with self._lock:
+            if host not in self._hosts:
+                self._hosts[host] = [threading.Semaphore(self.max_concurrent), threading.Lock(), 0.0]
+            return self._hosts[host]
+
+    def fetch(self, url, fetch):
+        semaphore, start_lock, _ = state = self._host_state(urlparse(url).netloc)
+        with semaphore:
+            with start_lock:
+                wait_for = state[2] + self.min_interval - time.monotonic()
+                if wait_for > 0:
+                    time.sleep(wait_for)
+                state[2] = time.monotonic()
+            return fetch(url)
+
+class _RowWriter:
+    """Appends rows to a CSV or parquet file as pages come in, the format follows the file extension"""
+
+    def __init__(self, output_path):
+        self.output_path = output_path
+        self.is_parquet = output_path.endswith(".parquet")
+        if self.is_parquet:
+            import pyarrow as pa
+            import pyarrow.parquet as pq
+            self._pa = pa
+            self._schema = pa.schema([(field, pa.string()) for field in CRAWL_FIELDS])
+            self._writer = pq.ParquetWriter(output_path, self._schema)
+        else:
+            self._file = open(output_path, "w", newline="", encoding="utf-8")
+            self._writer = csv.DictWriter(self._file, fieldnames=CRAWL_FIELDS)
+            self._writer.writeheader()
+
+    def write(self, rows):
+        if not rows:
+            return
+        if self.is_parquet:
+            columns = {field: [str(row[field]) for row in rows] for field in CRAWL_FIELDS}
+            self._writer.write_table(self._pa.Table.from_pydict(columns, schema=self._schema))
+        else:
+            self._writer.writerows(rows)
+            # flush per page so whatever is done is on disk even if the crawl dies later
+            self._file.flush()
+
+    def close(self):
+        if self.is_parquet:
+            self._writer.close()
+        else:
+            self._file.close()
+
+def crawl_reviews(urls, output_path, max_pages=50, concurrency=4, per_host_interval=1.0,
+                  per_host_concurrency=1, page_param=None, fetch=fetch_page):
+    """Scrape every review page of every listing in urls, streaming rows into output_path (.csv or .parquet).
+
+    Listings are crawled concurrently (up to `concurrency` pages in flight overall), each one following
+    its pagination until max_pages, a page with no new reviews, or no next page. Returns a small
+    summary dict.
+    """
+    print(f"--- Starting crawl of {len(urls)} listing(s) ---")
+    start_time = time.perf_counter()
+    limiter = HostLimiter(min_interval=per_host_interval, max_concurrent=per_host_concurrency)
+    writer = _RowWriter(output_path)
+    seen_reviews = {url: set() for url in urls}
+    visited = set()
+    summary = {"listings": len(seen_reviews), "pages": 0, "reviews": 0, "errors": 0, "output_path": output_path}
+
+    def crawl_page(listing_url, page_url, page_number):
+        with metrics.span("http_fetch"):
+            html = limiter.fetch(page_url, fetch)
+        with metrics.span("html_extract"):
+            soup = make_soup(html)
+            reviews = extract_reviews_with_multiple_methods(soup, method2_limit=None, method3_limit=None)
+            next_url = find_next_page_url(soup, page_url, page_param, page_number)
+        return listing_url, page_url, page_number, reviews, next_url
+
+    # pages are fetched on pool threads, carry the caller's context over so their timings land in its job
+    def submit(listing_url, page_url, page_number):
+        return executor.submit(contextvars.copy_context().run, crawl_page, listing_url, page_url, page_number)
+
+    try:
+        with ThreadPoolExecutor(max_workers=concurrency, thread_name_prefix="crawl") as executor:
+            in_flight = set()
+            # a listing given twice is crawled once, like a next page link to somewhere already visited
+            for url in urls:
+                if url in visited:
+                    continue
+                visited.add(url)
+                in_flight.add(submit(url, url, 1))
+
+            while in_flight:
+                done, in_flight = wait(in_flight, return_when=FIRST_COMPLETED)
+                for future in done:
+                    try:
+                        listing_url, page_url, page_number, reviews, next_url = future.result()
+                    except Exception as e:
+                        summary["errors"] += 1
+                        metrics.record_error("crawl")
+                        print(f"Failed to fetch a review page: {e}")
+                        continue
+
+                    summary["pages"] += 1
+                    new_rows = []
+                    for review in reviews:
+                        if review["Review"] in seen_reviews[listing_url]:
+                            continue
+                        seen_reviews[listing_url].add(review["Review"])
+                        new_rows.append({"Listing URL": listing_url, "Page": page_number, **review})
+                    writer.write(new_rows)
+                    summary["reviews"] += len(new_rows)
+                    metrics.count("reviews_scraped_total", len(new_rows))
+                    print(f"Page {page_number} of {listing_url}: {len(new_rows)} new reviews")
+
+                    # stop on the last page, on a page that only repeats what we have, or at the page limit
+                    if next_url and new_rows and page_number < max_pages and next_url not in visited:
+                        visited.add(next_url)
+                        in_flight.add(submit(listing_url, next_url, page_number + 1))
+    finally:
+        writer.close()
+
+    summary["seconds"] = round(time.perf_counter() - start_time, 3)
+    print(f"--- Crawl done: {summary['reviews']} reviews from {summary['pages']} pages in {summary['seconds']}s ---")
+    return summary
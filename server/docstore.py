@@ -0,0 +1,102 @@
+import json
+import mmap
+import os
+
+from spacy.tokens import DocBin
+
+# bump when the shard layout or the manifest changes
+DOCSTORE_FORMAT = 1
+
+MANIFEST_NAME = "manifest.json"
+
+def docs_path(output_path):
+    """Where process_dataset(save_docs=True) keeps the parsed docs of an output"""
+    return output_path + ".docs"
+
+class StaleDocs(ValueError):
+    """The saved docs are missing, incomplete, or from a different input or pipeline"""
+
+class DocStore:
+    """Parsed spaCy docs of a process_dataset run: one DocBin shard per batch and a manifest.json.
+
+    The manifest records the pipeline that parsed the docs (model, versions, profile, components)
+    and the input and chunking the shards line up with, so shards from anything else are rejected
+    instead of silently giving different results. Shards are written whole under a temporary name
+    and renamed into place, and read back through mmap. The object only holds paths, so it can be
+    handed to process pool workers, which write and read their own shards.
+    """
+
+    def __init__(self, directory):
+        self.directory = os.path.abspath(directory)
+        self.manifest_path = os.path.join(self.directory, MANIFEST_NAME)
+
+    def shard_path(self, index):
+        return os.path.join(self.directory, f"shard-{index:06d}.spacy")
+
+    def read_manifest(self):
+        try:
+            with open(self.manifest_path, encoding="utf-8") as f:
+                return json.load(f)
+        except (FileNotFoundError, ValueError):
+            return None
+
+    def _write_manifest(self, manifest):
+        tmp_path = self.manifest_path + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(manifest, f, indent=2)
+        os.replace(tmp_path, self.manifest_path)
+
+    def start(self, pipeline, source, keep_shards=0):
+        """Mark the store as being (re)written. Shards from keep_shards on are deleted, a resumed run keeps the ones it already committed"""
+        os.makedirs(self.directory, exist_ok=True)
+        # the old manifest goes first, a crash from here on leaves an incomplete store that won't be read
+        self._write_manifest({"format": DOCSTORE_FORMAT, "pipeline": pipeline, "source": source, "complete": False})
+        for name in os.listdir(self.directory):
+            if name.startswith("shard-") and name.endswith(".spacy"):
+                if int(name[len("shard-"):-len(".spacy")]) >= keep_shards:
+                    os.remove(os.path.join(self.directory, name))
+
+    def finish(self, pipeline, source, shards, rows):
+        """Write the final manifest once every shard is on disk"""
+        missing = [index for index in range(shards) if not os.path.exists(self.shard_path(index))]
+        if missing:
+            raise StaleDocs(f"{len(missing)} shards are missing from '{self.directory}' (first one: {missing[0]})")
+        self._write_manifest({
+            "format": DOCSTORE_FORMAT,
+            "pipeline": pipeline,
+            "source": source,
+            "complete": True,
+            "shards": shards,
+            "rows": rows,
+            "bytes": sum(os.path.getsize(self.shard_path(index)) for index in range(shards)),
+        })
+
+    def check(self, pipeline, source):
+        """The manifest if the store is complete and matches this pipeline and input, StaleDocs otherwise"""
+        manifest = self.read_manifest()
+        if manifest is None:
+            raise StaleDocs(f"No parsed docs in '{self.directory}'")
+        if manifest.get("format") != DOCSTORE_FORMAT:
+            raise StaleDocs(f"'{self.directory}' has docs in an older format ({manifest.get('format')})")
+        if not manifest.get("complete"):
+            raise StaleDocs(f"The docs in '{self.directory}' are incomplete, the run that saved them never finished")
+        if manifest["pipeline"] != pipeline:
+            raise StaleDocs(f"The docs in '{self.directory}' were parsed by a different pipeline: {manifest['pipeline']}")
+        if manifest["source"] != source:
+            raise StaleDocs(f"The docs in '{self.directory}' belong to a different input or batch size: {manifest['source']}")
+        return manifest
+
+    def write_shard(self, index, docs):
+        # user_data isn't used by the extraction and can hold things that don't serialize
+        doc_bin = DocBin(store_user_data=False, docs=docs)
+        path = self.shard_path(index)
+        tmp_path = path + ".tmp"
+        with open(tmp_path, "wb") as f:
+            f.write(doc_bin.to_bytes())
+        os.replace(tmp_path, path)
+
+    def read_shard(self, index, vocab):
+        # mapped instead of read, the compressed shard is decompressed straight from the page cache
+        with open(self.shard_path(index), "rb") as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as data:
+            doc_bin = DocBin().from_bytes(data)
+        return list(doc_bin.get_docs(vocab))
@@ -0,0 +1,37 @@
+# production server, run from the server folder:
+#   gunicorn -c gunicorn.conf.py app:app
+# pip install gunicorn
+
+import os
+
+from admission import limits_from_env
+
+bind = os.environ.get("BIND", "0.0.0.0:8080")
+workers = int(os.environ.get("WEB_WORKERS", 2))
+
+# the app is imported once in the master and the workers are forked from it, so the spaCy model
+# (loaded at import with PRELOAD_MODEL=1) is shared copy-on-write instead of loaded once per worker
+preload_app = True
+os.environ.setdefault("PRELOAD_MODEL", "1")
+
+# threads inside each worker. The endpoint limits in admission.py are per worker and every queued
+# request holds a thread while it waits, so there's one thread for each of those plus some spare for
+# the cheap endpoints (/metrics, job status). With fewer, requests back up in gunicorn's own accept
+# queue where no 429 can be sent
+worker_class = "gthread"
+threads = int(os.environ.get("WEB_THREADS", sum(limit + queue_size for limit, queue_size in limits_from_env().values()) + 4))
+
+# gthread workers keep heartbeating during long requests, this only catches a worker that's stuck
+timeout = int(os.environ.get("WEB_TIMEOUT", 120))
+graceful_timeout = int(os.environ.get("WEB_GRACEFUL_TIMEOUT", 30))
+
+def post_worker_init(worker):
+    from app import app, job_manager
+    from analyze import start_worker_pool
+    # each worker forks its own ANALYSIS_WORKERS pool here, while it's still single threaded. Forked from
+    # the master it wouldn't survive the fork into the workers, forked later it could copy held locks
+    start_worker_pool(app.config['ANALYSIS_WORKERS'])
+    # jobs left unfinished by the last run are picked back up by the first worker only, every worker
+    # doing it would run them several times. A worker restarted later gets a new age and skips this
+    if worker.age == 1:
+        job_manager.resume_pending()
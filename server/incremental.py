@@ -0,0 +1,140 @@
+import hashlib
+import json
+import os
+import sqlite3
+
+import pandas as pd
+
+from sqlite_store import connect, select_in
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:
+    pa = None
+    pq = None
+
+def content_hash(cleaned_text):
+    return hashlib.blake2b(cleaned_text.encode("utf-8"), digest_size=16).hexdigest()
+
+def key_values(series):
+    """Key column values as strings (None for gaps). 42 and 42.0 come out the same, pandas turns an int column with gaps into floats"""
+    keys = []
+    for value in series.tolist():
+        if pd.isna(value):
+            keys.append(None)
+        elif isinstance(value, float) and value.is_integer():
+            keys.append(str(int(value)))
+        else:
+            keys.append(str(value))
+    return keys
+
+def _output_chunks(output_path, columns, chunksize):
+    """The given columns of a process_dataset output (csv, parquet or arrow) as DataFrames, aspect_sentiments as JSON strings"""
+    ext = os.path.splitext(output_path)[1].lower()
+    if ext == ".csv":
+        yield from pd.read_csv(output_path, usecols=columns, chunksize=chunksize, on_bad_lines="skip")
+        return
+
+    if pa is None:
+        raise RuntimeError("pyarrow is required to read parquet/arrow outputs. Please run: pip install pyarrow")
+    if ext == ".parquet":
+        batches = pq.ParquetFile(output_path).iter_batches(batch_size=chunksize, columns=columns)
+    else:
+        reader = pa.ipc.open_file(output_path)
+        batches = (reader.get_batch(i).select(columns) for i in range(reader.num_record_batches))
+    for batch in batches:
+        frame = batch.to_pandas()
+        # typed list<struct> in the columnar formats, same JSON string the csv output holds
+        frame["aspect_sentiments"] = [json.dumps([dict(item) for item in items]) for items in frame["aspect_sentiments"]]
+        yield frame
+
+class PreviousResults:
+    """The aspect_sentiments of an earlier output, indexed on disk so an incremental run can copy them over.
+
+    With a key column, rows are matched on it and only reused if their review text hasn't changed.
+    Without one, the hash of the cleaned review text is the key. The index is a SQLite file next to
+    the previous output (<output>.index.db). It is rebuilt whenever that output or the key settings
+    change. The object only holds paths, so it can be handed to process pool workers.
+    """
+
+    def __init__(self, output_path, review_column, key_column=None):
+        self.output_path = os.path.abspath(output_path)
+        self.index_path = self.output_path + ".index.db"
+        self.review_column = review_column
+        self.key_column = key_column
+
+    def _connect(self, path=None):
+        # read by pool workers while nothing writes to it, no need for WAL
+        return connect(path or self.index_path, wal=False)
+
+    def _signature(self):
+        stat = os.stat(self.output_path)
+        return json.dumps({
+            "size": stat.st_size,
+            "mtime_ns": stat.st_mtime_ns,
+            "review_column": self.review_column,
+            "key_column": self.key_column,
+        }, sort_keys=True)
+
+    def _indexed_signature(self):
+        if not os.path.exists(self.index_path):
+            return None
+        try:
+            with self._connect() as conn:
+                row = conn.execute("SELECT signature FROM meta WHERE id = 0").fetchone()
+        except sqlite3.DatabaseError:
+            return None
+        return row[0] if row else None
+
+    def build(self, hash_review, chunksize=10_000):
+        """Index the previous output unless an up to date index is already there, returns the number of indexed rows.
+
+        hash_review(text) must give the same hash the analysis does for a review (content_hash of the cleaned text).
+        """
+        signature = self._signature()
+        if self._indexed_signature() == signature:
+            with self._connect() as conn:
+                return conn.execute("SELECT COUNT(*) FROM rows").fetchone()[0]
+
+        columns = [self.review_column, "aspect_sentiments"]
+        if self.key_column is not None and self.key_column not in columns:
+            columns.append(self.key_column)
+        # built under a temporary name, a crash halfway never leaves a partial index behind
+        tmp_path = self.index_path + ".tmp"
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        with self._connect(tmp_path) as conn:
+            conn.executescript("""
+                CREATE TABLE rows (key TEXT PRIMARY KEY, hash TEXT NOT NULL, result TEXT NOT NULL);
+                CREATE TABLE meta (id INTEGER PRIMARY KEY CHECK (id = 0), signature TEXT NOT NULL);
+            """)
+            for frame in _output_chunks(self.output_path, columns, chunksize):
+                hashes = [hash_review(review) for review in frame[self.review_column].fillna("").astype(str)]
+                keys = key_values(frame[self.key_column]) if self.key_column is not None else hashes
+                # a duplicated key keeps its last row
+                conn.executemany(
+                    "INSERT OR REPLACE INTO rows (key, hash, result) VALUES (?, ?, ?)",
+                    [(key, text_hash, result) for key, text_hash, result in zip(keys, hashes, frame["aspect_sentiments"]) if key is not None],
+                )
+            conn.execute("INSERT INTO meta (id, signature) VALUES (0, ?)", (signature,))
+            rows = conn.execute("SELECT COUNT(*) FROM rows").fetchone()[0]
+        os.replace(tmp_path, self.index_path)
+        return rows
+
+    def lookup(self, keys, hashes):
+        """{row position: previous result} for the rows of a batch that are unchanged since the previous output"""
+        wanted = {}
+        for i, (key, text_hash) in enumerate(zip(keys, hashes)):
+            key = key if self.key_column is not None else text_hash
+            if key is not None:
+                wanted.setdefault(key, []).append(i)
+
+        found = {}
+        with self._connect() as conn:
+            for rows in select_in(conn, "SELECT key, hash, result FROM rows WHERE key IN ({placeholders})", wanted):
+                for key, text_hash, result in rows:
+                    for i in wanted[key]:
+                        if hashes[i] == text_hash:
+                            found[i] = result
+        return found
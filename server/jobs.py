@@ -0,0 +1,189 @@
+import json
+import os
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import nullcontext
+
+import metrics
+from sqlite_store import connect
+from analyze import ProcessingCancelled
+
+# job lifecycle: queued -> running -> done / failed / cancelled
+QUEUED = "queued"
+RUNNING = "running"
+DONE = "done"
+FAILED = "failed"
+CANCELLED = "cancelled"
+FINISHED_STATUSES = (DONE, FAILED, CANCELLED)
+
+JOB_FIELDS = [
+    "id", "kind", "status", "params", "output_path", "download_name",
+    "batches_done", "rows_done", "error", "stats", "cancel_requested",
+    "created_at", "started_at", "finished_at",
+]
+
+class JobStore:
+    """Jobs live in a small SQLite file so they survive restarts and every server process sees them"""
+
+    def __init__(self, db_path):
+        self.db_path = db_path
+        os.makedirs(os.path.dirname(db_path) or ".", exist_ok=True)
+        with self._connect() as conn:
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS jobs (
+                    id TEXT PRIMARY KEY,
+                    kind TEXT NOT NULL,
+                    status TEXT NOT NULL,
+                    params TEXT NOT NULL,
+                    output_path TEXT,
+                    download_name TEXT,
+                    batches_done INTEGER NOT NULL DEFAULT 0,
+                    rows_done INTEGER NOT NULL DEFAULT 0,
+                    error TEXT,
+                    stats TEXT,
+                    cancel_requested INTEGER NOT NULL DEFAULT 0,
+                    created_at REAL NOT NULL,
+                    started_at REAL,
+                    finished_at REAL
+                )
+            """)
+
+    def _connect(self):
+        return connect(self.db_path)
+
+    def create(self, kind, params, output_path, download_name):
+        job_id = uuid.uuid4().hex
+        with self._connect() as conn:
+            conn.execute(
+                "INSERT INTO jobs (id, kind, status, params, output_path, download_name, created_at) VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (job_id, kind, QUEUED, json.dumps(params), output_path, download_name, time.time()),
+            )
+        return job_id
+
+    def get(self, job_id):
+        with self._connect() as conn:
+            row = conn.execute(f"SELECT {', '.join(JOB_FIELDS)} FROM jobs WHERE id = ?", (job_id,)).fetchone()
+        if row is None:
+            return None
+        job = dict(zip(JOB_FIELDS, row))
+        job["params"] = json.loads(job["params"])
+        job["stats"] = json.loads(job["stats"]) if job["stats"] else None
+        job["cancel_requested"] = bool(job["cancel_requested"])
+        return job
+
+    def update(self, job_id, **fields):
+        if "stats" in fields and fields["stats"] is not None:
+            fields["stats"] = json.dumps(fields["stats"])
+        assignments = ", ".join(f"{name} = ?" for name in fields)
+        with self._connect() as conn:
+            conn.execute(f"UPDATE jobs SET {assignments} WHERE id = ?", (*fields.values(), job_id))
+
+    def request_cancel(self, job_id):
+        with self._connect() as conn:
+            conn.execute("UPDATE jobs SET cancel_requested = 1 WHERE id = ?", (job_id,))
+            # a job nobody has picked up yet can be cancelled right away
+            conn.execute(
+                "UPDATE jobs SET status = ?, finished_at = ? WHERE id = ? AND status = ?",
+                (CANCELLED, time.time(), job_id, QUEUED),
+            )
+
+    def claim(self, job_id):
+        """Atomically move a queued job to running, False if someone else got it or it was cancelled"""
+        with self._connect() as conn:
+            cursor = conn.execute(
+                "UPDATE jobs SET status = ?, started_at = ? WHERE id = ? AND status = ?",
+                (RUNNING, time.time(), job_id, QUEUED),
+            )
+            return cursor.rowcount == 1
+
+    def unfinished_ids(self):
+        with self._connect() as conn:
+            rows = conn.execute(
+                "SELECT id FROM jobs WHERE status IN (?, ?) ORDER BY created_at", (QUEUED, RUNNING)
+            ).fetchall()
+        return [row[0] for row in rows]
+
+
+class JobManager:
+    """Runs jobs on a local thread pool. runners maps a job kind to fn(job, progress) -> stats dict or None
+
+    With profiling=True a job submitted with params["profile"] set runs under the sampling profiler,
+    which writes collapsed stacks to <output_path>.profile.folded.
+    """
+
+    def __init__(self, store, runners, max_workers=2, profiling=False):
+        self.store = store
+        self.runners = runners
+        self.profiling = profiling
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="job")
+
+    def submit(self, kind, params, output_path, download_name):
+        if kind not in self.runners:
+            raise ValueError(f"Unknown job kind '{kind}'")
+        job_id = self.store.create(kind, params, output_path, download_name)
+        self._executor.submit(self._run, job_id)
+        return job_id
+
+    def cancel(self, job_id):
+        self.store.request_cancel(job_id)
+
+    def resume_pending(self):
+        """Re-queue jobs that were queued or mid-run when the server last stopped, call once at startup"""
+        job_ids = self.store.unfinished_ids()
+        for job_id in job_ids:
+            self.store.update(job_id, status=QUEUED, batches_done=0, rows_done=0)
+            self._executor.submit(self._run, job_id)
+        if job_ids:
+            print(f"Resumed {len(job_ids)} unfinished job(s)")
+        return job_ids
+
+    def _run(self, job_id):
+        # a cancel may have landed while the job was queued
+        if not self.store.claim(job_id):
+            return
+        job = self.store.get(job_id)
+
+        def progress(batches_done, rows_done):
+            self.store.update(job_id, batches_done=batches_done, rows_done=rows_done)
+            if self.store.get(job_id)["cancel_requested"]:
+                raise ProcessingCancelled(job_id)
+
+        profile_path = None
+        if self.profiling and job["params"].get("profile"):
+            profile_path = f"{job['output_path'] or os.path.abspath(job_id)}.profile.folded"
+
+        print(f"Job {job_id} ({job['kind']}) started")
+        trace = metrics.Trace("job", job["kind"], job_id=job_id)
+        stats = None
+        error = None
+        try:
+            with metrics.tracing(trace), (metrics.profiled(profile_path) if profile_path else nullcontext()):
+                stats = self.runners[job["kind"]](job, progress)
+        except ProcessingCancelled:
+            status = CANCELLED
+            self.store.update(job_id, status=CANCELLED, finished_at=time.time())
+            print(f"Job {job_id} cancelled")
+        except Exception as e:
+            status, error = FAILED, str(e)
+            print(f"Job {job_id} failed: {e}")
+            self.store.update(job_id, status=FAILED, error=error, finished_at=time.time())
+        else:
+            if stats is None:
+                status, error = FAILED, "Processing failed, see the server log."
+                self.store.update(job_id, status=FAILED, error=error, finished_at=time.time())
+                print(f"Job {job_id} failed")
+            else:
+                status = DONE
+                stats["stages"] = trace.stage_summary()
+                if profile_path:
+                    stats["profile_path"] = profile_path
+                self.store.update(job_id, status=DONE, stats=stats, finished_at=time.time())
+                print(f"Job {job_id} done")
+
+        record = trace.as_dict()
+        metrics.registry.inc("jobs_total", kind=job["kind"], status=status)
+        metrics.registry.observe("job_seconds", record["seconds"], kind=job["kind"])
+        if status == FAILED:
+            metrics.record_error(f"job_{job['kind']}")
+        metrics.log_event("job", **record, status=status, error=error, profile_path=profile_path)
@@ -0,0 +1,283 @@
+import contextvars
+import json
+import logging
+import os
+import sys
+import threading
+import time
+from collections import Counter
+from contextlib import contextmanager
+
+PREFIX = "sentiment"
+
+# seconds, used for every duration histogram (stages, requests, jobs)
+DURATION_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 300)
+
+HELP = {
+    "stage_seconds": "Time spent per pipeline stage (per call, or per batch for the batched stages)",
+    "requests_total": "HTTP requests by endpoint, method and status",
+    "request_seconds": "HTTP request duration until the response is handed back (streaming bodies excluded)",
+    "jobs_total": "Background jobs by kind and final status",
+    "job_seconds": "Background job duration",
+    "rows_total": "Review rows analyzed",
+    "batches_total": "Batches analyzed",
+    "result_cache_hits_total": "Reviews served from the result cache",
+    "result_cache_misses_total": "Reviews that had to be analyzed",
+    "score_cache_hits_total": "Sentence scores served from the in-process cache",
+    "score_cache_misses_total": "Sentences scored by the sentiment backend",
+    "reused_rows_total": "Rows copied over from a previous output by an incremental run",
+    "long_reviews_total": "Reviews over LONG_REVIEW_CHARS that were parsed in sentence windows",
+    "reviews_scraped_total": "Reviews extracted from listing pages",
+    "errors_total": "Errors by where they happened",
+    "rejected_requests_total": "Requests turned away with 429/503 because their endpoint class was at capacity",
+    "inflight_requests": "Requests running per endpoint class in this process",
+    "queued_requests": "Requests waiting for a slot per endpoint class in this process",
+    "score_cache_entries": "Sentences held in the in-process score cache",
+    "model_load_seconds": "How long loading the spaCy model took",
+}
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+class MetricsRegistry:
+    """Process-wide counters, gauges and duration histograms, rendered in the Prometheus text format"""
+
+    def __init__(self, prefix=PREFIX):
+        self.prefix = prefix
+        self._lock = threading.Lock()
+        self._counters = {}
+        self._gauges = {}
+        # (name, labels) -> [per-bucket counts, sum, count]
+        self._histograms = {}
+
+    @staticmethod
+    def _key(name, labels):
+        return name, tuple(sorted((key, str(value)) for key, value in labels.items()))
+
+    def inc(self, name, value=1, **labels):
+        key = self._key(name, labels)
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + value
+
+    def set_gauge(self, name, value, **labels):
+        with self._lock:
+            self._gauges[self._key(name, labels)] = value
+
+    def observe(self, name, seconds, **labels):
+        key = self._key(name, labels)
+        with self._lock:
+            histogram = self._histograms.get(key)
+            if histogram is None:
+                histogram = self._histograms[key] = [[0] * len(DURATION_BUCKETS), 0.0, 0]
+            for i, bound in enumerate(DURATION_BUCKETS):
+                if seconds <= bound:
+                    histogram[0][i] += 1
+                    break
+            histogram[1] += seconds
+            histogram[2] += 1
+
+    def _labels(self, labels, extra=()):
+        pairs = list(labels) + list(extra)
+        if not pairs:
+            return ""
+        return "{" + ",".join(f'{key}="{_escape(value)}"' for key, value in pairs) + "}"
+
+    def _header(self, lines, name, kind):
+        full_name = f"{self.prefix}_{name}"
+        if name in HELP:
+            lines.append(f"# HELP {full_name} {HELP[name]}")
+        lines.append(f"# TYPE {full_name} {kind}")
+        return full_name
+
+    def render(self):
+        with self._lock:
+            counters = dict(self._counters)
+            gauges = dict(self._gauges)
+            histograms = {key: (list(h[0]), h[1], h[2]) for key, h in self._histograms.items()}
+
+        lines = []
+        for kind, values in (("counter", counters), ("gauge", gauges)):
+            for name in sorted({name for name, _ in values}):
+                full_name = self._header(lines, name, kind)
+                for (metric, labels), value in sorted(values.items()):
+                    if metric == name:
+                        lines.append(f"{full_name}{self._labels(labels)} {value}")
+        for name in sorted({name for name, _ in histograms}):
+            full_name = self._header(lines, name, "histogram")
+            for (metric, labels), (buckets, total, count) in sorted(histograms.items()):
+                if metric != name:
+                    continue
+                cumulative = 0
+                for bound, bucket in zip(DURATION_BUCKETS, buckets):
+                    cumulative += bucket
+                    lines.append(f"{full_name}_bucket{self._labels(labels, [('le', bound)])} {cumulative}")
+                lines.append(f"{full_name}_bucket{self._labels(labels, [('le', '+Inf')])} {count}")
+                lines.append(f"{full_name}_sum{self._labels(labels)} {round(total, 6)}")
+                lines.append(f"{full_name}_count{self._labels(labels)} {count}")
+        return "\n".join(lines) + "\n"
+
+registry = MetricsRegistry()
+
+class Trace:
+    """Stage timings and counters for one request or job, written out as one structured log line at the end"""
+
+    def __init__(self, kind, name, **fields):
+        self.kind = kind
+        self.name = name
+        self.fields = fields
+        self.started = time.perf_counter()
+        self.stages = {}
+        self.counters = Counter()
+        self._lock = threading.Lock()
+
+    def add_stage(self, stage, seconds, calls=1):
+        with self._lock:
+            total = self.stages.setdefault(stage, [0.0, 0])
+            total[0] += seconds
+            total[1] += calls
+
+    def add(self, name, value=1):
+        with self._lock:
+            self.counters[name] += value
+
+    def stage_summary(self):
+        with self._lock:
+            return {stage: {"seconds": round(seconds, 4), "calls": calls} for stage, (seconds, calls) in self.stages.items()}
+
+    def as_dict(self):
+        return {
+            "kind": self.kind,
+            "name": self.name,
+            **self.fields,
+            "seconds": round(time.perf_counter() - self.started, 4),
+            "stages": self.stage_summary(),
+            "counters": dict(self.counters),
+        }
+
+_current_trace = contextvars.ContextVar("current_trace", default=None)
+
+def current_trace():
+    return _current_trace.get()
+
+@contextmanager
+def tracing(trace):
+    """Make trace the one spans and counters in this thread (and contexts copied from it) report into"""
+    token = _current_trace.set(trace)
+    try:
+        yield trace
+    finally:
+        _current_trace.reset(token)
+
+def start_trace(trace):
+    """Non-contextmanager version of tracing() for before/after request hooks, returns the token for end_trace"""
+    return _current_trace.set(trace)
+
+def end_trace(token):
+    _current_trace.reset(token)
+
+def record_stage(stage, seconds, calls=1):
+    registry.observe("stage_seconds", seconds, stage=stage)
+    trace = current_trace()
+    if trace is not None:
+        trace.add_stage(stage, seconds, calls)
+
+def record_stages(stage_seconds):
+    """Stage timings measured somewhere else (e.g. in a process_dataset worker), {stage: seconds}"""
+    for stage, seconds in stage_seconds.items():
+        record_stage(stage, seconds)
+
+@contextmanager
+def span(stage):
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        record_stage(stage, time.perf_counter() - start)
+
+def count(name, value=1, **labels):
+    registry.inc(name, value, **labels)
+    trace = current_trace()
+    if trace is not None:
+        trace.add(name, value)
+
+def record_error(where):
+    count("errors_total", where=where)
+
+class StageTimer:
+    """Adds up time per stage locally, for code that can't report into the registry directly (pool workers)"""
+
+    def __init__(self):
+        self.seconds = {}
+
+    @contextmanager
+    def stage(self, name):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.seconds[name] = self.seconds.get(name, 0.0) + time.perf_counter() - start
+
+# structured logs: one JSON object per line on stderr, METRICS_LOG=0 turns them off
+logger = logging.getLogger("sentiment.metrics")
+if not logger.handlers:
+    _handler = logging.StreamHandler(sys.stderr)
+    _handler.setFormatter(logging.Formatter("%(message)s"))
+    logger.addHandler(_handler)
+    logger.propagate = False
+logger.setLevel(logging.INFO if os.environ.get("METRICS_LOG", "1") != "0" else logging.WARNING)
+
+def log_event(event, **fields):
+    if logger.isEnabledFor(logging.INFO):
+        logger.info(json.dumps({"ts": round(time.time(), 3), "event": event, **fields}, default=str))
+
+class SamplingProfiler:
+    """Samples one thread's Python stack every `interval` seconds and writes the result as collapsed
+    stacks ("outer;inner;leaf count" per line), the input format of flamegraph.pl and speedscope.
+
+    Only the sampled thread is seen, so work done in pool worker processes doesn't show up.
+    """
+
+    def __init__(self, thread_id=None, interval=0.005):
+        self.thread_id = thread_id if thread_id is not None else threading.get_ident()
+        self.interval = interval
+        self.samples = Counter()
+        self._stop = threading.Event()
+        self._thread = None
+
+    def start(self):
+        self._thread = threading.Thread(target=self._run, name="sampling-profiler", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            if frame is None:
+                continue
+            stack = []
+            while frame is not None:
+                code = frame.f_code
+                stack.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})")
+                frame = frame.f_back
+            self.samples[";".join(reversed(stack))] += 1
+
+    def write(self, path):
+        with open(path, "w", encoding="utf-8") as f:
+            for stack, samples in self.samples.most_common():
+                f.write(f"{stack} {samples}\n")
+        return path
+
+@contextmanager
+def profiled(path, interval=0.005):
+    """Profile the calling thread for the duration of the block and write collapsed stacks to path"""
+    profiler = SamplingProfiler(interval=interval).start()
+    try:
+        yield profiler
+    finally:
+        profiler.stop()
+        profiler.write(path)
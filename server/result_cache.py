@@ -0,0 +1,92 @@
+import hashlib
+import os
+import time
+
+from sqlite_store import connect, select_in
+
+class ResultCache:
+    """Analyzed results on disk, keyed on a hash of the cleaned review text plus the pipeline version.
+
+    Values are the JSON strings process_dataset writes, so a hit can go straight into the output.
+    Once the stored values grow past max_bytes the least recently used ones are evicted.
+    """
+
+    # rows dropped per eviction round
+    EVICT_BATCH = 100
+
+    def __init__(self, db_path, max_bytes=512 * 1024 * 1024):
+        self.db_path = db_path
+        self.max_bytes = max_bytes
+        os.makedirs(os.path.dirname(db_path) or ".", exist_ok=True)
+        with self._connect() as conn:
+            conn.executescript("""
+                CREATE TABLE IF NOT EXISTS results (
+                    key TEXT PRIMARY KEY,
+                    value TEXT NOT NULL,
+                    size INTEGER NOT NULL,
+                    last_used REAL NOT NULL
+                );
+                CREATE INDEX IF NOT EXISTS results_last_used ON results (last_used);
+                CREATE TABLE IF NOT EXISTS meta (id INTEGER PRIMARY KEY CHECK (id = 0), total_bytes INTEGER NOT NULL);
+                INSERT OR IGNORE INTO meta (id, total_bytes) VALUES (0, 0);
+                CREATE TRIGGER IF NOT EXISTS results_added AFTER INSERT ON results
+                    BEGIN UPDATE meta SET total_bytes = total_bytes + NEW.size WHERE id = 0; END;
+                CREATE TRIGGER IF NOT EXISTS results_removed AFTER DELETE ON results
+                    BEGIN UPDATE meta SET total_bytes = total_bytes - OLD.size WHERE id = 0; END;
+            """)
+
+    def _connect(self):
+        return connect(self.db_path, synchronous="NORMAL")
+
+    @staticmethod
+    def make_key(cleaned_text, version):
+        return hashlib.blake2b(f"{version}\0{cleaned_text}".encode("utf-8"), digest_size=20).hexdigest()
+
+    def get_many(self, keys):
+        """Return {key: value} for the keys that are cached, and mark them as recently used"""
+        found = {}
+        now = time.time()
+        with self._connect() as conn:
+            for rows in select_in(conn, "SELECT key, value FROM results WHERE key IN ({placeholders})", keys):
+                found.update(rows)
+                if rows:
+                    hit_keys = [row[0] for row in rows]
+                    conn.execute(
+                        f"UPDATE results SET last_used = ? WHERE key IN ({', '.join('?' * len(hit_keys))})",
+                        (now, *hit_keys),
+                    )
+        return found
+
+    def put_many(self, items):
+        """Store {key: value}, then evict the least recently used entries if the cache is over its size limit"""
+        if not items:
+            return
+        now = time.time()
+        with self._connect() as conn:
+            conn.executemany(
+                "INSERT OR IGNORE INTO results (key, value, size, last_used) VALUES (?, ?, ?, ?)",
+                [(key, value, len(key) + len(value), now) for key, value in items.items()],
+            )
+            self._evict(conn)
+
+    def _evict(self, conn):
+        total_bytes = conn.execute("SELECT total_bytes FROM meta WHERE id = 0").fetchone()[0]
+        if total_bytes <= self.max_bytes:
+            return
+        # drop down to 90% so we don't evict again on the very next write
+        target = int(self.max_bytes * 0.9)
+        while total_bytes > target:
+            conn.execute(
+                "DELETE FROM results WHERE key IN (SELECT key FROM results ORDER BY last_used LIMIT ?)",
+                (self.EVICT_BATCH,),
+            )
+            new_total = conn.execute("SELECT total_bytes FROM meta WHERE id = 0").fetchone()[0]
+            if new_total == total_bytes:
+                break
+            total_bytes = new_total
+
+    def stats(self):
+        with self._connect() as conn:
+            entries = conn.execute("SELECT COUNT(*) FROM results").fetchone()[0]
+            total_bytes = conn.execute("SELECT total_bytes FROM meta WHERE id = 0").fetchone()[0]
+        return {"entries": entries, "bytes": total_bytes, "max_bytes": self.max_bytes}
@@ -0,0 +1,128 @@
+import csv
+import hashlib
+import io
+import os
+import time
+from urllib.parse import urlparse, urlunparse, parse_qsl, urlencode
+
+from sqlite_store import connect
+
+REVIEW_FIELDS = ["Reviewer Name", "Rating (out of 5)", "Review"]
+
+# query parameters that only track where the click came from, they don't change the page
+TRACKING_PARAMS = ("ref", "sts", "click_key", "click_sum", "pro", "frs", "plkey")
+TRACKING_PREFIXES = ("utm_", "ga_", "ls_", "sr_", "organic_search_click")
+
+def canonicalize_url(url):
+    """Same listing -> same key: lower-case host, no fragment, no tracking params, sorted query, no trailing slash"""
+    parts = urlparse(url.strip())
+    host = parts.netloc.lower()
+    query = sorted(
+        (key, value) for key, value in parse_qsl(parts.query, keep_blank_values=True)
+        if key not in TRACKING_PARAMS and not key.startswith(TRACKING_PREFIXES)
+    )
+    path = parts.path.rstrip("/") or "/"
+    return urlunparse((parts.scheme.lower() or "https", host, path, "", urlencode(query), ""))
+
+def review_hash(review_text):
+    return hashlib.blake2b(" ".join(review_text.split()).encode("utf-8"), digest_size=16).hexdigest()
+
+class ScrapeCache:
+    """Scraped review sets per listing, so repeat submissions of a popular URL don't need a browser.
+
+    A refresh merges in only the reviews that weren't seen before (matched on a hash of the text).
+    """
+
+    def __init__(self, db_path):
+        self.db_path = db_path
+        os.makedirs(os.path.dirname(db_path) or ".", exist_ok=True)
+        with self._connect() as conn:
+            conn.executescript("""
+                CREATE TABLE IF NOT EXISTS listings (
+                    url TEXT PRIMARY KEY,
+                    fetched_at REAL NOT NULL
+                );
+                CREATE TABLE IF NOT EXISTS reviews (
+                    url TEXT NOT NULL,
+                    text_hash TEXT NOT NULL,
+                    reviewer_name TEXT,
+                    rating TEXT,
+                    review TEXT NOT NULL,
+                    first_seen REAL NOT NULL,
+                    PRIMARY KEY (url, text_hash)
+                );
+            """)
+
+    def _connect(self):
+        return connect(self.db_path)
+
+    def age(self, url):
+        """Seconds since the listing was last scraped, None if it never was"""
+        with self._connect() as conn:
+            row = conn.execute("SELECT fetched_at FROM listings WHERE url = ?", (canonicalize_url(url),)).fetchone()
+        return None if row is None else time.time() - row[0]
+
+    def reviews(self, url):
+        with self._connect() as conn:
+            rows = conn.execute(
+                "SELECT reviewer_name, rating, review FROM reviews WHERE url = ? ORDER BY first_seen, rowid",
+                (canonicalize_url(url),),
+            ).fetchall()
+        return [dict(zip(REVIEW_FIELDS, row)) for row in rows]
+
+    def merge(self, url, reviews):
+        """Add the reviews not already stored for this listing and mark it as freshly scraped, returns how many were new"""
+        key = canonicalize_url(url)
+        now = time.time()
+        with self._connect() as conn:
+            before = conn.total_changes
+            conn.executemany(
+                "INSERT OR IGNORE INTO reviews (url, text_hash, reviewer_name, rating, review, first_seen) VALUES (?, ?, ?, ?, ?, ?)",
+                [(key, review_hash(r["Review"]), r["Reviewer Name"], r["Rating (out of 5)"], r["Review"], now) for r in reviews],
+            )
+            added = conn.total_changes - before
+            conn.execute(
+                "INSERT INTO listings (url, fetched_at) VALUES (?, ?) ON CONFLICT(url) DO UPDATE SET fetched_at = excluded.fetched_at",
+                (key, now),
+            )
+        return added
+
+def reviews_to_csv(reviews):
+    """In-memory CSV in the same layout scrape_url writes, ready for process_dataset"""
+    buffer = io.StringIO()
+    writer = csv.DictWriter(buffer, fieldnames=REVIEW_FIELDS)
+    writer.writeheader()
+    writer.writerows(reviews)
+    buffer.seek(0)
+    return buffer
+
+def read_reviews_csv(csv_path):
+    with open(csv_path, newline="", encoding="utf-8") as f:
+        return [{field: row.get(field, "") for field in REVIEW_FIELDS} for row in csv.DictReader(f)]
+
+def scrape_with_cache(url, output_folder, cache, ttl, refresh=False, scrape=None):
+    """Reviews for a listing as an in-memory CSV, from the cache when it's fresh enough.
+
+    Returns (csv_buffer, info) or (None, info) when nothing could be scraped. `scrape` is
+    scraper.scrape_url (passed in so this module doesn't need selenium to import).
+    """
+    age = cache.age(url)
+    if not refresh and age is not None and age < ttl:
+        reviews = cache.reviews(url)
+        if reviews:
+            print(f"Using {len(reviews)} cached reviews for {canonicalize_url(url)} (scraped {age:.0f}s ago)")
+            return reviews_to_csv(reviews), {"cache": "hit", "age_seconds": round(age), "reviews": len(reviews), "new_reviews": 0}
+
+    scraped_csv_path = scrape(url, output_folder)
+    if scraped_csv_path is None:
+        # a failed refresh can still fall back to what we had
+        reviews = cache.reviews(url) if age is not None else []
+        if reviews:
+            print("Scrape failed, falling back to the cached reviews")
+            return reviews_to_csv(reviews), {"cache": "stale", "age_seconds": round(age), "reviews": len(reviews), "new_reviews": 0}
+        return None, {"cache": "miss", "reviews": 0, "new_reviews": 0}
+
+    added = cache.merge(url, read_reviews_csv(scraped_csv_path))
+    reviews = cache.reviews(url)
+    print(f"Scraped {canonicalize_url(url)}: {added} new reviews, {len(reviews)} known in total")
+    return reviews_to_csv(reviews), {"cache": "refresh" if age is not None else "miss", "reviews": len(reviews), "new_reviews": added}
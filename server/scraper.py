@@ -2,22 +2,37 @@ from selenium import webdriver
 from selenium.webdriver.chrome.service import Service as ChromeService
 from selenium.webdriver.common.by import By
 from selenium.webdriver.support.ui import WebDriverWait
-from selenium.webdriver.support import expected_conditions as EC
 from selenium.common.exceptions import TimeoutException, NoSuchElementException
-from bs4 import BeautifulSoup
+from bs4 import BeautifulSoup, NavigableString, Tag
+import bisect
 import csv
 import os
 import datetime, time
 import re
-import random
+import threading
+from contextlib import contextmanager
+
+import metrics
 
 URL = "https://www.etsy.com/in-en/listing/4364399853/eepy-cat-silly-sleepy-cat-unhinged"
 
-def setup_driver():
+# the pool runs headless by default, set BROWSER_HEADLESS=0 to watch the browser while debugging
+BROWSER_HEADLESS = os.environ.get('BROWSER_HEADLESS', '1') != '0'
+
+REVIEW_SELECTORS = [
+    "[data-test-id='review-card']",
+    ".shop2-review-review",
+    ".reviews-list .review",
+    "[data-region='review']",
+    ".review-text",
+    "[data-test-id='reviews-section'] [data-test-id]"
+]
+
+def setup_driver(headless=BROWSER_HEADLESS):
     """Setup Chrome driver with enhanced options"""
     options = webdriver.ChromeOptions()
-    # Remove headless mode for debugging - you can add it back later
-    # options.add_argument("--headless")
+    if headless:
+        options.add_argument("--headless=new")
     options.add_argument("--no-sandbox")
     options.add_argument("--disable-dev-shm-usage")
     options.add_argument("--disable-blink-features=AutomationControlled")
@@ -35,7 +50,186 @@ def setup_driver():
     
     return driver
 
-def scroll_to_reviews(driver):
+class DriverPool:
+    """Keeps up to max_size warm Chrome drivers around instead of launching one per scrape.
+
+    Drivers are health-checked when handed out and recycled after max_pages pages so a
+    long-running browser doesn't slowly leak memory. When every driver is busy, callers
+    queue for up to acquire_timeout seconds.
+    """
+
+    def __init__(self, max_size=2, max_pages=20, acquire_timeout=120, headless=BROWSER_HEADLESS):
+        self.max_size = max_size
+        self.max_pages = max_pages
+        self.acquire_timeout = acquire_timeout
+        self.headless = headless
+        self._cond = threading.Condition()
+        self._idle = []
+        self._pages = {}
+        self._created = 0
+        self._in_use = 0
+        self.metrics_counters = {
+            "drivers_started": 0,
+            "drivers_recycled": 0,
+            "health_check_failures": 0,
+            "acquire_timeouts": 0,
+            "pages": 0,
+            "acquire_wait_seconds_total": 0.0,
+            "acquire_wait_seconds_max": 0.0,
+            "page_seconds_total": 0.0,
+            "page_seconds_max": 0.0,
+        }
+
+    def _discard(self, driver):
+        with self._cond:
+            self._pages.pop(id(driver), None)
+            self._created -= 1
+            # a slot just opened up for whoever is waiting
+            self._cond.notify()
+        try:
+            driver.quit()
+        except Exception as e:
+            print(f"Error while quitting driver: {e}")
+
+    @staticmethod
+    def _is_healthy(driver):
+        try:
+            return driver.execute_script("return 1") == 1
+        except Exception:
+            return False
+
+    def acquire(self):
+        start_time = time.perf_counter()
+        deadline = start_time + self.acquire_timeout
+        while True:
+            driver = None
+            with self._cond:
+                while not self._idle and self._created >= self.max_size:
+                    remaining = deadline - time.perf_counter()
+                    if remaining <= 0:
+                        self.metrics_counters["acquire_timeouts"] += 1
+                        raise TimeoutException(f"No browser became free within {self.acquire_timeout}s")
+                    self._cond.wait(remaining)
+                if self._idle:
+                    # most recently used first, it's the warmest
+                    driver = self._idle.pop()
+                else:
+                    self._created += 1
+
+            if driver is None:
+                try:
+                    driver = setup_driver(headless=self.headless)
+                except Exception:
+                    with self._cond:
+                        self._created -= 1
+                        self._cond.notify()
+                    raise
+                with self._cond:
+                    self._pages[id(driver)] = 0
+                    self.metrics_counters["drivers_started"] += 1
+            elif not self._is_healthy(driver):
+                print("Browser failed its health check, replacing it...")
+                with self._cond:
+                    self.metrics_counters["health_check_failures"] += 1
+                self._discard(driver)
+                continue
+
+            waited = time.perf_counter() - start_time
+            with self._cond:
+                self._in_use += 1
+                self.metrics_counters["acquire_wait_seconds_total"] += waited
+                self.metrics_counters["acquire_wait_seconds_max"] = max(self.metrics_counters["acquire_wait_seconds_max"], waited)
+            return driver
+
+    def release(self, driver, page_seconds=None, healthy=True):
+        with self._cond:
+            self._in_use -= 1
+            self._pages[id(driver)] = self._pages.get(id(driver), 0) + 1
+            pages_served = self._pages[id(driver)]
+            self.metrics_counters["pages"] += 1
+            if page_seconds is not None:
+                self.metrics_counters["page_seconds_total"] += page_seconds
+                self.metrics_counters["page_seconds_max"] = max(self.metrics_counters["page_seconds_max"], page_seconds)
+
+        if not healthy or pages_served >= self.max_pages:
+            with self._cond:
+                self.metrics_counters["drivers_recycled"] += 1
+            self._discard(driver)
+            return
+
+        try:
+            # park it on a blank page so the old listing stops running scripts in the background
+            driver.get("about:blank")
+        except Exception:
+            self._discard(driver)
+            return
+        with self._cond:
+            self._idle.append(driver)
+            self._cond.notify()
+
+    @contextmanager
+    def driver(self):
+        """with pool.driver() as driver: ... - marks the driver unhealthy if the block raises"""
+        driver = self.acquire()
+        start_time = time.perf_counter()
+        healthy = True
+        try:
+            yield driver
+        except Exception:
+            healthy = False
+            raise
+        finally:
+            self.release(driver, page_seconds=time.perf_counter() - start_time, healthy=healthy)
+
+    def metrics(self):
+        with self._cond:
+            counters = dict(self.metrics_counters)
+            in_use = self._in_use
+            created = self._created
+            idle = len(self._idle)
+        pages = counters["pages"]
+        acquires = pages + in_use
+        return {
+            "max_size": self.max_size,
+            "drivers": created,
+            "in_use": in_use,
+            "idle": idle,
+            "utilization": round(in_use / self.max_size, 3) if self.max_size else 0.0,
+            "avg_acquire_wait_seconds": round(counters["acquire_wait_seconds_total"] / acquires, 3) if acquires else 0.0,
+            "avg_page_seconds": round(counters["page_seconds_total"] / pages, 3) if pages else 0.0,
+            **counters,
+        }
+
+    def close(self):
+        with self._cond:
+            idle, self._idle = self._idle, []
+        for driver in idle:
+            self._discard(driver)
+
+_driver_pool = None
+_driver_pool_lock = threading.Lock()
+
+def get_driver_pool():
+    """The shared pool used by scrape_url, sized by BROWSER_POOL_SIZE / BROWSER_MAX_PAGES"""
+    global _driver_pool
+    with _driver_pool_lock:
+        if _driver_pool is None:
+            _driver_pool = DriverPool(
+                max_size=int(os.environ.get('BROWSER_POOL_SIZE', 2)),
+                max_pages=int(os.environ.get('BROWSER_MAX_PAGES', 20)),
+                acquire_timeout=float(os.environ.get('BROWSER_ACQUIRE_TIMEOUT', 120)),
+            )
+        return _driver_pool
+
+def find_review_elements(driver):
+    """Returns (selector, elements) for the first review selector with matches, or None"""
+    for selector in REVIEW_SELECTORS:
+        elements = driver.find_elements(By.CSS_SELECTOR, selector)
+        if elements:
+            return selector, elements
+    return None
+
+def scroll_to_reviews(driver, step_timeout=2):
     """Scroll to reviews section to trigger loading"""
     print("Scrolling to load reviews...")
     
@@ -43,38 +237,29 @@ def scroll_to_reviews(driver):
     try:
         # Look for reviews heading or section
         reviews_section = driver.find_element(By.XPATH, "//h2[contains(text(), 'Reviews') or contains(text(), 'review')]")
-        driver.execute_script("arguments[0].scrollIntoView({behavior: 'smooth', block: 'center'});", reviews_section)
-        time.sleep(3)
+        driver.execute_script("arguments[0].scrollIntoView({block: 'center'});", reviews_section)
         return True
     except NoSuchElementException:
-        # If reviews heading not found, scroll down gradually
+        # If reviews heading not found, scroll down gradually, stopping as soon as reviews show up
         for i in range(5):
             driver.execute_script(f"window.scrollTo(0, document.body.scrollHeight * {(i+1)/5});")
-            time.sleep(2)
+            try:
+                WebDriverWait(driver, step_timeout).until(lambda d: find_review_elements(d))
+                return True
+            except TimeoutException:
+                continue
         return False
 
 def wait_for_reviews(driver, wait):
-    """Wait for reviews to load with multiple strategies"""
-    review_selectors = [
-        "[data-test-id='review-card']",
-        ".shop2-review-review",
-        ".reviews-list .review",
-        "[data-region='review']",
-        ".review-text",
-        "[data-test-id='reviews-section'] [data-test-id]"
-    ]
-    
+    """Wait for reviews to load, returns as soon as any of the review selectors matches"""
     print("Waiting for reviews to load...")
     
-    for selector in review_selectors:
-        try:
-            print(f"Trying selector: {selector}")
-            elements = wait.until(EC.presence_of_all_elements_located((By.CSS_SELECTOR, selector)))
-            if elements:
-                print(f"Found {len(elements)} elements with selector: {selector}")
-                return selector, elements
-        except TimeoutException:
-            continue
+    try:
+        selector, elements = wait.until(lambda d: find_review_elements(d))
+        print(f"Found {len(elements)} elements with selector: {selector}")
+        return selector, elements
+    except TimeoutException:
+        pass
     
     # If no specific selectors work, try a more general approach
     try:
@@ -89,7 +274,102 @@ def wait_for_reviews(driver, wait):
     
     raise TimeoutException("Could not find any review elements")
 
-def extract_reviews_with_multiple_methods(soup):
+# html.parser by default, the extraction is written against its trees. lxml repairs broken markup differently
+# (a <div> inside a <p>, unclosed <p>s, ...) so it can find other reviews/names on such pages.
+# HTML_PARSER=lxml builds the tree several times faster, for when the listings are clean enough for that not to matter
+HTML_PARSER = os.environ.get("HTML_PARSER", "html.parser")
+if HTML_PARSER == "lxml":
+    try:
+        import lxml  # noqa: F401
+    except ImportError:
+        print("HTML_PARSER=lxml but lxml isn't installed (pip install lxml), using html.parser.")
+        HTML_PARSER = "html.parser"
+
+def make_soup(html_content):
+    return BeautifulSoup(html_content, HTML_PARSER)
+
+REVIEW_KEYWORDS = ['love', 'perfect', 'beautiful', 'quality', 'recommend', 'bought', 'received', 'great', 'amazing', 'nice']
+REVIEW_CLASS_TERMS = ['review', 'comment', 'feedback']
+NAME_STOPWORDS = ['review', 'star', 'rating', 'the', 'and', 'this', 'item', 'product']
+GENERIC_KEYWORDS = ['love', 'great', 'perfect', 'beautiful', 'quality', 'recommend', 'nice', 'good', 'amazing']
+
+class PageIndex:
+    """Everything the fallback extraction methods look up, collected in one walk over the tree.
+
+    Replaces the repeated find_all / find(string=...) / find_all_next scans, which made the
+    fallbacks quadratic in page size.
+    """
+
+    def __init__(self, soup):
+        self.keyword_elements = []        # p/div whose own string reads like a review
+        self.review_class_elements = []   # p/div with a review-ish class
+        self.string_elements = []         # p/div that wrap a single string
+        self.strings = []                 # every string in document order ...
+        self.string_starts = []           # ... and where it starts in self.text
+        self.name_candidates = []         # span/p/div in document order, with their positions
+        self.name_positions = []
+        self.rating_candidates = []       # span/div in document order, with their positions
+        self.rating_positions = []
+        self._positions = {}
+
+        text_parts = []
+        offset = 0
+        for position, element in enumerate(soup.descendants):
+            if isinstance(element, NavigableString):
+                self.strings.append(element)
+                self.string_starts.append(offset)
+                text_parts.append(element)
+                offset += len(element) + 1
+                continue
+            if not isinstance(element, Tag):
+                continue
+
+            self._positions[id(element)] = position
+            name = element.name
+            if name in ('span', 'p', 'div'):
+                self.name_candidates.append(element)
+                self.name_positions.append(position)
+            if name in ('span', 'div'):
+                self.rating_candidates.append(element)
+                self.rating_positions.append(position)
+            if name in ('p', 'div'):
+                own_string = element.string
+                if own_string is not None:
+                    self.string_elements.append(element)
+                    if len(own_string) > 30 and any(word in own_string.lower() for word in REVIEW_KEYWORDS):
+                        self.keyword_elements.append(element)
+                classes = element.get('class')
+                if classes:
+                    class_text = ' '.join(classes).lower() if isinstance(classes, list) else str(classes).lower()
+                    if any(term in class_text for term in REVIEW_CLASS_TERMS):
+                        self.review_class_elements.append(element)
+
+        # one big string so "which text node contains X" is a single C-level find
+        self.text = "\0".join(text_parts)
+
+    def find_string_containing(self, snippet):
+        """First string in document order that contains snippet, like soup.find(string=lambda t: snippet in t)"""
+        if not snippet or "\0" in snippet:
+            return next((s for s in self.strings if s and snippet in s), None)
+        found_at = self.text.find(snippet)
+        if found_at == -1:
+            return None
+        return self.strings[bisect.bisect_right(self.string_starts, found_at) - 1]
+
+    def _following(self, element, candidates, positions, limit):
+        # elements after `element` starts in document order, same as element.find_all_next(..., limit=limit)
+        position = self._positions.get(id(element), -1)
+        start = bisect.bisect_right(positions, position)
+        return candidates[start:start + limit]
+
+    def names_after(self, element, limit=10):
+        return self._following(element, self.name_candidates, self.name_positions, limit)
+
+    def ratings_after(self, element, limit=10):
+        return self._following(element, self.rating_candidates, self.rating_positions, limit)
+
+# the fallback methods cap how many reviews they return (they're guesses), pass None to take them all
+def extract_reviews_with_multiple_methods(soup, method2_limit=15, method3_limit=10):
     """Try multiple methods to extract review data"""
     reviews_data = []
     
@@ -116,138 +396,137 @@ def extract_reviews_with_multiple_methods(soup):
                 print(f"Error extracting from container: {e}")
                 continue
     
+    if reviews_data:
+        return reviews_data
+
+    index = PageIndex(soup)
+
     # Method 2: Enhanced alternative selectors with better review detection
-    if not reviews_data:
-        print("Method 1 failed, trying enhanced review detection...")
-        
-        # Look for review-specific patterns in the HTML
-        # Check for star ratings first
-        star_elements = soup.find_all(['span', 'div'], class_=lambda x: x and ('star' in str(x).lower() or 'rating' in str(x).lower()))
-        
-        # Look for review text patterns
-        review_text_patterns = [
-            # Look for elements that might contain review text
-            soup.find_all(['p', 'div'], string=lambda text: text and len(text) > 30 and any(word in text.lower() for word in ['love', 'perfect', 'beautiful', 'quality', 'recommend', 'bought', 'received', 'great', 'amazing', 'nice'])),
-            # Look for elements with review-related classes
-            soup.find_all(['div', 'p'], class_=lambda x: x and any(term in str(x).lower() for term in ['review', 'comment', 'feedback'])),
-        ]
-        
-        potential_reviews = []
-        for pattern_group in review_text_patterns:
-            for element in pattern_group:
-                text = element.get_text(strip=True)
-                if 30 < len(text) < 1000:  # Reasonable review length
-                    potential_reviews.append(text)
-        
-        # Remove duplicates while preserving order
-        seen = set()
-        unique_reviews = []
-        for review in potential_reviews:
-            if review not in seen:
-                seen.add(review)
-                unique_reviews.append(review)
-        
-        print(f"Found {len(unique_reviews)} potential reviews from enhanced detection")
+    print("Method 1 failed, trying enhanced review detection...")
+    
+    potential_reviews = []
+    # elements whose text looks like a review first, then elements with review-related classes
+    for element in index.keyword_elements + index.review_class_elements:
+        text = element.get_text(strip=True)
+        if 30 < len(text) < 1000:  # Reasonable review length
+            potential_reviews.append(text)
+    
+    # Remove duplicates while preserving order
+    unique_reviews = list(dict.fromkeys(potential_reviews))
+    
+    print(f"Found {len(unique_reviews)} potential reviews from enhanced detection")
+    
+    # Try to find associated names and ratings for these reviews
+    for review_text in unique_reviews[:method2_limit]:  # Limit to 15 reviews by default
+        # Look for nearby elements that might contain names or ratings
+        name = "N/A"
+        rating = "N/A"
         
-        # Try to find associated names and ratings for these reviews
-        for i, review_text in enumerate(unique_reviews[:15]):  # Limit to 15 reviews
-            # Look for nearby elements that might contain names or ratings
-            name = "N/A"
-            rating = "N/A"
+        # Try to find the element containing this review text
+        review_element = index.find_string_containing(review_text[:50])
+        if review_element:
+            parent = review_element.parent
+            # Look for name patterns near this review
+            for sibling in index.names_after(parent):
+                sibling_text = sibling.get_text(strip=True)
+                # Check if this might be a name (short, capitalized)
+                if (5 < len(sibling_text) < 50 and 
+                    sibling_text[0].isupper() and 
+                    not any(word in sibling_text.lower() for word in NAME_STOPWORDS)):
+                    name = sibling_text
+                    break
             
-            # Try to find the element containing this review text
-            review_element = soup.find(string=lambda text: text and review_text[:50] in text)
-            if review_element:
-                parent = review_element.parent
-                # Look for name patterns near this review
-                for sibling in parent.find_all_next(['span', 'p', 'div'], limit=10):
-                    sibling_text = sibling.get_text(strip=True)
-                    # Check if this might be a name (short, capitalized)
-                    if (5 < len(sibling_text) < 50 and 
-                        sibling_text[0].isupper() and 
-                        not any(word in sibling_text.lower() for word in ['review', 'star', 'rating', 'the', 'and', 'this', 'item', 'product'])):
-                        name = sibling_text
-                        break
-                
-                # Look for star ratings near this review
-                for sibling in parent.find_all_next(['span', 'div'], limit=10):
-                    if sibling.get('aria-label') and 'star' in sibling.get('aria-label').lower():
-                        rating_text = sibling.get('aria-label')
-                        rating_match = re.search(r'(\d+)', rating_text)
-                        if rating_match:
-                            rating = rating_match.group(1)
-                        break
-            
-            reviews_data.append({
-                "Reviewer Name": name,
-                "Rating (out of 5)": rating,
-                "Review": review_text
-            })
+            # Look for star ratings near this review
+            for sibling in index.ratings_after(parent):
+                if sibling.get('aria-label') and 'star' in sibling.get('aria-label').lower():
+                    rating_text = sibling.get('aria-label')
+                    rating_match = re.search(r'(\d+)', rating_text)
+                    if rating_match:
+                        rating = rating_match.group(1)
+                    break
         
-        if reviews_data:
-            print(f"Successfully extracted {len(reviews_data)} reviews with enhanced method")
-            return reviews_data
+        reviews_data.append({
+            "Reviewer Name": name,
+            "Rating (out of 5)": rating,
+            "Review": review_text
+        })
+    
+    if reviews_data:
+        print(f"Successfully extracted {len(reviews_data)} reviews with enhanced method")
+        return reviews_data
     
     # Method 3: Generic text extraction if all else fails
-    if not reviews_data:
-        print("All specific methods failed, trying generic text extraction...")
-        all_text_elements = soup.find_all(['p', 'div'], string=True)
-        potential_reviews = []
-        
-        for elem in all_text_elements:
-            text = elem.get_text(strip=True)
-            # Look for text that might be reviews (longer than 20 chars, contains common review words)
-            if (len(text) > 20 and 
-                any(word in text.lower() for word in ['love', 'great', 'perfect', 'beautiful', 'quality', 'recommend', 'nice', 'good', 'amazing'])):
-                potential_reviews.append(text)
-        
-        for text in potential_reviews[:10]:  # Limit to first 10 potential reviews
-            reviews_data.append({
-                "Reviewer Name": "N/A",
-                "Rating (out of 5)": "N/A", 
-                "Review": text[:500] + "..." if len(text) > 500 else text
-            })
+    print("All specific methods failed, trying generic text extraction...")
+    potential_reviews = []
+    
+    for elem in index.string_elements:
+        text = elem.get_text(strip=True)
+        # Look for text that might be reviews (longer than 20 chars, contains common review words)
+        if (len(text) > 20 and 
+            any(word in text.lower() for word in GENERIC_KEYWORDS)):
+            potential_reviews.append(text)
+    
+    for text in potential_reviews[:method3_limit]:  # Limit to first 10 potential reviews by default
+        reviews_data.append({
+            "Reviewer Name": "N/A",
+            "Rating (out of 5)": "N/A", 
+            "Review": text[:500] + "..." if len(text) > 500 else text
+        })
     
     return reviews_data
 
-def scrape_url(url, output_folder):
+def load_listing_html(driver, url, timeout=20):
+    """Open the listing and return its HTML once the reviews are there (or the wait gives up)"""
+    print(f"Loading URL...")
+    driver.get(url)
+    wait = WebDriverWait(driver, timeout)
+    wait.until(lambda d: d.execute_script("return document.readyState") == "complete")
+    
+    scroll_to_reviews(driver)
+    
+    try:
+        wait_for_reviews(driver, wait)
+    except TimeoutException:
+        print("Could not find reviews with wait strategy, proceeding with page source analysis...")
+    
+    return driver.page_source
+
+def scrape_url(url, output_folder, pool=None):
     print(f"--- Starting Scraper for URL: {url} ---")
-    driver = setup_driver()
+    pool = pool or get_driver_pool()
     html_content = ""
+    start_time = time.perf_counter()
     
     try:
-        print(f"Loading URL...")
-        driver.get(url)
-        time.sleep(random.uniform(3, 5))
-        wait = WebDriverWait(driver, 20)
-        
-        scroll_to_reviews(driver)
-        time.sleep(5)
-        
-        try:
-            wait_for_reviews(driver, wait)
-        except TimeoutException:
-            print("Could not find reviews with wait strategy, proceeding with page source analysis...")
-        
-        html_content = driver.page_source
-        
+        with pool.driver() as driver:
+            try:
+                with metrics.span("browser_load"):
+                    html_content = load_listing_html(driver, url)
+            except Exception:
+                # Save HTML for debugging even on error
+                debug_path = os.path.join(output_folder, f"error_page_{datetime.datetime.now().strftime('%Y%m%d_%H%M%S')}.html")
+                try:
+                    with open(debug_path, "w", encoding="utf-8") as f:
+                        f.write(driver.page_source)
+                    print(f"Debug HTML saved to {debug_path}")
+                except Exception:
+                    pass
+                raise
     except Exception as e:
         print(f"An error occurred during Selenium scraping: {e}")
-        # Save HTML for debugging even on error
-        debug_path = os.path.join(output_folder, f"error_page_{datetime.datetime.now().strftime('%Y%m%d_%H%M%S')}.html")
-        with open(debug_path, "w", encoding="utf-8") as f:
-            f.write(driver.page_source)
-        print(f"Debug HTML saved to {debug_path}")
+        metrics.record_error("scrape")
         return None
-    finally:
-        driver.quit()
+
+    print(f"Page loaded in {time.perf_counter() - start_time:.2f}s")
     
     if not html_content:
         print("No HTML content was retrieved.")
         return None
 
-    soup = BeautifulSoup(html_content, "html.parser")
-    reviews_data = extract_reviews_with_multiple_methods(soup)
+    with metrics.span("html_extract"):
+        soup = make_soup(html_content)
+        reviews_data = extract_reviews_with_multiple_methods(soup)
+    metrics.count("reviews_scraped_total", len(reviews_data))
     
     if not reviews_data:
         print("❌ No reviews were extracted from the page.")
@@ -0,0 +1,327 @@
+# pip install vaderSentiment numpy
+
+import numpy as np
+from spacy.attrs import IDX, IS_ALPHA, IS_ASCII, IS_PUNCT, IS_SPACE, IS_UPPER, LENGTH, LOWER, SPACY
+from spacy.strings import get_string_id
+from vaderSentiment.vaderSentiment import BOOSTER_DICT, C_INCR, NEGATE, N_SCALAR, SPECIAL_CASES, SentiText
+
+SENTIMENT_BACKENDS = ("vectorized", "vader")
+
+# VADER's own constants for punctuation emphasis and normalization
+EP_AMPLIFIER = 0.292
+QM_AMPLIFIER = 0.18
+QM_MAX_AMPLIFIER = 0.96
+NORMALIZE_ALPHA = 15
+
+_COLUMNS = [LOWER, IS_UPPER, IS_PUNCT, IS_ASCII, IS_ALPHA, IS_SPACE, SPACY, LENGTH, IDX]
+(_LOWER, _IS_UPPER, _IS_PUNCT, _IS_ASCII, _IS_ALPHA, _IS_SPACE, _SPACY, _LENGTH, _IDX) = range(len(_COLUMNS))
+
+# words the heuristics look for by name
+_KEYWORDS = ("no", "or", "nor", "kind", "of", "never", "so", "this", "without", "doubt", "least", "at", "very", "but")
+
+class VaderSentiment:
+    """The reference: SentimentIntensityAnalyzer.polarity_scores on each sentence's text"""
+
+    def __init__(self, analyzer):
+        self.analyzer = analyzer
+
+    def score(self, spans, texts):
+        return [self.analyzer.polarity_scores(text)["compound"] for text in texts]
+
+class VectorizedSentiment:
+    """VADER compound scores for a whole batch of spaCy spans at once, from the tokens spaCy already made.
+
+    The lexicon, booster and negation lists are compiled once into a table keyed on spaCy's string
+    hashes, so a token's row comes from its LOWER attribute with one searchsorted over the batch.
+    VADER works on whitespace-separated words, which are rebuilt from the tokens' trailing-space flags.
+    A word that spaCy split into several pieces ("don't", "it's"), that has emoji or non-ASCII symbols
+    in it, or whose stripped form is two characters or less goes through VADER's own word handling
+    in Python. Everything else is plain array lookups. The negation, "no", booster, ALL CAPS,
+    "least", idiom and "but" rules then run as array operations over every word of the batch.
+
+    The scores are close to SentimentIntensityAnalyzer's, not the same, which is why it's opt-in
+    (SENTIMENT_BACKEND=vectorized). benchmarks/run.py --cases sentiment fails when more than 1% of
+    a corpus' sentences are off by over 0.05 compound, but text heavy in emoticons or "but" can be
+    off more often than that. The known differences are:
+      - "but" scaling is applied by position. VADER looks positions up by value, which goes wrong
+        when two words in a sentence have the same score ("wasn't as good as I hoped, but still
+        fine" is 0.1273 from VADER and 0.3176 here).
+      - tokens spaCy marks as punctuation are stripped from the edges of a word. VADER strips ASCII
+        punctuation characters, so e.g. "$" and "#" are treated differently.
+      - emoticons made of punctuation ("</3.", "(^;0") can be split into several tokens by spaCy,
+        so they're scored differently from VADER's whitespace-separated words.
+    """
+
+    # the array version costs about half a millisecond per call whatever the size, below this many
+    # sentences (single reviews from /work/single) scoring them one by one with VADER is faster
+    MIN_BATCH = 32
+
+    def __init__(self, analyzer):
+        self.analyzer = analyzer
+        words = set(analyzer.lexicon) | set(BOOSTER_DICT) | set(NEGATE) | set(_KEYWORDS) | {"n't"}
+        phrases = [phrase for phrase in SPECIAL_CASES if " " in phrase] + [phrase for phrase in BOOSTER_DICT if " " in phrase]
+        for phrase in phrases:
+            words.update(phrase.split(" "))
+        words = sorted(words)
+
+        # one row per known word, plus a last all-zero row for everything else
+        self.unknown = len(words)
+        self._row_of = {word: row for row, word in enumerate(words)}
+        self.valence = np.zeros(len(words) + 1)
+        self.in_lexicon = np.zeros(len(words) + 1, dtype=bool)
+        self.booster = np.zeros(len(words) + 1)
+        self.is_booster = np.zeros(len(words) + 1, dtype=bool)
+        self.negation = np.zeros(len(words) + 1, dtype=bool)
+        for row, word in enumerate(words):
+            if word in analyzer.lexicon:
+                self.valence[row] = analyzer.lexicon[word]
+                self.in_lexicon[row] = True
+            if word in BOOSTER_DICT:
+                self.booster[row] = BOOSTER_DICT[word]
+                self.is_booster[row] = True
+            self.negation[row] = word in NEGATE or "n't" in word
+        self.rows = {word: self._row_of[word] for word in _KEYWORDS}
+
+        hashes = np.array([get_string_id(word) for word in words], dtype=np.uint64)
+        order = np.argsort(hashes)
+        self._hashes = hashes[order]
+        self._hash_rows = order
+
+        # multi-word idioms and boosters as tuples of rows
+        self.special_cases = [(tuple(self._row_of[w] for w in phrase.split(" ")), value)
+                              for phrase, value in SPECIAL_CASES.items() if " " in phrase]
+        self.booster_phrases = [(tuple(self._row_of[w] for w in phrase.split(" ")), value)
+                                for phrase, value in BOOSTER_DICT.items() if " " in phrase]
+        self.emojis = analyzer.emojis
+
+    def _lookup(self, lower_hashes):
+        position = np.searchsorted(self._hashes, lower_hashes)
+        position = np.minimum(position, len(self._hashes) - 1)
+        found = self._hashes[position] == lower_hashes
+        return np.where(found, self._hash_rows[position], self.unknown)
+
+    def _vader_words(self, text):
+        """VADER's emoji replacement and punctuation stripping for one whitespace-separated chunk of text"""
+        if any(char in self.emojis for char in text):
+            replaced = ""
+            prev_space = True
+            for char in text:
+                if char in self.emojis:
+                    if not prev_space:
+                        replaced += " "
+                    replaced += self.emojis[char]
+                    prev_space = False
+                else:
+                    replaced += char
+                    prev_space = char == " "
+            text = replaced
+        return [SentiText._strip_punc_if_word(word) for word in text.split()]
+
+    def _words(self, spans, texts):
+        """Flat per-word arrays over all spans: table row, ALL CAPS flag, negation flag and span number"""
+        # every doc's token table once, spans index into the concatenation
+        doc_arrays = {}
+        doc_offsets = {}
+        total = 0
+        for span in spans:
+            doc = span.doc
+            if id(doc) not in doc_arrays:
+                doc_arrays[id(doc)] = doc.to_array(_COLUMNS).reshape(len(doc), len(_COLUMNS))
+                doc_offsets[id(doc)] = total
+                total += len(doc)
+        if not total:
+            return (np.zeros(0, dtype=np.int64), np.zeros(0, dtype=bool), np.zeros(0, dtype=bool), np.zeros(0, dtype=np.int64))
+        array = np.concatenate(list(doc_arrays.values()))
+
+        starts = np.array([doc_offsets[id(span.doc)] + span.start for span in spans], dtype=np.int64)
+        lengths = np.array([span.end - span.start for span in spans], dtype=np.int64)
+        span_of_token = np.repeat(np.arange(len(spans)), lengths)
+        first_in_span = np.repeat(np.cumsum(lengths) - lengths, lengths)
+        token = np.repeat(starts, lengths) + np.arange(int(lengths.sum())) - first_in_span
+        tokens = array[token]
+        # where each span's text starts in its doc, fallback words are cut out of texts with it
+        span_chars = array[np.minimum(starts, total - 1), _IDX].astype(np.int64)
+
+        # a word starts at the span start and after any whitespace, whitespace tokens themselves are dropped
+        space = tokens[:, _IS_SPACE] == 1
+        after_space = np.ones(len(tokens), dtype=bool)
+        after_space[1:] = (tokens[:-1, _SPACY] == 1) | space[:-1]
+        after_space[first_in_span == np.arange(len(tokens))] = True
+        keep = ~space
+        tokens, span_of_token, new_word = tokens[keep], span_of_token[keep], after_space[keep]
+        word_starts = np.flatnonzero(new_word)
+        word_span = span_of_token[word_starts]
+        if not len(word_starts):
+            return (np.zeros(0, dtype=np.int64), np.zeros(0, dtype=bool), np.zeros(0, dtype=bool), word_span)
+
+        strip = (tokens[:, _IS_PUNCT] == 1) & (tokens[:, _IS_ASCII] == 1)
+        odd = (tokens[:, _IS_ASCII] == 0) & (tokens[:, _IS_ALPHA] == 0)
+        token_count = np.diff(np.append(word_starts, len(tokens)))
+        core_count = np.add.reduceat((~strip).astype(np.int64), word_starts)
+        odd_count = np.add.reduceat(odd.astype(np.int64), word_starts)
+        # with exactly one core token this is its position
+        core = np.add.reduceat(np.where(strip, 0, np.arange(len(tokens))), word_starts)
+        core = np.where(core_count == 1, core, word_starts)
+        fast = (core_count == 1) & (odd_count == 0) & ((token_count == 1) | (tokens[core, _LENGTH] > 2))
+
+        # fallback words can come out as several VADER words (emoji descriptions)
+        fallback = {}
+        counts = np.ones(len(word_starts), dtype=np.int64)
+        ends = np.append(word_starts[1:], len(tokens)) - 1
+        for w in np.flatnonzero(~fast).tolist():
+            first, last, span = word_starts[w], ends[w], word_span[w]
+            start_char = int(tokens[first, _IDX]) - span_chars[span]
+            end_char = int(tokens[last, _IDX] + tokens[last, _LENGTH]) - span_chars[span]
+            fallback[w] = self._vader_words(texts[span][start_char:end_char])
+            counts[w] = len(fallback[w])
+
+        offsets = np.cumsum(counts) - counts
+        n_words = int(counts.sum())
+        rows = np.full(n_words, self.unknown, dtype=np.int64)
+        upper = np.zeros(n_words, dtype=bool)
+        negated = np.zeros(n_words, dtype=bool)
+        fast_words = np.flatnonzero(fast)
+        rows[offsets[fast_words]] = self._lookup(tokens[core[fast_words], _LOWER])
+        upper[offsets[fast_words]] = tokens[core[fast_words], _IS_UPPER] == 1
+        for w, words in fallback.items():
+            for j, word in enumerate(words):
+                lower = word.lower()
+                rows[offsets[w] + j] = self._row_of.get(lower, self.unknown)
+                upper[offsets[w] + j] = word.isupper()
+                negated[offsets[w] + j] = "n't" in lower
+        negated |= self.negation[rows]
+        return rows, upper, negated, np.repeat(word_span, counts)
+
+    def score(self, spans, texts):
+        """Compound score per span, texts are the spans' own texts (span.text)"""
+        spans = list(spans)
+        if not spans:
+            return []
+        if len(spans) < self.MIN_BATCH:
+            return [self.analyzer.polarity_scores(text)["compound"] for text in texts]
+        rows, upper, negated, span_of_word = self._words(spans, texts)
+        n_spans = len(spans)
+        n = len(rows)
+        unknown = self.unknown
+
+        word_counts = np.bincount(span_of_word, minlength=n_spans)
+        first_word = np.cumsum(word_counts) - word_counts
+        position = np.arange(n) - first_word[span_of_word]
+        span_length = word_counts[span_of_word]
+
+        def before(values, k, fill):
+            shifted = np.full(n, fill, dtype=values.dtype)
+            shifted[k:] = values[:n - k]
+            shifted[position < k] = fill
+            return shifted
+
+        def after(values, k, fill):
+            shifted = np.full(n, fill, dtype=values.dtype)
+            shifted[:n - k] = values[k:]
+            shifted[position >= span_length - k] = fill
+            return shifted
+
+        kw = self.rows
+        prev_rows = [before(rows, k, unknown) for k in (1, 2, 3)]
+        prev_upper = [before(upper, k, False) for k in (1, 2, 3)]
+        prev_negated = [before(negated, k, False) for k in (1, 2, 3)]
+        next_rows = [after(rows, k, unknown) for k in (1, 2)]
+        r1, r2, r3 = prev_rows
+        in_lexicon = self.in_lexicon[rows]
+
+        # some but not all words in ALL CAPS
+        upper_counts = np.bincount(span_of_word, weights=upper, minlength=n_spans)
+        cap_diff = ((word_counts - upper_counts > 0) & (word_counts - upper_counts < word_counts))[span_of_word]
+
+        valence = self.valence[rows].copy()
+        # "no" right before a lexicon word negates that word instead of scoring itself
+        valence[(rows == kw["no"]) & self.in_lexicon[next_rows[0]]] = 0.0
+        no_before = (r1 == kw["no"]) | (r2 == kw["no"]) | ((r3 == kw["no"]) & ((r1 == kw["or"]) | (r1 == kw["nor"])))
+        valence = np.where(no_before, self.valence[rows] * N_SCALAR, valence)
+        valence = np.where(upper & cap_diff, np.where(valence > 0, valence + C_INCR, valence - C_INCR), valence)
+
+        so_this = lambda r: (r == kw["so"]) | (r == kw["this"])
+        for k, damping in enumerate((1.0, 0.95, 0.9)):
+            prev, prev_up = prev_rows[k], prev_upper[k]
+            applies = (position > k) & ~self.in_lexicon[prev]
+            scalar = self.booster[prev] * np.where(valence < 0, -1.0, 1.0)
+            caps_boost = self.is_booster[prev] & prev_up & cap_diff
+            scalar = np.where(caps_boost, np.where(valence > 0, scalar + C_INCR, scalar - C_INCR), scalar)
+            valence = np.where(applies, valence + scalar * damping, valence)
+
+            if k == 0:
+                emphasis = np.zeros(n, dtype=bool)
+                neutral = np.zeros(n, dtype=bool)
+            elif k == 1:
+                emphasis = (r2 == kw["never"]) & so_this(r1)
+                neutral = (r2 == kw["without"]) & (r1 == kw["doubt"])
+            else:
+                emphasis = ((r3 == kw["never"]) & so_this(r2)) | so_this(r1)
+                neutral = (r3 == kw["without"]) & ((r2 == kw["doubt"]) | (r1 == kw["doubt"]))
+            valence = np.where(applies & emphasis, valence * 1.25, valence)
+            valence = np.where(applies & ~emphasis & ~neutral & prev_negated[k], valence * N_SCALAR, valence)
+            if k == 2:
+                valence = self._idioms(valence, applies, rows, prev_rows, next_rows)
+
+        is_least = ~self.in_lexicon[r1] & (r1 == kw["least"])
+        valence = np.where(is_least & (position > 1) & (r2 != kw["at"]) & (r2 != kw["very"]), valence * N_SCALAR, valence)
+        valence = np.where(is_least & (position == 1), valence * N_SCALAR, valence)
+
+        skip = self.is_booster[rows] | ((rows == kw["kind"]) & (next_rows[0] == kw["of"]))
+        valence = np.where(in_lexicon & ~skip, valence, 0.0)
+
+        # words before the first "but" count half, words after it one and a half
+        is_but = rows == kw["but"]
+        but_position = np.full(n_spans, np.iinfo(np.int64).max)
+        np.minimum.at(but_position, span_of_word[is_but], position[is_but])
+        has_but = but_position[span_of_word] != np.iinfo(np.int64).max
+        but_at = but_position[span_of_word]
+        valence = np.where(has_but & (position < but_at), valence * 0.5, np.where(has_but & (position > but_at), valence * 1.5, valence))
+
+        total = np.bincount(span_of_word, weights=valence, minlength=n_spans)
+        exclamations = np.minimum([text.count("!") for text in texts], 4) * EP_AMPLIFIER
+        questions = np.array([text.count("?") for text in texts])
+        questions = np.where(questions > 1, np.where(questions <= 3, questions * QM_AMPLIFIER, QM_MAX_AMPLIFIER), 0.0)
+        total = total + np.sign(total) * (exclamations + questions)
+        compound = np.clip(total / np.sqrt(total * total + NORMALIZE_ALPHA), -1.0, 1.0)
+        compound[word_counts == 0] = 0.0
+        return [round(score, 4) for score in compound.tolist()]
+
+    def _idioms(self, valence, applies, rows, prev_rows, next_rows):
+        r1, r2, r3 = prev_rows
+        # the first of these sequences that is a special case sets the valence outright
+        sequences = [(r1, rows), (r2, r1, rows), (r2, r1), (r3, r2, r1), (r3, r2)]
+        matched = np.zeros(len(rows), dtype=bool)
+        for sequence in sequences:
+            for phrase, value in self.special_cases:
+                if len(phrase) != len(sequence):
+                    continue
+                hit = applies & ~matched
+                for word_rows, row in zip(sequence, phrase):
+                    hit &= word_rows == row
+                valence = np.where(hit, value, valence)
+                matched |= hit
+        # the word itself starting a special case wins over all of that
+        for sequence in [(rows, next_rows[0]), (rows, next_rows[0], next_rows[1])]:
+            for phrase, value in self.special_cases:
+                if len(phrase) != len(sequence):
+                    continue
+                hit = applies.copy()
+                for word_rows, row in zip(sequence, phrase):
+                    hit &= word_rows == row
+                valence = np.where(hit, value, valence)
+        # "kind of", "sort of" right before the word
+        for sequence in [(r3, r2), (r2, r1)]:
+            for phrase, value in self.booster_phrases:
+                hit = applies.copy()
+                for word_rows, row in zip(sequence, phrase):
+                    hit &= word_rows == row
+                valence = np.where(hit, valence + value, valence)
+        return valence
+
+def make_backend(name, analyzer):
+    if name == "vader":
+        return VaderSentiment(analyzer)
+    if name == "vectorized":
+        return VectorizedSentiment(analyzer)
+    raise ValueError(f"Unknown sentiment backend '{name}', expected one of {SENTIMENT_BACKENDS}")
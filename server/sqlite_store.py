@@ -0,0 +1,29 @@
+import sqlite3
+from contextlib import contextmanager
+
+# sqlite has a limit on the number of ? in one statement
+MAX_PARAMS = 500
+
+@contextmanager
+def connect(db_path, wal=True, synchronous=None):
+    """A short-lived connection: committed when the block succeeds, rolled back when it raises, always closed.
+
+    wal=True switches the file to WAL so readers in other threads/processes don't block the writer.
+    """
+    conn = sqlite3.connect(db_path, timeout=30)
+    try:
+        if wal:
+            conn.execute("PRAGMA journal_mode=WAL")
+        if synchronous:
+            conn.execute(f"PRAGMA synchronous={synchronous}")
+        with conn:
+            yield conn
+    finally:
+        conn.close()
+
+def select_in(conn, query, values):
+    """Run query, which has one "{placeholders}" inside IN (...), over values MAX_PARAMS at a time. Yields each part's rows"""
+    values = list(values)
+    for start in range(0, len(values), MAX_PARAMS):
+        part = values[start:start + MAX_PARAMS]
+        yield conn.execute(query.format(placeholders=", ".join("?" * len(part))), part).fetchall()